@@ -0,0 +1,157 @@
+import os
+import time
+import asyncio
+from collections import deque
+from instrumentation import increment
+
+"""
+Admission module decides which discord messages get work done for them when the bot is under load.
+
+    - RateLimiter: token buckets per user and per channel. Starting a conversation (fetching and parsing a recipe)
+                   is limited per user and per channel; requests in an existing conversation are limited per user,
+                   much more generously
+    - ParseGate: a global cap on concurrent recipe parses, with a bounded FIFO queue of parses waiting for a slot;
+                 once the queue is full, new recipes are refused at once with a "busy" reply instead of piling up
+
+Requests in existing conversations (navigation, questions) never wait behind the ParseGate, and the parse cap
+keeps the parse threads from taking the whole CPU, so people already cooking keep fast answers during a burst
+of new links. Recipes served from the cache, or already being parsed for someone else, do not take a slot.
+"""
+
+MAX_CONCURRENT_PARSES = int(os.getenv("MAX_CONCURRENT_PARSES", "2"))
+PARSE_QUEUE_SIZE = int(os.getenv("PARSE_QUEUE_SIZE", "8"))
+
+# bucket kind -> (capacity, tokens refilled per second)
+LIMITS = {
+    "user_recipe": (3, 1 / 20), # a burst of 3 new recipes, then one every 20 seconds
+    "channel_recipe": (10, 1 / 3),
+    "user_message": (10, 2),
+}
+
+BUSY_MESSAGE = "I'm busy with a lot of recipes right now. Please try again shortly."
+RECIPE_RATE_MESSAGE = "You're sending recipes too quickly. Please wait a little and try again."
+MESSAGE_RATE_MESSAGE = "You're sending messages too quickly. Please slow down a little."
+
+class AdmissionError(Exception):
+    """
+    Raised when a message is refused; the message is safe to show to the user.
+    silent: the user was already told (repeated refusals are not answered, so spam does not get one reply each)
+    """
+    def __init__(self, message, silent=False):
+        super().__init__(message)
+        self.silent = silent
+
+class TokenBucket:
+    __slots__ = ("capacity", "rate", "tokens", "updated", "refused")
+
+    def __init__(self, capacity, rate, now):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+        self.refused = False # the last take() was refused
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.refused = False
+            return True
+        self.refused = True
+        return False
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+class RateLimiter:
+    def __init__(self, limits=LIMITS, clock=time.monotonic):
+        self.limits = limits
+        self.clock = clock
+        self.buckets = {} # (kind, key) -> TokenBucket
+
+    def _bucket(self, kind, key, now):
+        bucket = self.buckets.get((kind, key))
+        if bucket is None:
+            capacity, rate = self.limits[kind]
+            bucket = self.buckets[(kind, key)] = TokenBucket(capacity, rate, now)
+        return bucket
+
+    def check(self, kind, key, message):
+        """
+        Take a token from the (kind, key) bucket, or raise AdmissionError (silent if the previous take was refused too).
+        """
+        now = self.clock()
+        bucket = self._bucket(kind, key, now)
+        refused_before = bucket.refused
+        if not bucket.take(now):
+            increment("admission_total", decision="rate_limited", kind=kind)
+            raise AdmissionError(message, silent=refused_before)
+
+    def prune(self):
+        """
+        Forget buckets that have refilled completely (they would be recreated identical). Returns how many.
+        """
+        now = self.clock()
+        idle = [key for key, bucket in self.buckets.items() if bucket.full(now)]
+        for key in idle:
+            del self.buckets[key]
+        return len(idle)
+
+    def __len__(self):
+        return len(self.buckets)
+
+class ParseGate:
+    """
+    At most limit parses at once; up to queue_size more wait for a slot in arrival order, beyond that they are refused.
+    Must be used from one event loop (release() from other threads goes through loop.call_soon_threadsafe).
+    """
+    def __init__(self, limit=MAX_CONCURRENT_PARSES, queue_size=PARSE_QUEUE_SIZE):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self.waiters = deque() # futures of parses waiting for a slot, oldest first
+
+    def check(self):
+        """
+        Raise AdmissionError if a new parse would be refused right now.
+        """
+        if self.active >= self.limit and len(self.waiters) >= self.queue_size:
+            increment("admission_total", decision="busy", kind="parse")
+            raise AdmissionError(BUSY_MESSAGE)
+
+    async def acquire(self):
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            return
+        self.check()
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        increment("admission_total", decision="queued", kind="parse")
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release() # a slot was handed over just as the waiter went away: pass it on
+            else:
+                try:
+                    self.waiters.remove(future)
+                except ValueError:
+                    pass
+            raise
+
+    def release(self):
+        # hand the slot to the oldest waiter still waiting, or free it
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self):
+        return {"active": self.active, "waiting": len(self.waiters)}
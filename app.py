@@ -1,24 +1,82 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 import json
+import asyncio
 from dotenv import load_dotenv
 import os
 import re
+import logging
+from contextlib import asynccontextmanager
 from conversation import Conversation
-from parse import fetch_recipe, extract_json_ld, parse_recipe, recipe_to_json
+from ingest import RecipeIngestor, IngestionError
+from parse_service import RemoteIngestor
+from admission import RateLimiter, ParseGate, AdmissionError, RECIPE_RATE_MESSAGE, MESSAGE_RATE_MESSAGE
+from recipe_cache import RecipeCache, recipe_id_from_url
+from session_store import SessionStore
+from nlp_model import model_stats
+from responses import message_chunks
+from staged_recipe import RecipeParseError
+from search_index import SearchIndex, parse_query, format_results
+from instrumentation import setup_logging, start_metrics_server, span, increment, register_collector
+
+# load environment variables from .env file
+load_dotenv()
 
 # Initialize bot with intents
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
-bot = commands.Bot(command_prefix='!', intents=intents)
+# SHARD_COUNT runs this process as some of the gateway shards (SHARD_IDS, e.g. "0,1"; all of them if unset),
+# so several bot processes can split the guilds between them (see start_bot.sh)
+if os.getenv("SHARD_COUNT"):
+    shard_ids = [int(shard_id) for shard_id in os.getenv("SHARD_IDS", "").split(",") if shard_id.strip()]
+    bot = commands.AutoShardedBot(command_prefix='!', intents=intents, shard_count=int(os.getenv("SHARD_COUNT")), shard_ids=shard_ids or None)
+else:
+    bot = commands.Bot(command_prefix='!', intents=intents)
 
-# Store user IDs who have mentioned the bot
-conversations = {}
+# Parsed recipes by AllRecipes ID (memory LRU + SQLite on disk); with PARSE_SERVICE_SOCKET set, the parse service
+# owns the cache and this process only reads it to resume evicted sessions, so it keeps just a few in memory
+REMOTE = bool(os.getenv("PARSE_SERVICE_SOCKET"))
+recipe_cache = RecipeCache(max_entries=16) if REMOTE else RecipeCache()
 
-# load environment variables from .env file
-load_dotenv()
+# Conversations by user ID (bounded, idle sessions are evicted to disk and resumed on the next message)
+conversations = SessionStore(recipe_loader=recipe_cache.get)
+
+# Shared async fetcher + bounded parse pool; with PARSE_SERVICE_SOCKET set, recipes are fetched and parsed by
+# the parse service (parse_service.py) instead, which writes them to the same SQLite cache this process reads
+if REMOTE:
+    ingestor = RemoteIngestor(os.getenv("PARSE_SERVICE_SOCKET"))
+else:
+    ingestor = RecipeIngestor(cache=recipe_cache, gate=ParseGate())
+
+# Every known recipe by ingredient, tool, method and time, for "!search" (see search_index.py); built from the
+# cache in the background at startup, then kept up to date as recipes are parsed. With a parse service, its
+# index answers instead (see RemoteIngestor.search) and this process holds none
+search_index = None if REMOTE else SearchIndex()
+SEARCH_PREFIX = "!search"
+SEARCH_RESULTS = int(os.getenv("SEARCH_RESULTS", 10))
+
+# Token buckets per user and per channel (see admission.py); the parse cap lives in the ingestor's ParseGate
+rate_limiter = RateLimiter()
+
+# leveled, non-blocking logging (LOG_LEVEL=DEBUG shows how each request is routed)
+setup_logging(os.getenv("LOG_LEVEL", "INFO"))
+log = logging.getLogger("recipebot")
+
+# metrics read at scrape time (see instrumentation.py)
+register_collector("active_sessions", "Live conversations in the session store.", lambda: len(conversations))
+register_collector("recipe_cache_lookups_total", "Recipe cache lookups by result.",
+                   lambda: {(("result", result),): count for result, count in recipe_cache.stats.items()}, kind="counter")
+register_collector("ingest_requests_total", "Recipe ingestions started, or coalesced onto one in flight.",
+                   lambda: {(("outcome", outcome),): count for outcome, count in ingestor.stats.items()}, kind="counter")
+if search_index is not None:
+    register_collector("search_index_recipes", "Recipes in the search index.", lambda: len(search_index))
+if getattr(ingestor, "gate", None) is not None:
+    register_collector("parse_slots", "Recipe parses running, or waiting for a slot.",
+                       lambda: {(("state", state),): count for state, count in ingestor.gate.stats().items()})
+metrics_runner = None
+search_index_task = None
 
 def extract_url(message_content):
     """Extract and validate AllRecipes URL from message content"""
@@ -33,55 +91,179 @@ def extract_url(message_content):
             return url
     return None
 
+# user ID -> [asyncio.Lock, requests holding or waiting for it], while the user has a request in progress
+conversation_locks = {}
+
+@asynccontextmanager
+async def conversation_lock(user_id):
+    entry = conversation_locks.setdefault(user_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del conversation_locks[user_id]
+
+async def build_search_index():
+    loop = asyncio.get_running_loop()
+    try:
+        count = await loop.run_in_executor(None, search_index.add_all, recipe_cache.iter_recipes())
+        log.info("Search index built: %d recipes", count)
+    except Exception:
+        log.exception("Could not build the search index")
+
+async def handle_search(message):
+    try:
+        rate_limiter.check("user_message", message.author.id, MESSAGE_RATE_MESSAGE)
+    except AdmissionError as e:
+        if not e.silent:
+            await message.channel.send(str(e))
+        return
+    text = message.content[len(SEARCH_PREFIX):]
+    query = parse_query(text)
+    with span("search"):
+        if search_index is None:
+            try:
+                total, results = await ingestor.search(text, SEARCH_RESULTS)
+            except IngestionError as e:
+                await message.channel.send(str(e))
+                return
+        else:
+            total, results = search_index.search(query, limit=SEARCH_RESULTS)
+    log.debug("Search %r: %d matches", query.describe(), total)
+    with span("send"):
+        for chunk in message_chunks(format_results(query, total, results)):
+            await message.channel.send(chunk)
+
+@tasks.loop(minutes=5)
+async def evict_idle_sessions():
+    evicted = conversations.evict_idle()
+    rate_limiter.prune()
+    if evicted:
+        log.info("Evicted %d idle conversations: %s", evicted, conversations.stats(memory=True))
+
+@bot.event
+async def setup_hook():
+    # runs before the gateway connection: models and lexicons load in the background while the bot connects;
+    # until then new recipes get a "warming up" reply (see RecipeIngestor.start_warm_up)
+    ingestor.start_warm_up()
+    global search_index_task
+    if search_index is not None:
+        search_index_task = asyncio.create_task(build_search_index())
+
 @bot.event
 async def on_ready():
-    print(f'{bot.user} has connected to Discord!')
+    global metrics_runner
+    log.info("%s has connected to Discord!", bot.user)
+    if not evict_idle_sessions.is_running():
+        evict_idle_sessions.start()
+    if metrics_runner is None:
+        try:
+            metrics_runner = await start_metrics_server()
+        except OSError as e:
+            log.warning("Could not start the metrics endpoint: %s", e)
 
 @bot.event
 async def on_message(message):
+    await handle_message(message, bot.user)
+
+async def handle_message(message, me):
+    """
+    Respond to one message. me is the bot's own user; kept as a parameter (instead of bot.user)
+    so the same logic can be driven without a discord connection, e.g. by benchmarks/load_test.py.
+    """
     # Ignore messages from the bot itself
-    if message.author == bot.user:
+    if message.author == me:
         return
     
+    # Search every known recipe, in or out of a conversation
+    if message.content.lower().startswith(SEARCH_PREFIX):
+        increment("messages_total", kind="search")
+        await handle_search(message)
+        return
+
     # Continue an existing conversation
-    if str(message.author.id) in conversations:
-        conversation = conversations[str(message.author.id)]
+    conversation = await conversations.get(message.author.id)
+    if conversation is not None:
 
         # If the user says "stop", end the conversation
         if message.content.lower() == "stop":
-            del conversations[str(message.author.id)]
+            conversations.remove(message.author.id)
+            increment("messages_total", kind="stop")
             await message.channel.send("Conversation ended.")
             return
         
-        response = conversation.handle_request(message.content)
-        await message.channel.send(response)
+        increment("messages_total", kind="request")
+        try:
+            rate_limiter.check("user_message", message.author.id, MESSAGE_RATE_MESSAGE)
+        except AdmissionError as e:
+            if not e.silent:
+                await message.channel.send(str(e))
+            return
+        # one request per user at a time: a request waiting in a thread for the recipe's steps must not run
+        # alongside the user's next message on the same conversation (current step, history)
+        async with conversation_lock(message.author.id):
+            try:
+                with span("handle_request"):
+                    if conversation.recipe.ready:
+                        response = conversation.handle_request(message.content)
+                    else:
+                        # the recipe's steps are still being parsed (see ingest.py): a request touching them waits in a thread
+                        loop = asyncio.get_running_loop()
+                        response = await loop.run_in_executor(None, conversation.handle_request, message.content)
+            except RecipeParseError as e:
+                increment("errors_total", stage="parse")
+                await message.channel.send(str(e))
+                return
+            except Exception:
+                increment("errors_total", stage="handle_request")
+                log.exception("Error handling %r", message.content)
+                await message.channel.send("I'm sorry, I'm having trouble with that message. Please try again with a different message.")
+                return
+            # long answers (e.g. all steps of a big recipe) are sent as several messages under discord's length limit
+            with span("send"):
+                for chunk in message_chunks(response):
+                    await message.channel.send(chunk)
 
     # Check if bot is mentioned
-    elif bot.user.mentioned_in(message):
+    elif me.mentioned_in(message):
         # Start a new conversation
         url = extract_url(message.content)
         if not url:
             await message.channel.send("Please provide a valid AllRecipes URL.")
             return
         
-        # attempt to fetch and parse url
+        # attempt to fetch and parse url (off the event loop, see ingest.py)
+        increment("messages_total", kind="new_conversation")
         try:
-            soup = fetch_recipe(url)
-            json_data = extract_json_ld(soup)
-            if not json_data:
+            rate_limiter.check("user_recipe", message.author.id, RECIPE_RATE_MESSAGE)
+            rate_limiter.check("channel_recipe", message.channel.id, RECIPE_RATE_MESSAGE)
+            with span("ingest"):
+                jsn = await ingestor.ingest(url)
+            if not jsn:
                 await message.channel.send("Could not find a valid recipe in the provided URL.")
                 return
-            # parse recipe
-            recipe = parse_recipe(json_data)
-            # if json easier to work with, add line below and refer to jsn in convo
-            jsn = recipe_to_json(recipe)
-            conversation = Conversation(jsn) # Conversation() assumes recipe object in JSON format ATM
-            await message.channel.send(f"Alright. So let's start working with \"{recipe.title}\". \nWould you like to start with the ingredients list or the recipe steps?")
-            
+            if search_index is not None:
+                search_index.add_ingested(recipe_id_from_url(url), jsn)
+            conversation = Conversation(jsn, recipe_id_from_url(url)) # Conversation() assumes recipe object in JSON format ATM
+            conversations.put(message.author.id, conversation)
+            log.info("New conversation for %s: %.1f KB (shared model: %s, recipe cache: %s, sessions: %s)",
+                     message.author.id, conversation.size_kb(), model_stats(), recipe_cache.stats, conversations.stats())
+            with span("send"):
+                await message.channel.send(f"Alright. So let's start working with \"{jsn['title']}\". \nWould you like to start with the ingredients list or the recipe steps?")
+
+        except AdmissionError as e:
+            if not e.silent:
+                await message.channel.send(str(e))
+        except IngestionError as e:
+            await message.channel.send(str(e))
         except Exception as e:
+            increment("errors_total", stage="new_conversation")
             await message.channel.send("I'm sorry, I'm having trouble with that message. Please try again with a different message.")
-            print(f"An error occurred: {e}")
-
-        conversations[str(message.author.id)] = conversation   
+            log.exception("An error occurred: %s", e)
 
-bot.run(os.getenv('BOT_TOKEN'))
+if __name__ == "__main__":
+    # log_handler=None: discord.py logs through our (queued) root logger instead of installing its own handler
+    bot.run(os.getenv('BOT_TOKEN'), log_handler=None)
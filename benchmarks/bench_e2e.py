@@ -0,0 +1,249 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import resource
+import threading
+import tracemalloc
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+from parse import fetch_recipe, extract_json_ld, fetch_recipe_json_ld, parse_ingredients, parse_steps, parse_recipe, recipe_to_json
+from jsonld import extract_json_ld_from_html
+from conversation import Conversation
+from nlp_model import get_segmenter, SEGMENTATION_MODES, DEFAULT_SEGMENTATION
+
+"""
+End-to-end benchmark: every stage from fetching a recipe page to answering a scripted conversation, fully offline.
+
+Usage:
+    python benchmarks/bench_e2e.py [--mode fast] [--loader server|file] [--repeat N] [--save-baseline FILE] [--baseline FILE]
+
+The corpus is benchmarks/corpus/pages/<id>-<slug>.html (saved recipe pages) and
+benchmarks/corpus/transcripts/<id>-<slug>.txt (one user message per line for that recipe).
+Pages are served by a local fixture server at http://127.0.0.1:<port>/recipe/<id>/<slug>/ so fetch_recipe and
+fetch_recipe_json_ld run unchanged; with --loader file they are read from disk instead (no sockets at all).
+
+Each stage runs over the whole corpus; it is reported as best, median and p95 time over --repeat runs, and as the peak
+memory allocated while running it once under tracemalloc. The peak RSS of the whole run is reported at the end.
+
+--save-baseline writes the results to a JSON file; --baseline compares against one (default benchmarks/baseline.json,
+if it exists) and flags every metric that got worse by more than the tolerances below. Only the best time is compared:
+medians and p95s are reported but are too sensitive to other load on the machine to gate on.
+A non-zero exit status means at least one regression was flagged.
+"""
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PAGES = os.path.join(BENCH_DIR, "corpus", "pages")
+DEFAULT_TRANSCRIPTS = os.path.join(BENCH_DIR, "corpus", "transcripts")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+# a metric regresses if it grows by more than this fraction of the baseline AND by more than the absolute slack
+TOLERANCES = {
+    "min_ms": (0.25, 0.5),
+    "alloc_kb": (0.25, 32),
+    "peak_rss_mb": (0.10, 20),
+}
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    pages_dir = DEFAULT_PAGES
+
+    def do_GET(self):
+        # /recipe/<id>/<slug>/ -> <pages_dir>/<id>-<slug>.html
+        parts = [part for part in self.path.split("/") if part]
+        path = os.path.join(self.pages_dir, f"{parts[1]}-{parts[2]}.html") if len(parts) == 3 and parts[0] == "recipe" else None
+        if path is None or not os.path.exists(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_fixture_server(pages_dir):
+    FixtureHandler.pages_dir = pages_dir
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def load_corpus(pages_dir, transcripts_dir):
+    """
+    Return [(name, page path, transcript messages)] for every page that has a transcript.
+    """
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(pages_dir, "*.html"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        transcript = os.path.join(transcripts_dir, f"{name}.txt")
+        if not os.path.exists(transcript):
+            continue
+        with open(transcript, encoding="utf-8") as f:
+            messages = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        corpus.append((name, path, messages))
+    return corpus
+
+def page_url(port, name):
+    recipe_id, slug = name.split("-", 1)
+    return f"http://127.0.0.1:{port}/recipe/{recipe_id}/{slug}/"
+
+def read_page(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(max(int(round(q / 100 * len(ordered) + 0.5)) - 1, 0), len(ordered) - 1)]
+
+def measure(fn, repeat):
+    """
+    Time fn over repeat runs (after one warm-up run), then run it once more under tracemalloc.
+    """
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"min_ms": round(min(times), 3), "median_ms": round(percentile(times, 50), 3), "p95_ms": round(percentile(times, 95), 3), "alloc_kb": round((peak - baseline) / 1024, 1)}
+
+def quiet(fn):
+    # Conversation.handle_request prints routing details; keep them out of the report
+    def run():
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        try:
+            return fn()
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+    return run
+
+def run_benchmark(corpus, mode, loader, repeat):
+    server = start_fixture_server(os.path.dirname(corpus[0][1])) if loader == "server" else None
+    try:
+        if loader == "server":
+            port = server.server_address[1]
+            urls = [page_url(port, name) for name, _, _ in corpus]
+            fetch_soup = lambda: [fetch_recipe(url) for url in urls]
+            fetch_json_ld = lambda: [fetch_recipe_json_ld(url) for url in urls]
+        else:
+            paths = [path for _, path, _ in corpus]
+            fetch_soup = lambda: [BeautifulSoup(read_page(path), 'html.parser') for path in paths]
+            fetch_json_ld = lambda: [extract_json_ld_from_html(read_page(path)) for path in paths]
+
+        soups = fetch_soup()
+        json_list = [extract_json_ld(soup) for soup in soups]
+        names_list = [[ingredient.name for ingredient in parse_ingredients(json_data)[1]] for json_data in json_list]
+        recipes = [parse_recipe(json_data, mode) for json_data in json_list]
+        jsons = [recipe_to_json(recipe) for recipe in recipes]
+        transcripts = [messages for _, _, messages in corpus]
+
+        def converse():
+            for jsn, messages in zip(jsons, transcripts):
+                conversation = Conversation(jsn) # no recipe ID: nothing is shared between runs
+                for message in messages:
+                    conversation.handle_request(message)
+
+        stages = {
+            "fetch_recipe": fetch_soup,
+            "fetch_recipe_json_ld": fetch_json_ld,
+            "extract_json_ld": lambda: [extract_json_ld(soup) for soup in soups],
+            "parse_ingredients": lambda: [parse_ingredients(json_data) for json_data in json_list],
+            "parse_steps": lambda: [parse_steps(json_data, names, mode) for json_data, names in zip(json_list, names_list)],
+            "recipe_to_json": lambda: [recipe_to_json(recipe) for recipe in recipes],
+            "handle_request": quiet(converse),
+        }
+        results = {}
+        for stage, fn in stages.items():
+            results[stage] = measure(fn, repeat)
+            print(f"{stage:>22}: best {results[stage]['min_ms']:9.2f} ms, median {results[stage]['median_ms']:9.2f} ms, p95 {results[stage]['p95_ms']:9.2f} ms, "
+                  f"allocated {results[stage]['alloc_kb']:9.1f} KB")
+    finally:
+        if server is not None:
+            server.shutdown()
+    return results
+
+def compare(results, baseline):
+    """
+    Return a list of regression descriptions (empty if none).
+    """
+    regressions = []
+    checks = [(f"{stage}.{metric}", value, baseline.get("stages", {}).get(stage, {}).get(metric), metric)
+              for stage, metrics in results["stages"].items() for metric, value in metrics.items() if metric in TOLERANCES]
+    checks.append(("peak_rss_mb", results["peak_rss_mb"], baseline.get("peak_rss_mb"), "peak_rss_mb"))
+    for name, value, old, metric in checks:
+        if old is None:
+            continue
+        ratio, slack = TOLERANCES[metric]
+        if value > old * (1 + ratio) and value - old > slack:
+            regressions.append(f"{name}: {old} -> {value} (+{(value - old) / old * 100 if old else float('inf'):.0f}%)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of fetching, parsing and answering.")
+    parser.add_argument("--pages", default=DEFAULT_PAGES, help="directory of saved .html recipe pages")
+    parser.add_argument("--transcripts", default=DEFAULT_TRANSCRIPTS, help="directory of .txt conversation transcripts")
+    parser.add_argument("--mode", choices=SEGMENTATION_MODES, default=DEFAULT_SEGMENTATION, help="sentence segmentation mode")
+    parser.add_argument("--loader", choices=("server", "file"), default="server", help="serve pages over local HTTP or read them from disk")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="results to compare against")
+    parser.add_argument("--save-baseline", metavar="FILE", help="write the results to FILE")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.pages, args.transcripts)
+    if not corpus:
+        print(f"No pages with transcripts found in {args.pages} / {args.transcripts}")
+        return 1
+    try:
+        start = time.perf_counter()
+        get_segmenter(args.mode)
+        print(f"[{args.mode}] pipeline loaded in {time.perf_counter() - start:.2f}s; {len(corpus)} recipes, "
+              f"{sum(len(messages) for _, _, messages in corpus)} messages, loader: {args.loader}")
+    except OSError as e:
+        print(f"[{args.mode}] cannot load the pipeline: {e}")
+        return 1
+
+    results = {
+        "mode": args.mode,
+        "loader": args.loader,
+        "recipes": len(corpus),
+        "stages": run_benchmark(corpus, args.mode, args.loader, args.repeat),
+        # ru_maxrss is in KB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    print(f"peak RSS: {results['peak_rss_mb']} MB")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+    if args.baseline and os.path.exists(args.baseline) and args.baseline != args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if (baseline.get("mode"), baseline.get("loader"), baseline.get("recipes")) != (args.mode, args.loader, len(corpus)):
+            print(f"Baseline {args.baseline} was recorded with different settings; not comparing.")
+            return 0
+        regressions = compare(results, baseline)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        print(f"{len(regressions)} regressions against {args.baseline}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web
+from ingest import RecipeIngestor
+
+"""
+Check that recipe pages fetched one after another share one keep-alive connection.
+
+A local server serves a page whose recipe JSON-LD sits in the <head>, followed by --body-kb of markup, so the
+JSON-LD scan stops early (see ingest.py). Each run fetches it --fetches times through RecipeIngestor.fetch_json_ld
+and counts the TCP connections the server saw:
+    drained:  the default AsyncFetcher, which drains the rest of the body (up to FETCH_DRAIN_LIMIT) before release
+    dropped:  drain_limit=0, the body is left unread and aiohttp closes the connection
+
+Usage:
+    python benchmarks/bench_fetch_reuse.py [--fetches N] [--body-kb KB]
+"""
+
+RECIPE = {"@context": "https://schema.org", "@type": "Recipe", "name": "Toast", "recipeIngredient": ["1 slice bread"],
+          "recipeInstructions": [{"@type": "HowToStep", "text": "Toast the bread."}]}
+
+def make_page(body_kb):
+    head = f'<html><head><script type="application/ld+json">{json.dumps(RECIPE)}</script></head><body>'
+    return head + "<p>filler</p>" * (body_kb * 1024 // 13) + "</body></html>"
+
+async def run(fetches, body_kb, drain_limit):
+    page = make_page(body_kb)
+    connections = set()
+
+    async def handle(request):
+        connections.add(id(request.transport))
+        return web.Response(text=page, content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/recipe/1/toast/", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    ingestor = RecipeIngestor()
+    if drain_limit is not None:
+        ingestor.fetcher.drain_limit = drain_limit
+    try:
+        start = time.perf_counter()
+        for _ in range(fetches):
+            json_data, _, _ = await ingestor.fetch_json_ld(f"http://127.0.0.1:{port}/recipe/1/toast/")
+            assert json_data is not None
+        elapsed = time.perf_counter() - start
+    finally:
+        await ingestor.close()
+        await runner.cleanup()
+    return len(connections), elapsed, dict(ingestor.fetcher.stats)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark keep-alive connection reuse of recipe page fetches.")
+    parser.add_argument("--fetches", type=int, default=20)
+    parser.add_argument("--body-kb", type=int, default=300, help="markup after the JSON-LD, in KB")
+    args = parser.parse_args()
+
+    print(f"{'mode':10} {'connections':>12} {'ms/fetch':>9}  fetcher stats")
+    for mode, drain_limit in (("drained", None), ("dropped", 0)):
+        count, elapsed, stats = asyncio.run(run(args.fetches, args.body_kb, drain_limit))
+        print(f"{mode:10} {count:12d} {elapsed / args.fetches * 1000:9.2f}  {stats}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import os
+import re
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_router import classify, LAST_STEP
+
+"""
+Check that intent_router.classify routes a corpus of user utterances exactly like the original cascade
+(the request type, navigation, step number and demonstrative reference helpers QuestionHandler used to have, kept
+below as the reference, plus the keyword checks in Conversation.handle_request), and compare per-message latency.
+
+Usage:
+    python benchmarks/bench_intent_router.py [--utterances FILE] [--repeat N]
+"""
+
+DEFAULT_UTTERANCES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus", "utterances.txt")
+
+# recipe with enough steps that "last" resolves to a distinct number
+RECIPE = {"title": "Benchmark", "ingredients": [], "tools": [], "methods": [], "steps": [{}] * 12}
+
+def extract_step_number(request):
+    """
+    Extract the step number from an Nth step navigation request: a number, or the first/last keyword.
+    """
+    if 'first' in request.lower():
+        return 1
+    if 'last' in request.lower():
+        return len(RECIPE["steps"])
+    step_numbers = re.findall(r'\d+', request)
+    if step_numbers:
+        return int(step_numbers[0])
+    return None
+
+def detect_navigation_type(user_query):
+    """
+    Whether a navigation request asks for the next, previous, current (repeat) or Nth step.
+    """
+    nth_step_patterns = [
+        r"\b(?:go to|navigate to|move to|proceed to|take me to)\b.*\b((\d+)(?:st|nd|rd|th)?|first|last)\b.*\b(?:step|instruction)?\b.*",
+        r"\b(?:go to|navigate to|move to|proceed to|take me to)\b \b(?:step|instruction)\b \b(\d+)\b.*",
+        r"step \d+"
+    ]
+    for pattern in nth_step_patterns:
+        if re.search(pattern, user_query, re.IGNORECASE):
+            return "Nth"
+    if re.search(r".*\b(next|proceed|move|advance)\b.*", user_query, re.IGNORECASE):
+        return "Next"
+    elif re.search(r".*\b(previous|go back|return|back to|last|prior)\b.*", user_query, re.IGNORECASE):
+        return "Previous"
+    elif re.search(r".*\b(repeat|redo|again|once more|do over)\b.*", user_query, re.IGNORECASE):
+        return "Current"
+    else:
+        return "Unknown"
+
+def determine_request_type(request):
+    """
+    Whether a request is General, Navigation or Step-specific.
+    """
+    request_type_keywords = {
+        "General": ["how to", "how do", "what is", "steps"],
+        "Navigation": ["go", "proceed", "take me", "move", "navigate", "next", "previous", 'repeat', 'again'],
+        "Step": ["step", "long", "time"] # time requests typically ask about step-specific methods
+    }
+    for request_type in request_type_keywords:
+        if any(i.lower() in request.lower() for i in request_type_keywords[request_type]):
+            if request_type == "Step" and re.search(r"step \d+", request, re.IGNORECASE): # any request involving step & number should be navigation
+                return "Navigation"
+            return request_type
+    # if no request type match found, classify as general request
+    return "General"
+
+def extract_demonstrative_reference(text):
+    """
+    The (precursor, demonstrative, reference word) of a request like "how do I do that step", or Nones.
+    """
+    text = text.lower()
+    precursor_words = ["do", "make", "cook", "prepare", "get", "of", "replace"]
+    demonstratives = ["this", "that", "these", "those", "it"]
+    reference_words = ["step", "ingredient", "tool", "method"]
+    words = text.split()
+    for i in range(len(words)):
+        if words[i] in demonstratives:
+            # precursor before the demonstrative
+            if i > 0 and words[i-1] in precursor_words:
+                if i+1 < len(words) and words[i+1] in reference_words:
+                    return (words[i-1], words[i], words[i+1])
+                return (words[i-1], words[i], None)
+            # precursor after it
+            elif i+1 < len(words) and words[i+1] in precursor_words:
+                if i+2 < len(words) and words[i+2] in reference_words:
+                    return (words[i+1], words[i], words[i+2])
+                return (words[i+1], words[i], None)
+            else:
+                if i+1 < len(words) and words[i+1] in reference_words:
+                    return (None, words[i], words[i+1])
+                return (None, words[i], None)
+    return (None, None, None)
+
+def legacy_route(request):
+    """
+    The routing decisions of the original Conversation.handle_request, as a tuple.
+    """
+    ingredient_words = ['ingredients']
+    step_words = ['steps', 'instructions', 'make this', 'make it', 'cook this', 'cook it']
+    tools_words = ['tools', 'equipment']
+    method_words = ['methods']
+    time_words = ['time', 'long', 'duration']
+    all_words = ingredient_words + step_words + tools_words + method_words
+
+    request_type = determine_request_type(request)
+    if request_type == "Navigation":
+        navigation = detect_navigation_type(request)
+        step_number = extract_step_number(request) if navigation == "Nth" else None
+        return (request_type, None, navigation, step_number, None)
+    if request_type == "General":
+        if any(word in request for word in all_words):
+            for topic, words in (("ingredients", ingredient_words), ("steps", step_words), ("tools", tools_words), ("methods", method_words)):
+                if any(word in request for word in words):
+                    return (request_type, topic, None, None, None)
+        return (request_type, None, None, None, extract_demonstrative_reference(request))
+    for topic, words in (("methods", method_words), ("ingredients", ingredient_words), ("time", time_words), ("tools", tools_words)):
+        if any(word in request for word in words):
+            return (request_type, topic, None, None, None)
+    return (request_type, None, None, None, None)
+
+def router_route(request):
+    intent = classify(request)
+    step_number = len(RECIPE["steps"]) if intent.step_number == LAST_STEP else intent.step_number
+    return (intent.kind, intent.topic, intent.navigation, step_number, intent.reference)
+
+def load_utterances(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+def per_message_us(fn, utterances, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for utterance in utterances:
+            fn(utterance)
+    return (time.perf_counter() - start) / (repeat * len(utterances)) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and benchmark intent routing.")
+    parser.add_argument("--utterances", default=DEFAULT_UTTERANCES)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    utterances = load_utterances(args.utterances)
+    mismatches = 0
+    for utterance in utterances:
+        expected, actual = legacy_route(utterance), router_route(utterance)
+        if expected != actual:
+            mismatches += 1
+            print(f"MISMATCH {utterance!r}\n    legacy: {expected}\n    router: {actual}")
+    print(f"{len(utterances) - mismatches}/{len(utterances)} utterances routed identically")
+    legacy = per_message_us(legacy_route, utterances, args.repeat)
+    router = per_message_us(router_route, utterances, args.repeat)
+    print(f"per message: legacy {legacy:.1f} us, router {router:.1f} us ({legacy / router:.1f}x)")
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+import os
+import sys
+import glob
+import time
+import argparse
+import statistics
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+from parse import extract_json_ld
+from jsonld import extract_json_ld_from_html
+
+"""
+Compare JSON-LD extraction on saved recipe pages:
+    soup:   BeautifulSoup(html, 'html.parser') + extract_json_ld (what fetch_recipe does)
+    stream: jsonld.extract_json_ld_from_html, fed in 64 KB chunks like an HTTP response
+
+Usage:
+    python benchmarks/bench_json_ld.py [--pages DIR] [--repeat N]
+"""
+
+DEFAULT_PAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus", "pages")
+
+def soup_path(html):
+    return extract_json_ld(BeautifulSoup(html, 'html.parser'))
+
+def measure(fn, html, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(html)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    fn(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, statistics.median(timings), peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON-LD extraction paths.")
+    parser.add_argument("--pages", default=DEFAULT_PAGES, help="directory of saved .html recipe pages")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.pages, "*.html")))
+    if not paths:
+        print(f"No .html pages found in {args.pages}")
+        return
+
+    print(f"{'page':40} {'soup ms':>9} {'stream ms':>10} {'soup peak KB':>13} {'stream peak KB':>15} {'same':>5}")
+    totals = {"soup": 0.0, "stream": 0.0}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        soup_result, soup_time, soup_peak = measure(soup_path, html, args.repeat)
+        stream_result, stream_time, stream_peak = measure(extract_json_ld_from_html, html, args.repeat)
+        totals["soup"] += soup_time
+        totals["stream"] += stream_time
+        print(f"{os.path.basename(path)[:40]:40} {soup_time * 1000:9.2f} {stream_time * 1000:10.2f} {soup_peak / 1024:13.0f} {stream_peak / 1024:15.0f} {str(soup_result == stream_result):>5}")
+    print(f"\nTotal: soup {totals['soup'] * 1000:.1f} ms, stream {totals['stream'] * 1000:.1f} ms ({totals['soup'] / max(totals['stream'], 1e-9):.0f}x faster)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_index import SearchIndex, parse_query
+
+"""
+Benchmark the cross-recipe search index on a synthetic corpus of the size a full AllRecipes crawl reaches.
+
+Usage:
+    python benchmarks/bench_search.py [--recipes 100000] [--queries 2000] [--seed 0]
+
+Builds the index from generated recipe JSON (ingredient, tool and method names drawn with a skewed distribution,
+like real recipes: salt and an oven are everywhere, saffron and a tagine are not), then reports the build rate,
+per-query latency (median, p99, max) of multi-term queries with and without a time limit, and the cost of an
+incremental add into the full index. Each query is checked against a brute-force scan on the first --check queries.
+"""
+
+INGREDIENTS = ("salt pepper butter garlic onion olive-oil sugar flour egg milk chicken beef pork rice pasta tomato "
+               "cheese cream lemon parsley basil thyme carrot celery potato mushroom spinach bacon shrimp salmon "
+               "ginger soy-sauce honey cinnamon vanilla chocolate yogurt beans corn zucchini cilantro lime saffron").split()
+TOOLS = "oven skillet saucepan pot bowl whisk baking-dish sheet-pan blender grill slow-cooker wok tagine".split()
+METHODS = "bake fry saute boil simmer roast grill whisk stir chop blend braise steam marinate".split()
+TIMES = ("5 minutes", "10 minutes", "15 minutes", "20 minutes", "30 minutes", "45 minutes", "1 hour", "2 hours", None)
+QUERY_TEMPLATES = (
+    "{i1} and {i2}",
+    "{i1} with a {t1}",
+    "{i1} {i2} in under {m} minutes",
+    "tool: {t1}, method: {me1}",
+    "{me1} {i1} in under {m} minutes",
+    "{i1} {i2} {i3}",
+)
+
+def skewed(rng, names, count):
+    # earlier names are more common (roughly Zipf), as with real ingredients
+    return {names[min(int(rng.paretovariate(1.2)) - 1, len(names) - 1)] for _ in range(count)}
+
+def make_recipe(rng, number):
+    ingredients = skewed(rng, INGREDIENTS, rng.randint(4, 12))
+    steps = [{"time": {"duration": rng.choice(TIMES)}} for _ in range(rng.randint(2, 8))]
+    return {
+        "title": f"Recipe {number}",
+        "ingredients": [{"name": name.replace("-", " ")} for name in ingredients],
+        "tools": [name.replace("-", " ") for name in skewed(rng, TOOLS, rng.randint(1, 4))],
+        "methods": list(skewed(rng, METHODS, rng.randint(1, 5))),
+        "steps": steps,
+    }
+
+def make_query(rng):
+    i1, i2, i3 = rng.sample(INGREDIENTS, 3)
+    return rng.choice(QUERY_TEMPLATES).format(i1=i1, i2=i2, i3=i3, t1=rng.choice(TOOLS), me1=rng.choice(METHODS),
+                                              m=rng.choice((15, 30, 60, 120))).replace("-", " ")
+
+def brute_force(index, sets, query):
+    # matches of a query by testing every document (the reference the index must agree with);
+    # sets: the postings as sets, for membership tests
+    matches = 0
+    for doc, recipe_id in enumerate(index.recipe_ids):
+        if doc in index.deleted:
+            continue
+        minutes = index.minutes[doc]
+        if query.max_minutes is not None and not 0 <= minutes <= query.max_minutes:
+            continue
+        if query.min_minutes is not None and minutes < query.min_minutes:
+            continue
+        ok = True
+        for kind, tokens in query.terms:
+            kinds = (kind,) if kind else sets.keys()
+            if not all(any(doc in sets[k].get(token, ()) for k in kinds) for token in tokens):
+                ok = False
+                break
+        matches += ok
+    return matches
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cross-recipe search index.")
+    parser.add_argument("--recipes", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--check", type=int, default=20, help="queries verified against a brute-force scan")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    recipes = [(str(number), make_recipe(rng, number)) for number in range(args.recipes)]
+    index = SearchIndex()
+    started = time.perf_counter()
+    index.add_all(recipes)
+    build = time.perf_counter() - started
+    print(f"build: {len(index)} recipes in {build:.2f} s ({len(index) / build:,.0f} recipes/s)")
+
+    queries = [parse_query(make_query(rng)) for _ in range(args.queries)]
+    sets = {kind: {token: set(posting.view().tolist()) for token, posting in postings.items()} for kind, postings in index.postings.items()}
+    for query in queries[:args.check]:
+        total, _ = index.search(query)
+        expected = brute_force(index, sets, query)
+        if total != expected:
+            print(f"MISMATCH {query.describe()!r}: index {total}, scan {expected}")
+            return 1
+
+    for label, selected in (("all", queries), ("timed", [query for query in queries if query.max_minutes is not None]),
+                            ("untimed", [query for query in queries if query.max_minutes is None])):
+        latencies = []
+        for query in selected:
+            started = time.perf_counter()
+            index.search(query)
+            latencies.append((time.perf_counter() - started) * 1000)
+        if latencies:
+            print(f"{label:>8} queries: {len(latencies)}, median {percentile(latencies, 0.5):.3f} ms, "
+                  f"p99 {percentile(latencies, 0.99):.3f} ms, max {max(latencies):.3f} ms")
+
+    started = time.perf_counter()
+    for number in range(1000):
+        index.add(f"new-{number}", make_recipe(rng, number))
+    print(f"incremental add: {(time.perf_counter() - started) * 1000 / 1000:.3f} ms per recipe")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
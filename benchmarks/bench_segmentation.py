@@ -0,0 +1,97 @@
+import os
+import sys
+import glob
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jsonld import extract_json_ld_from_html
+from parse import parse_recipe, instruction_texts, segment_instructions
+from nlp_model import get_segmenter, SEGMENTATION_MODES
+
+"""
+Report parse times for both sentence segmentation modes and check that they produce the same Step splits.
+
+Usage:
+    python benchmarks/bench_segmentation.py [--pages DIR] [--repeat N]
+
+The first call in each mode loads its pipeline; that load is reported separately and excluded from the timings.
+A non-zero exit status means the fast mode split at least one recipe differently from the accurate mode.
+"""
+
+DEFAULT_PAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus", "pages")
+
+def load_corpus(pages_dir):
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(pages_dir, "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            json_data = extract_json_ld_from_html(f.read())
+        if json_data:
+            corpus.append((os.path.basename(path), json_data))
+    return corpus
+
+def parse_recipes(json_data_list, mode=None):
+    """
+    Parse many recipes at once, segmenting the instructions of all of them in one batched nlp.pipe call.
+    """
+    texts_per_recipe = [instruction_texts(json_data) for json_data in json_data_list]
+    segmented = segment_instructions([text for texts in texts_per_recipe for text in texts], mode)
+    recipes = []
+    offset = 0
+    for json_data, texts in zip(json_data_list, texts_per_recipe):
+        recipes.append(parse_recipe(json_data, mode, segmented[offset:offset + len(texts)]))
+        offset += len(texts)
+    return recipes
+
+def best_of(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sentence segmentation modes in parse_steps.")
+    parser.add_argument("--pages", default=DEFAULT_PAGES, help="directory of saved .html recipe pages")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.pages)
+    if not corpus:
+        print(f"No recipes found in {args.pages}")
+        return 1
+    json_list = [json_data for _, json_data in corpus]
+
+    splits = {}
+    for mode in SEGMENTATION_MODES:
+        try:
+            start = time.perf_counter()
+            get_segmenter(mode)
+            load_time = time.perf_counter() - start
+        except OSError as e:
+            print(f"[{mode}] skipped: {e}")
+            continue
+        per_recipe = best_of(lambda: [parse_recipe(json_data, mode) for json_data in json_list], args.repeat)
+        batched = best_of(lambda: parse_recipes(json_list, mode), args.repeat)
+        segment_only = best_of(lambda: segment_instructions([t for j in json_list for t in instruction_texts(j)], mode), args.repeat)
+        print(f"[{mode}] load {load_time:.2f}s | {len(json_list)} recipes: per-recipe {per_recipe * 1000:.1f} ms, "
+              f"batched {batched * 1000:.1f} ms ({batched * 1000 / len(json_list):.1f} ms/recipe), segmentation only {segment_only * 1000:.1f} ms")
+        splits[mode] = [[step.text for step in recipe.steps] for recipe in parse_recipes(json_list, mode)]
+
+    if len(splits) < 2:
+        return 0
+    mismatches = 0
+    for (name, _), accurate, fast in zip(corpus, splits["accurate"], splits["fast"]):
+        if accurate != fast:
+            mismatches += 1
+            print(f"\nSplit mismatch in {name}:")
+            for text in set(accurate) ^ set(fast):
+                print(f"    {'accurate' if text in accurate else 'fast'}: {text}")
+    print(f"\nStep splits identical for {len(corpus) - mismatches}/{len(corpus)} recipes")
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+"""
+Import-time budget: catches startup regressions of the bot, the parse service and the CLI.
+
+Usage:
+    python benchmarks/import_budget.py [--repeat 5] [--scale 1.0]
+
+Each entry point is imported in a fresh interpreter with -X importtime, --repeat times. Two checks:
+    - the best cumulative import time stays within the entry point's budget (--scale multiplies every budget,
+      e.g. --scale 2 on a slow CI machine)
+    - none of the heavy modules that are only needed for parsing got imported: they are loaded in the
+      background after startup (parse.warm_up) or on first use, and a new top-level import of one of them
+      is the usual way startup gets slow again
+A non-zero exit status means at least one check failed; the slowest modules are listed for each entry point.
+"""
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PARSING_MODULES = ("spacy", "bs4", "numpy", "rapidfuzz", "requests", "Levenshtein", "nltk", "pandas")
+
+# entry point -> (budget in ms, modules it must not import); discord and aiohttp are most of the bot's time
+BUDGETS = {
+    "app": (700, PARSING_MODULES),
+    "parse_service": (600, PARSING_MODULES),
+    "main": (150, PARSING_MODULES + ("discord", "aiohttp")),
+}
+
+def measure(module, env):
+    """
+    Import module in a fresh interpreter. Returns (cumulative ms, {module: self ms}, set of imported modules).
+    """
+    code = f"import sys, json; import {module}; print(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=REPO_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    total = None
+    self_times = {}
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue # the header line
+        name = fields[2].rstrip()
+        self_times[name.strip()] = self_us / 1000
+        if name == f" {module}":
+            total = cumulative_us / 1000
+    return total, self_times, set(json.loads(result.stdout.splitlines()[-1]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of the bot's entry points against a budget.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every budget by this factor")
+    parser.add_argument("--top", type=int, default=5, help="number of slowest modules to list")
+    args = parser.parse_args()
+
+    # importing app opens the recipe cache and the session directory: keep them out of the working tree
+    workdir = tempfile.mkdtemp(prefix="recipebot-import-")
+    env = dict(os.environ, RECIPE_CACHE_PATH=os.path.join(workdir, "recipe_cache.sqlite3"),
+               SESSION_STATE_DIR=os.path.join(workdir, "sessions"), PYTHONDONTWRITEBYTECODE="1")
+    failures = []
+    for module, (budget_ms, forbidden) in BUDGETS.items():
+        runs = [measure(module, env) for _ in range(args.repeat)]
+        best, self_times, imported = min(runs, key=lambda run: run[0])
+        budget_ms *= args.scale
+        status = "ok" if best <= budget_ms else "OVER BUDGET"
+        print(f"{module:>14}: {best:7.1f} ms (budget {budget_ms:.0f} ms) {status}")
+        slowest = sorted(self_times.items(), key=lambda item: item[1], reverse=True)[:args.top]
+        print(" " * 16 + "slowest: " + ", ".join(f"{name} {ms:.1f} ms" for name, ms in slowest))
+        if best > budget_ms:
+            failures.append(f"{module} imports in {best:.1f} ms, budget {budget_ms:.0f} ms")
+        for heavy in forbidden:
+            if heavy in imported:
+                failures.append(f"{module} imports {heavy} at startup")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# the app and the corpus helpers of bench_e2e are imported in main(), once the environment they read is set up
+
+"""
+Load test: many virtual Discord users talking to app.handle_message at once, without a discord connection.
+
+Usage:
+    python benchmarks/load_test.py [--users 1000] [--messages 15] [--think-mean 2] [--ramp-up 10] [--mode fast]
+
+Each virtual user mentions the bot with the URL of a recipe from the benchmark corpus (benchmarks/corpus/pages),
+then sends the messages of that recipe's transcript (benchmarks/corpus/transcripts) in order, waiting a random
+think time (exponential, --think-mean seconds on average) between messages, and finally says "stop".
+Messages are synthetic objects with just what handle_message uses (author, content, channel, mentions);
+pages are served from the corpus after --fetch-latency seconds instead of being downloaded.
+
+Reported: throughput, per-message latency percentiles (new conversations and requests separately),
+event-loop lag (how late a 10 ms timer fires), and memory growth per live session.
+The recipe cache and saved sessions go to a temporary directory.
+"""
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PAGES = os.path.join(BENCH_DIR, "corpus", "pages")
+DEFAULT_TRANSCRIPTS = os.path.join(BENCH_DIR, "corpus", "transcripts")
+LAG_INTERVAL = 0.01 # seconds
+
+class FakeUser:
+    def __init__(self, user_id, name):
+        self.id = user_id
+        self.name = name
+
+    def mentioned_in(self, message):
+        return self in message.mentions
+
+    def __str__(self):
+        return self.name
+
+class FakeChannel:
+    def __init__(self, channel_id, stats, send_latency):
+        self.id = channel_id
+        self.stats = stats
+        self.send_latency = send_latency
+
+    async def send(self, content):
+        self.stats["sent"] += 1
+        if not content or len(content) > 2000: # discord would reject this message
+            self.stats["rejected"] += 1
+        if self.send_latency:
+            await asyncio.sleep(self.send_latency)
+
+class FakeMessage:
+    def __init__(self, author, content, channel, mentions=()):
+        self.author = author
+        self.content = content
+        self.channel = channel
+        self.mentions = list(mentions)
+
+class LoadTest:
+    def __init__(self, app, corpus, args):
+        self.app = app
+        self.corpus = corpus
+        self.args = args
+        self.me = FakeUser(0, "RecipeBot")
+        self.latencies = {"new_conversation": [], "request": [], "stop": []}
+        self.send_stats = {"sent": 0, "rejected": 0}
+        self.errors = 0
+        self.lags = []
+        self.rss_samples = [] # (live sessions, RSS MB)
+        self.running = True
+
+    async def send(self, kind, message):
+        start = time.perf_counter()
+        try:
+            await self.app.handle_message(message, self.me)
+        except Exception as e:
+            self.errors += 1
+            print(f"error in {kind} {message.content!r}: {e}", file=sys.stderr)
+        self.latencies[kind].append(time.perf_counter() - start)
+
+    async def virtual_user(self, user_id):
+        args = self.args
+        await asyncio.sleep(random.uniform(0, args.ramp_up))
+        name, _, transcript = random.choice(self.corpus)
+        recipe_id, slug = name.split("-", 1)
+        user = FakeUser(user_id, f"cook{user_id}")
+        channel = FakeChannel(user_id, self.send_stats, args.send_latency)
+        url = f"https://www.allrecipes.com/recipe/{recipe_id}/{slug}/"
+        await self.send("new_conversation", FakeMessage(user, f"<@0> Help me make this: {url}", channel, [self.me]))
+        for i in range(args.messages):
+            await asyncio.sleep(random.expovariate(1 / args.think_mean) if args.think_mean else 0)
+            await self.send("request", FakeMessage(user, transcript[i % len(transcript)], channel))
+        await self.send("stop", FakeMessage(user, "stop", channel))
+
+    async def monitor(self, current_rss_mb):
+        # event-loop lag: how much later than scheduled a short timer fires; RSS sampled alongside
+        loop = asyncio.get_running_loop()
+        ticks = 0
+        while self.running:
+            expected = loop.time() + LAG_INTERVAL
+            await asyncio.sleep(LAG_INTERVAL)
+            self.lags.append(max(loop.time() - expected, 0))
+            ticks += 1
+            if ticks % 50 == 0:
+                self.rss_samples.append((len(self.app.conversations), current_rss_mb()))
+
+    async def fixture_fetch(self, url, validators=None):
+        # stands in for RecipeIngestor.fetch_json_ld: (json_data, None, validators) after a simulated download time
+        await asyncio.sleep(self.args.fetch_latency)
+        recipe_id = self.app.recipe_id_from_url(url)
+        return self.json_ld[recipe_id], None, {}
+
+    async def run(self, current_rss_mb):
+        from jsonld import extract_json_ld_from_html
+        self.json_ld = {}
+        for name, path, _ in self.corpus:
+            with open(path, encoding="utf-8") as f:
+                self.json_ld[name.split("-", 1)[0]] = extract_json_ld_from_html(f.read())
+        self.app.ingestor.fetch_json_ld = self.fixture_fetch
+        monitor = asyncio.create_task(self.monitor(current_rss_mb))
+        start = time.perf_counter()
+        await asyncio.gather(*(self.virtual_user(user_id) for user_id in range(1, self.args.users + 1)))
+        elapsed = time.perf_counter() - start
+        self.running = False
+        await monitor
+        await self.app.ingestor.close()
+        return elapsed
+
+    def report(self, elapsed, rss_before):
+        from bench_e2e import percentile
+        total = sum(len(values) for values in self.latencies.values())
+        lines = [f"{self.args.users} users, {total} messages in {elapsed:.1f}s: {total / elapsed:.1f} messages/sec, "
+                 f"{self.errors} errors, {self.send_stats['sent']} replies sent ({self.send_stats['rejected']} over discord's limits)"]
+        for kind, values in self.latencies.items():
+            if values:
+                lines.append(f"{kind:>17}: p50 {percentile(values, 50) * 1000:8.2f} ms, p95 {percentile(values, 95) * 1000:8.2f} ms, "
+                             f"p99 {percentile(values, 99) * 1000:8.2f} ms, max {max(values) * 1000:8.2f} ms")
+        if self.lags:
+            lines.append(f"   event-loop lag: p50 {percentile(self.lags, 50) * 1000:8.2f} ms, p99 {percentile(self.lags, 99) * 1000:8.2f} ms, "
+                         f"max {max(self.lags) * 1000:8.2f} ms")
+        if self.rss_samples:
+            peak_sessions, rss_at_peak = max(self.rss_samples)
+            peak_rss = max(rss for _, rss in self.rss_samples)
+            per_session = (rss_at_peak - rss_before) * 1024 / peak_sessions if peak_sessions else 0
+            lines.append(f"           memory: RSS {rss_before:.1f} MB before, {peak_rss:.1f} MB peak; {peak_sessions} live sessions at most, "
+                         f"~{per_session:.1f} KB RSS per live session")
+        return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate many concurrent discord users against app.handle_message.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=15, help="messages per user after starting a conversation")
+    parser.add_argument("--think-mean", type=float, default=2.0, help="mean think time between a user's messages, in seconds")
+    parser.add_argument("--ramp-up", type=float, default=10.0, help="users start at random times within this many seconds")
+    parser.add_argument("--fetch-latency", type=float, default=0.3, help="simulated page download time, in seconds")
+    parser.add_argument("--send-latency", type=float, default=0.05, help="simulated discord send time, in seconds")
+    parser.add_argument("--mode", choices=("accurate", "fast"), default=os.getenv("RECIPEBOT_SEGMENTATION", "accurate"))
+    parser.add_argument("--pages", default=DEFAULT_PAGES)
+    parser.add_argument("--transcripts", default=DEFAULT_TRANSCRIPTS)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    # configure the app before importing it: temporary storage, quiet logs, chosen segmentation mode
+    workdir = tempfile.mkdtemp(prefix="recipebot-load-")
+    os.environ["RECIPE_CACHE_PATH"] = os.path.join(workdir, "recipe_cache.sqlite3")
+    os.environ["SESSION_STATE_DIR"] = os.path.join(workdir, "sessions")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["RECIPEBOT_SEGMENTATION"] = args.mode
+    from bench_e2e import load_corpus
+    import app
+
+    corpus = load_corpus(args.pages, args.transcripts)
+    if not corpus:
+        print(f"No pages with transcripts found in {args.pages} / {args.transcripts}")
+        return 1
+    from nlp_model import get_segmenter, current_rss_mb
+    app.conversations.max_sessions = max(app.conversations.max_sessions, args.users)
+    try:
+        get_segmenter(args.mode) # model load is not part of the test
+    except OSError as e:
+        print(f"[{args.mode}] cannot load the pipeline: {e}")
+        return 1
+
+    rss_before = current_rss_mb()
+    test = LoadTest(app, corpus, args)
+    elapsed = asyncio.run(test.run(current_rss_mb))
+    print(test.report(elapsed, rss_before))
+    print(f"(recipe cache and sessions in {workdir})")
+    return 1 if test.errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from ingest import RecipeIngestor, IngestionError
+from jsonld import extract_json_ld_from_html
+from parse import parse_recipe, recipe_to_json
+from recipe_cache import RecipeCache, recipe_id_from_url
+from nlp_model import get_segmenter, SEGMENTATION_MODES, DEFAULT_SEGMENTATION
+
+"""
+Bulk ingestion CLI: fetch and parse a long list of recipes ahead of time (e.g. to pre-warm the recipe cache before peak hours).
+
+Usage:
+    python bulk_ingest.py [INPUT] -o recipes.jsonl [--cache recipe_cache.sqlite3] [--concurrency 16] [--workers N]
+
+INPUT holds one AllRecipes URL or saved .html page per line (blank lines and # comments are skipped);
+without INPUT (or with "-") the list is read from stdin.
+
+    - fetch: pages are downloaded over one pooled aiohttp session (see ingest.py), at most --concurrency at a time;
+             saved pages are read from disk instead
+    - parse: parse_recipe + recipe_to_json run in a process pool; each worker loads the spaCy pipeline once, at start
+    - output: one JSON line per recipe, {"source", "recipe_id", "recipe"}, written as soon as it is parsed;
+              failures go to the errors file as {"source", "stage", "error"} and do not stop the run
+
+The output and errors files double as the checkpoint: running the same command again skips every source
+already recorded in them, so an interrupted run resumes where it stopped (--retry-errors retries the failures).
+A summary with throughput (recipes/sec) and p50/p95 latency per stage is printed at the end.
+"""
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_WORKERS = max((os.cpu_count() or 2) - 1, 1)
+PROGRESS_EVERY = 100
+
+def init_worker(mode):
+    # load the spaCy pipeline once per worker process, before the first recipe arrives
+    get_segmenter(mode)
+
+def parse_item(json_data, html, mode):
+    """
+    Worker: recipe JSON-LD (or a page to search for it) -> (recipe JSON or None, recipe ID from the JSON-LD, parse seconds).
+    """
+    start = time.perf_counter()
+    if json_data is None and html:
+        json_data = extract_json_ld_from_html(html)
+    if not json_data:
+        return None, None, time.perf_counter() - start
+    url = json_data.get("url")
+    recipe_id = recipe_id_from_url(url) if isinstance(url, str) else None
+    jsn = recipe_to_json(parse_recipe(json_data, mode))
+    return jsn, recipe_id, time.perf_counter() - start
+
+def read_sources(lines):
+    """
+    Return the URLs / paths listed in lines, in order and without duplicates.
+    """
+    sources = []
+    seen = set()
+    for line in lines:
+        source = line.strip()
+        if source and not source.startswith("#") and source not in seen:
+            seen.add(source)
+            sources.append(source)
+    return sources
+
+def is_url(source):
+    return source.startswith(("http://", "https://"))
+
+def recorded_sources(path):
+    """
+    Return the sources already recorded in a JSON Lines output/errors file (the checkpoint).
+    A truncated last line (from an interrupted run) is ignored.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["source"])
+            except (ValueError, KeyError, TypeError):
+                continue
+    return done
+
+def open_for_append(path):
+    """
+    Open a JSON Lines file for appending, first terminating a truncated last line so new records start on their own line.
+    """
+    needs_newline = False
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b"\n"
+    f = open(path, "a", encoding="utf-8")
+    if needs_newline:
+        f.write("\n")
+    return f
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile of a list of numbers (q in 0-100), or None for an empty list.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(int(round(q / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+class BulkIngestor:
+    def __init__(self, output, errors, cache=None, concurrency=DEFAULT_CONCURRENCY, workers=DEFAULT_WORKERS, mode=None):
+        self.output = output
+        self.errors = errors
+        self.cache = cache
+        self.concurrency = concurrency
+        self.mode = mode or DEFAULT_SEGMENTATION
+        # spawn, not fork: the parent already runs an event loop and helper threads when workers start
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=init_worker, initargs=(self.mode,))
+        self.fetcher = RecipeIngestor() # only its streaming fetch is used (per-host limits in fetcher.py); its parse pool is never started
+        self.timings = {"fetch": [], "parse": [], "total": []}
+        self.counts = {"parsed": 0, "no_recipe": 0, "failed": 0}
+
+    def write(self, f, record):
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+
+    def fail(self, source, stage, error):
+        self.counts["failed"] += 1
+        self.write(self.errors, {"source": source, "stage": stage, "error": error})
+
+    async def load(self, source):
+        """
+        Fetch stage: returns (json_data, html, validators) like RecipeIngestor.fetch_json_ld.
+        Saved pages are returned as html; the worker scans them for the JSON-LD.
+        """
+        if is_url(source):
+            return await self.fetcher.fetch_json_ld(source)
+        html = await asyncio.to_thread(self._read_page, source)
+        return None, html, None
+
+    def _read_page(self, path):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            return f.read()
+
+    async def ingest_one(self, source):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            json_data, html, validators = await self.load(source)
+        except IngestionError as e:
+            self.fail(source, "fetch", str(e))
+            return
+        except Exception as e:
+            # anything else (a bad URL, a decoding error, ...) fails this source only, not the whole run
+            self.fail(source, "fetch", f"{type(e).__name__}: {e}")
+            return
+        fetched = time.perf_counter()
+        self.timings["fetch"].append(fetched - start)
+        try:
+            jsn, page_recipe_id, parse_seconds = await loop.run_in_executor(self.pool, parse_item, json_data, html, self.mode)
+        except Exception as e:
+            self.fail(source, "parse", f"{type(e).__name__}: {e}")
+            return
+        self.timings["parse"].append(parse_seconds)
+        self.timings["total"].append(time.perf_counter() - start)
+        if not jsn:
+            self.counts["no_recipe"] += 1
+            self.write(self.errors, {"source": source, "stage": "parse", "error": "no recipe found"})
+            return
+        recipe_id = (recipe_id_from_url(source) if is_url(source) else None) or page_recipe_id
+        self.counts["parsed"] += 1
+        self.write(self.output, {"source": source, "recipe_id": recipe_id, "recipe": jsn})
+        if self.cache is not None and recipe_id:
+            # SQLite commits block: keep them off the event loop, which is fetching the other sources
+            await asyncio.to_thread(self.cache.put, recipe_id, jsn, validators)
+
+    async def run(self, sources):
+        remaining = iter(sources)
+        total = len(sources)
+
+        async def worker():
+            # each worker takes the next source when it is done with its current one,
+            # so at most `concurrency` recipes are being fetched or parsed at any time
+            for source in remaining:
+                await self.ingest_one(source)
+                done = sum(self.counts.values())
+                if done % PROGRESS_EVERY == 0:
+                    print(f"{done}/{total} done ({self.counts})", file=sys.stderr)
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, total) or 1)))
+        finally:
+            await self.fetcher.close()
+            self.pool.shutdown()
+
+    def summary(self, elapsed):
+        lines = [
+            f"{self.counts['parsed']} recipes parsed, {self.counts['no_recipe']} pages without a recipe, {self.counts['failed']} failed in {elapsed:.1f}s",
+            f"throughput: {self.counts['parsed'] / elapsed if elapsed else 0:.2f} recipes/sec",
+        ]
+        for stage, values in self.timings.items():
+            if values:
+                lines.append(f"{stage:>6}: p50 {percentile(values, 50) * 1000:.1f} ms, p95 {percentile(values, 95) * 1000:.1f} ms (n={len(values)})")
+        return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch and parse many recipes into JSON Lines (and optionally the recipe cache).")
+    parser.add_argument("input", nargs="?", default="-", help="file with one URL or .html path per line (default: stdin)")
+    parser.add_argument("-o", "--output", required=True, help="JSON Lines output file (appended to, and used to resume)")
+    parser.add_argument("--errors", help="JSON Lines file for failures (default: OUTPUT.errors.jsonl)")
+    parser.add_argument("--cache", help="also store parsed recipes in this recipe cache (SQLite) file")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="recipes fetched/parsed at once")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="parse worker processes")
+    parser.add_argument("--mode", choices=SEGMENTATION_MODES, default=DEFAULT_SEGMENTATION, help="sentence segmentation mode")
+    parser.add_argument("--retry-errors", action="store_true", help="retry sources recorded in the errors file")
+    args = parser.parse_args()
+    errors_path = args.errors or f"{os.path.splitext(args.output)[0]}.errors.jsonl"
+
+    if args.input == "-":
+        sources = read_sources(sys.stdin)
+    else:
+        with open(args.input, encoding="utf-8") as f:
+            sources = read_sources(f)
+    done = recorded_sources(args.output)
+    if not args.retry_errors:
+        done |= recorded_sources(errors_path)
+    todo = [source for source in sources if source not in done]
+    print(f"{len(sources)} sources, {len(sources) - len(todo)} already done, {len(todo)} to ingest", file=sys.stderr)
+    if not todo:
+        return 0
+
+    cache = RecipeCache(args.cache, max_entries=0) if args.cache else None
+    output = open_for_append(args.output)
+    errors = open_for_append(errors_path)
+    bulk = BulkIngestor(output, errors, cache, args.concurrency, args.workers, args.mode)
+    start = time.perf_counter()
+    try:
+        asyncio.run(bulk.run(todo))
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume.", file=sys.stderr)
+    finally:
+        output.close()
+        errors.close()
+        if cache is not None:
+            cache.close()
+    print(bulk.summary(time.perf_counter() - start))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
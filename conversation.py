@@ -1,6 +1,9 @@
 import re
-from question_handler import QuestionHandler
-import spacy
+import sys
+import logging
+from shared_recipe import intern_recipe
+from intent_router import classify, navigation_intent, LAST_STEP
+from instrumentation import span
 
 """
 Conversation module contains relevant state variables for recipe navigation, 
@@ -8,21 +11,60 @@ and logic for how to update those state variables depending on a user's request.
 Generic question-answering logic is delegated to the QuestionHandler module.
 
 A Conversation object consists of:
-    - recipe of interest
+    - recipe of interest (and its AllRecipes recipe ID, if known)
     - question history
     - current step in the recipe
     - QuestionHandler object for handling user requests
+
+The recipe and its QuestionHandler are shared, read-only, by every conversation about the same recipe
+(see shared_recipe.py); only the question history and current step belong to a single conversation.
 """
 
+log = logging.getLogger(__name__)
+
 class Conversation:
-    def __init__(self, recipe):
-        self.recipe = recipe
+    __slots__ = ("recipe", "recipe_id", "current_step", "question_history", "question_handler")
+
+    def __init__(self, recipe, recipe_id=None):
+        self.recipe = intern_recipe(recipe, recipe_id)
+        self.recipe_id = self.recipe.recipe_id
         self.current_step = 0
         self.question_history = []
-        self.question_handler = QuestionHandler(recipe)
-        self.nlp = spacy.load("en_core_web_lg")
-    
-    def update_step(self, user_query):
+        self.question_handler = self.recipe.question_handler
+
+    def size_kb(self):
+        """
+        Approximate memory held by this conversation alone, in KB.
+        The shared recipe, its QuestionHandler and the spaCy model (see nlp_model.py) are not counted,
+        since they are shared with other conversations.
+        """
+        size = sys.getsizeof(self) + sys.getsizeof(self.current_step) + sys.getsizeof(self.question_history)
+        size += sum(sys.getsizeof(question) for question in self.question_history)
+        return size / 1024
+
+    def to_state(self, history_limit=None):
+        """
+        Return the per-user state of this conversation as a JSON-serializable dict.
+        The recipe itself is not included, only its ID; history_limit keeps just the most recent questions.
+        """
+        history = self.question_history[-history_limit:] if history_limit else self.question_history
+        return {
+            "recipe_id": self.recipe_id,
+            "current_step": self.current_step,
+            "question_history": list(history),
+        }
+
+    @classmethod
+    def from_state(cls, state, recipe):
+        """
+        Rebuild a conversation from to_state() output and the (already parsed) recipe.
+        """
+        conversation = cls(recipe, state.get("recipe_id"))
+        conversation.current_step = min(state.get("current_step", 0), max(len(recipe['steps']) - 1, 0))
+        conversation.question_history = list(state.get("question_history", []))
+        return conversation
+
+    def update_step(self, user_query, intent=None):
         """
         Update the current step accordingly given the user query.
         
@@ -33,12 +75,14 @@ class Conversation:
                             Previous - go to previous step
                             Next - go to next step
                             Nth - go to any arbitrary step in the recipe
+            intent: the already classified Navigation intent for user_query, if available
         """
         
-        navigation_type = self.question_handler.detect_navigation_type(user_query)
+        if intent is None:
+            intent = navigation_intent(user_query)
         
         # return appropriate index corresponding to user_query category
-        match navigation_type:
+        match intent.navigation:
             case 'Current':
                 pass
             case 'Previous':
@@ -52,8 +96,8 @@ class Conversation:
                 else:
                     return(f"You've reached the end of the recipe.")
             case 'Nth':
-                step_num = self.question_handler.extract_step_number(user_query)
-                print(f"request: {user_query} | step_num: {step_num}")
+                step_num = len(self.recipe['steps']) if intent.step_number == LAST_STEP else intent.step_number
+                log.debug("request: %s | step_num: %s", user_query, step_num)
                 if step_num > 0 and step_num <= len(self.recipe['steps']):
                     self.current_step = step_num - 1 # self.current_step is 0 indexed
                 else:
@@ -67,53 +111,42 @@ class Conversation:
         classifies the user request, 
         and delegates the request to the appropriate function (in QuestionHandler) to respond to the user request appropriately.
         """
-        # Define keywords for identifying question type
-        ingredient_words = ['ingredients']
-        step_words = ['steps', 'instructions', 'make this', 'make it', 'cook this', 'cook it']
-        tools_words = ['tools', 'equipment']
-        method_words = ['methods']
-        # directions_words = ['directions', 'requirements']
-        time_words = ['time', 'long', 'duration']
-        all_words = ingredient_words + step_words + tools_words + method_words
-
         # Add user request to question history
         self.question_history.append(request)
 
-        # identify type of user request
-        user_request_type = self.question_handler.determine_request_type(request)
-        print(f"request type: {user_request_type}")
+        # identify type of user request (see intent_router.py)
+        with span("classify"):
+            intent = classify(request)
+        log.debug("request type: %s", intent.kind)
 
-        match user_request_type:
+        match intent.kind:
             case "General":
-                if any(word in request for word in all_words):
-                    if any(word in request for word in ingredient_words):
-                        return(self.question_handler.return_ingredients())
-                    elif any(word in request for word in step_words):
-                        return(self.question_handler.return_steps())
-                    elif any(word in request for word in tools_words):
-                        return(self.question_handler.return_tools())
-                    elif any(word in request for word in method_words):
-                        return(self.question_handler.return_methods())
-                    else:
-                        return("I don't know that information about this recipe. Please try asking again.")
+                if intent.topic is not None:
+                    match intent.topic:
+                        case "ingredients":
+                            return(self.question_handler.return_ingredients())
+                        case "steps":
+                            return(self.question_handler.return_steps())
+                        case "tools":
+                            return(self.question_handler.return_tools())
+                        case "methods":
+                            return(self.question_handler.return_methods())
                 # If the question is not about the recipe, search Google
                 else:
                     # Deal with vague queries (How to cook that, How to make that, etc.)
-                    precursor, demonstrative, reference = self.question_handler.extract_demonstrative_reference(request)
+                    precursor, demonstrative, reference = intent.reference
                     if reference is None: 
                         reference = ""
                     if precursor is None:
                         precursor = ""
                     phrase = f"{precursor} {demonstrative} {reference}".strip()
-                    print(f"precursor: {precursor} | demonstrative: {demonstrative} | reference: {reference}")
+                    log.debug("precursor: %s | demonstrative: %s | reference: %s", precursor, demonstrative, reference)
                     
                     if demonstrative is not None:
                         # Get the current step's text
                         current_step_text = self.recipe['steps'][self.current_step]['text']
 
-                        ingredients = self.question_handler.extract_subject_ingredient(current_step_text)
-                        methods = self.question_handler.extract_subject_method(current_step_text)
-                        tools = self.question_handler.extract_subject_tool(current_step_text)
+                        ingredients, methods, tools = self.question_handler.extract_step_subjects(self.current_step)
 
                         # Reference replacements
                         if reference == "ingredient":
@@ -175,7 +208,7 @@ class Conversation:
                             return(f"I don't know what you're referring to by \"{phrase}\". Please try asking again.")
                         
 
-                    print(f"request: {request}")
+                    log.debug("request: %s", request)
                     if "how much" in request.lower():
                         subject = self.question_handler.extract_subject_ingredient(request)
                         if not subject: 
@@ -183,14 +216,14 @@ class Conversation:
                         if len(subject) > 1:
                             return(f"Which of the following ingredients are you referring to? \n{', '.join(subject)} \nPlease clarify your request.")
                         elif subject:
-                            print(f"subject: {subject}")
-                            for ingredient in self.recipe['ingredients']:
-                                if ingredient['name'] == subject[0]:
-                                    if ingredient['measurement']:
-                                        return(f"You need {ingredient['quantity']} {ingredient['measurement']} of {ingredient['name']}")
-                                    else:
-                                        return(f"You need {ingredient['quantity']} {ingredient['name']}")
-                            return("I don't know that ingredient. Please try asking again.")
+                            log.debug("subject: %s", subject)
+                            ingredient = self.question_handler.find_ingredient(subject[0])
+                            if ingredient is None:
+                                return("I don't know that ingredient. Please try asking again.")
+                            if ingredient['measurement']:
+                                return(f"You need {ingredient['quantity']} {ingredient['measurement']} of {ingredient['name']}")
+                            else:
+                                return(f"You need {ingredient['quantity']} {ingredient['name']}")
                     elif "how long" in request.lower():
                         if self.recipe['steps'][self.current_step]['time']['duration'] != "N/A":
                             return(f"{self.recipe['steps'][self.current_step]['time']['duration']} {self.recipe['steps'][self.current_step]['time']['unit']}")
@@ -201,20 +234,21 @@ class Conversation:
                         return(self.question_handler.build_google_search_query(request))
 
             case "Navigation":
-                msg = self.update_step(request)
+                msg = self.update_step(request, intent)
                 if msg:
                     return(f"{msg}\nStep {self.current_step + 1}: {self.recipe['steps'][self.current_step]['text']}")
                 else:
                     return(f"Step {self.current_step + 1}: {self.recipe['steps'][self.current_step]['text']}")
             
             case "Step":
-                if any(word in request for word in method_words):
-                    return(self.question_handler.return_methods(self.current_step))
-                elif any(word in request for word in ingredient_words):
-                    return(self.question_handler.return_ingredients(self.current_step))
-                elif any(word in request for word in time_words):
-                    return(self.question_handler.return_time(self.current_step))
-                elif any(word in request for word in tools_words):
-                    return(self.question_handler.return_tools(self.current_step))
-                else:
-                    return(self.question_handler.return_directions(self.current_step))
\ No newline at end of file
+                match intent.topic:
+                    case "methods":
+                        return(self.question_handler.return_methods(self.current_step))
+                    case "ingredients":
+                        return(self.question_handler.return_ingredients(self.current_step))
+                    case "time":
+                        return(self.question_handler.return_time(self.current_step))
+                    case "tools":
+                        return(self.question_handler.return_tools(self.current_step))
+                    case _:
+                        return(self.question_handler.return_directions(self.current_step))
\ No newline at end of file
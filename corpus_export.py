@@ -0,0 +1,302 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from lexicon import UNITS
+from search_index import DURATION_REGEX, MINUTES_PER_UNIT
+from recipe_pack import RecipePack, read_jsonl_recipes, read_cache_recipes
+
+"""
+Corpus export module flattens a corpus of parsed recipes (the nested JSON of parse.recipe_to_json) into columnar
+tables, written as zstd-compressed Parquet files, and computes parser-quality analytics over them with vectorized
+pandas/NumPy operations, so a parser change can be evaluated across 50k recipes in seconds.
+
+Usage:
+    python corpus_export.py export OUTPUT_DIR [INPUT.jsonl ...] [--cache recipe_cache.sqlite3] [--pack recipes.pack]
+    python corpus_export.py report CORPUS_DIR [--baseline OTHER_CORPUS_DIR] [--top 20]
+
+Inputs are bulk_ingest.py output files, a recipe cache and/or a recipe pack (a recipe found in several is exported
+once, from the first). OUTPUT_DIR gets one <table>.parquet per table (Parquet needs pyarrow, see requirements.txt):
+    recipes           recipe_id, title, ingredient_count, step_count, tool_count, method_count
+    ingredients       recipe_id, position, raw, name, quantity, measurement, descriptor, preparation
+                      (raw is the ingredient line the other columns were parsed from)
+    steps             recipe_id, step_number, text, duration, condition, ingredient_count, tool_count, method_count
+    step_ingredients  recipe_id, step_number, name
+    tools             recipe_id, step_number, tool    (a recipe's tools are the union of its steps' tools)
+    methods           recipe_id, step_number, method
+Repeated strings (IDs, names, units, tools, methods) are categorical columns, dictionary-encoded in the files.
+
+report prints, for the corpus and (with --baseline, e.g. the same pages exported before a parser change) the
+difference to another one:
+    - ingredient frequency: share of recipes using each ingredient name
+    - measurements: share of ingredients without a quantity or a unit, and of lines naming a known unit
+      (data/lexicons/units.txt) that the parser did not extract ("unparsed"), with the units missed most
+    - step tagging coverage: share of steps tagged with at least one ingredient, tool, method, a duration, a condition
+    - durations: distribution of parsed step durations and recipe totals (in minutes, as in search_index.py)
+"""
+
+TABLES = ("recipes", "ingredients", "steps", "step_ingredients", "tools", "methods")
+CATEGORICAL = {
+    "recipes": ("recipe_id",),
+    "ingredients": ("recipe_id", "name", "quantity", "measurement", "descriptor", "preparation"),
+    "steps": ("recipe_id", "duration", "condition"),
+    "step_ingredients": ("recipe_id", "name"),
+    "tools": ("recipe_id", "tool"),
+    "methods": ("recipe_id", "method"),
+}
+INTEGERS = ("position", "step_number", "ingredient_count", "step_count", "tool_count", "method_count")
+COMPRESSION = "zstd"
+DURATION_BINS = [0, 5, 10, 15, 30, 60, 120, 240, np.inf]
+UNIT_REGEX = rf"\b({UNITS.pattern})\b"
+# the columns analyze uses: report reads nothing else from the files
+REPORT_COLUMNS = {
+    "recipes": ["recipe_id"],
+    "ingredients": ["recipe_id", "raw", "name", "quantity", "measurement"],
+    "steps": ["recipe_id", "duration", "condition", "ingredient_count", "tool_count", "method_count"],
+}
+
+def read_pack_recipes(path):
+    with RecipePack(path) as pack:
+        yield from pack.items()
+
+def flatten(recipes):
+    """
+    (recipe ID, recipe JSON) pairs -> {table name: DataFrame}. Recipe IDs already seen are skipped.
+    """
+    columns = {
+        "recipes": {"recipe_id": [], "title": [], "ingredient_count": [], "step_count": [], "tool_count": [], "method_count": []},
+        "ingredients": {"recipe_id": [], "position": [], "raw": [], "name": [], "quantity": [], "measurement": [],
+                        "descriptor": [], "preparation": []},
+        "steps": {"recipe_id": [], "step_number": [], "text": [], "duration": [], "condition": [],
+                  "ingredient_count": [], "tool_count": [], "method_count": []},
+        "step_ingredients": {"recipe_id": [], "step_number": [], "name": []},
+        "tools": {"recipe_id": [], "step_number": [], "tool": []},
+        "methods": {"recipe_id": [], "step_number": [], "method": []},
+    }
+    seen = set()
+    for recipe_id, recipe in recipes:
+        recipe_id = str(recipe_id)
+        if recipe_id in seen:
+            continue
+        seen.add(recipe_id)
+        ingredients = recipe.get("ingredients") or []
+        raw_lines = recipe.get("raw_ingredients") or []
+        steps = recipe.get("steps") or []
+        row = columns["recipes"]
+        row["recipe_id"].append(recipe_id)
+        row["title"].append(recipe.get("title"))
+        row["ingredient_count"].append(len(ingredients))
+        row["step_count"].append(len(steps))
+        row["tool_count"].append(len(recipe.get("tools") or ()))
+        row["method_count"].append(len(recipe.get("methods") or ()))
+        table = columns["ingredients"]
+        for position, ingredient in enumerate(ingredients):
+            table["recipe_id"].append(recipe_id)
+            table["position"].append(position)
+            # parse_ingredients makes one ingredient per raw line
+            table["raw"].append(raw_lines[position] if position < len(raw_lines) else None)
+            for key in ("name", "quantity", "measurement", "descriptor", "preparation"):
+                table[key].append(ingredient.get(key))
+        for step in steps:
+            number = step.get("step_number")
+            time_info = step.get("time") or {}
+            table = columns["steps"]
+            table["recipe_id"].append(recipe_id)
+            table["step_number"].append(number)
+            table["text"].append(step.get("text"))
+            table["duration"].append(time_info.get("duration"))
+            table["condition"].append(time_info.get("condition"))
+            for key, child, column in (("ingredients", "step_ingredients", "name"), ("tools", "tools", "tool"),
+                                       ("methods", "methods", "method")):
+                values = step.get(key) or ()
+                table[f"{key[:-1]}_count"].append(len(values))
+                rows = columns[child]
+                for value in values:
+                    rows["recipe_id"].append(recipe_id)
+                    rows["step_number"].append(number)
+                    rows[column].append(value)
+    tables = {}
+    for name, table in columns.items():
+        frame = pd.DataFrame(table)
+        for column in frame.columns:
+            if column in INTEGERS:
+                frame[column] = frame[column].astype(np.int32)
+            else:
+                # the JSON-LD a recipe came from is not always well-typed (e.g. a numeric title)
+                frame[column] = frame[column].astype("string")
+                if column in CATEGORICAL[name]:
+                    frame[column] = frame[column].astype("category")
+        tables[name] = frame
+    return tables
+
+def write_corpus(tables, directory):
+    """
+    Write each table to DIRECTORY/<table>.parquet (replacing the file atomically).
+    """
+    os.makedirs(directory, exist_ok=True)
+    for name, frame in tables.items():
+        path = os.path.join(directory, f"{name}.parquet")
+        frame.to_parquet(path + ".tmp", engine="pyarrow", compression=COMPRESSION, index=False)
+        os.replace(path + ".tmp", path)
+
+def read_corpus(directory, columns=None):
+    """
+    Load the tables of an exported corpus; columns ({table: [column]}) reads only those tables and columns.
+    """
+    wanted = columns or {name: None for name in TABLES}
+    return {name: pd.read_parquet(os.path.join(directory, f"{name}.parquet"), engine="pyarrow", columns=selected)
+            for name, selected in wanted.items()}
+
+def per_category(column, transform):
+    """
+    transform (a function of a string Series) applied to the distinct values of a categorical column instead of
+    every row, then spread back to the rows through the category codes. Returns a NumPy array (NaN for missing values).
+    """
+    column = column.astype("category")
+    values = np.asarray(transform(pd.Series(column.cat.categories, dtype="string")), dtype=object)
+    codes = column.cat.codes.to_numpy()
+    return np.where(codes >= 0, np.append(values, np.nan)[codes], np.nan)
+
+def ingredient_frequency(tables, top=20):
+    """
+    The top ingredient names (stripped, lowercased) by the number of recipes using them, with their share of recipes.
+    """
+    ingredients = tables["ingredients"]
+    names = pd.Series(per_category(ingredients["name"], lambda names: names.str.strip().str.lower()), dtype="string")
+    name_codes, unique_names = pd.factorize(names)
+    recipe_codes = ingredients["recipe_id"].astype("category").cat.codes.to_numpy().astype(np.int64)
+    # each (recipe, name) pair once, then count recipes per name
+    used = name_codes >= 0
+    pairs = np.unique(recipe_codes[used] * len(unique_names) + name_codes[used])
+    counts = pd.Series(np.bincount(pairs % len(unique_names), minlength=len(unique_names)), index=unique_names)
+    counts = counts.rename_axis("name").sort_values(ascending=False, kind="stable").head(top)
+    return pd.DataFrame({"recipes": counts, "share": counts / max(len(tables["recipes"]), 1)})
+
+def measurement_stats(tables, top=10):
+    """
+    (Series of ingredient rates, Series of the units most often left unparsed).
+    """
+    ingredients = tables["ingredients"]
+    missing_unit = ingredients["measurement"].isna()
+    # the unit named by each line without a parsed one (first match, as in parse.QUANTITY_REGEX)
+    named_unit = ingredients.loc[missing_unit, "raw"].astype("string").str.extract(UNIT_REGEX, expand=False).dropna()
+    total = max(len(ingredients), 1)
+    rates = pd.Series({
+        "ingredients": len(ingredients),
+        "no_quantity": ingredients["quantity"].isna().sum() / total,
+        "no_measurement": missing_unit.sum() / total,
+        "unparsed_measurement": len(named_unit) / total,
+    })
+    return rates, named_unit.value_counts().head(top).rename_axis("unit")
+
+def tagging_coverage(tables):
+    """
+    Share of steps tagged with at least one ingredient, tool and method, with a duration and a condition, and with none.
+    """
+    steps = tables["steps"]
+    tagged = pd.DataFrame({
+        "ingredient": steps["ingredient_count"].to_numpy() > 0,
+        "tool": steps["tool_count"].to_numpy() > 0,
+        "method": steps["method_count"].to_numpy() > 0,
+        "duration": steps["duration"].notna().to_numpy(),
+        "condition": steps["condition"].notna().to_numpy(),
+    })
+    coverage = tagged.mean()
+    coverage["none"] = (~tagged.any(axis=1)).mean()
+    coverage["steps"] = len(steps)
+    return coverage
+
+def step_minutes(steps):
+    """
+    Minutes of each step's duration (NaN if none), summing every amount in it like search_index.step_minutes.
+    """
+    def minutes(durations):
+        parts = durations.str.lower().str.extractall(DURATION_REGEX.pattern)
+        amounts = parts[0].astype(float) * parts[1].map(MINUTES_PER_UNIT).astype(float)
+        return amounts.groupby(level=0).sum().reindex(durations.index)
+    # durations repeat a lot ("10 minutes"): each distinct one is parsed once
+    return pd.Series(per_category(steps["duration"], minutes), index=steps.index, dtype=float)
+
+def duration_distribution(tables):
+    """
+    (DataFrame of percentiles, DataFrame of histogram counts) of step and recipe minutes; recipes without any
+    step duration are left out of the recipe totals.
+    """
+    steps = tables["steps"]
+    minutes = step_minutes(steps)
+    totals = minutes.groupby(steps["recipe_id"], observed=True).sum(min_count=1).dropna()
+    series = {"step": minutes.dropna(), "recipe": totals}
+    percentiles = pd.DataFrame({name: values.describe(percentiles=[0.5, 0.9, 0.99]) for name, values in series.items()})
+    labels = [f"<={int(edge)}" for edge in DURATION_BINS[1:-1]] + [f">{int(DURATION_BINS[-2])}"]
+    histogram = pd.DataFrame({name: pd.cut(values, DURATION_BINS, labels=labels, include_lowest=True).value_counts(sort=False)
+                              for name, values in series.items()})
+    return percentiles, histogram
+
+def analyze(tables, top=20):
+    """
+    Every report section as {title: DataFrame or Series}.
+    """
+    rates, missed_units = measurement_stats(tables, top)
+    percentiles, histogram = duration_distribution(tables)
+    return {
+        "ingredient frequency": ingredient_frequency(tables, top),
+        "measurements": rates,
+        "units left unparsed": missed_units,
+        "step tagging coverage": tagging_coverage(tables),
+        "durations (minutes)": percentiles,
+        "duration histogram": histogram,
+    }
+
+def compare(current, baseline):
+    # a section next to the same section of the baseline corpus (with the change, for single-column sections)
+    if isinstance(current, pd.Series):
+        joined = pd.DataFrame({"current": current, "baseline": baseline})
+        joined["change"] = joined["current"] - joined["baseline"]
+        return joined
+    return pd.concat({"current": current, "baseline": baseline}, axis=1)
+
+def export(output, inputs, cache=None, pack=None):
+    started = time.perf_counter()
+    sources = ([read_jsonl_recipes(path) for path in inputs] + ([read_cache_recipes(cache)] if cache else [])
+               + ([read_pack_recipes(pack)] if pack else []))
+    tables = flatten(recipe for source in sources for recipe in source)
+    write_corpus(tables, output)
+    size_mb = sum(os.path.getsize(os.path.join(output, f"{name}.parquet")) for name in tables) / (1024 * 1024)
+    rows = ", ".join(f"{len(frame)} {name}" for name, frame in tables.items())
+    print(f"{output}: {rows}; {size_mb:.1f} MB in {time.perf_counter() - started:.1f} s")
+    return 0
+
+def report(directory, baseline=None, top=20):
+    started = time.perf_counter()
+    sections = analyze(read_corpus(directory, REPORT_COLUMNS), top)
+    baseline_sections = analyze(read_corpus(baseline, REPORT_COLUMNS), top) if baseline else None
+    with pd.option_context("display.max_rows", None, "display.width", 120, "display.float_format", "{:.3f}".format):
+        for title, section in sections.items():
+            print(f"\n== {title}")
+            if baseline_sections is not None:
+                section = compare(section, baseline_sections[title])
+            print(section.to_string())
+    print(f"\nreport computed in {time.perf_counter() - started:.2f} s")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Export parsed recipes as columnar tables and report parser-quality analytics.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="write the Parquet tables of a corpus")
+    export_parser.add_argument("output", help="directory for the <table>.parquet files")
+    export_parser.add_argument("inputs", nargs="*", help="bulk_ingest.py JSON Lines output files")
+    export_parser.add_argument("--cache", help="also export every recipe of this recipe cache (SQLite file)")
+    export_parser.add_argument("--pack", help="also export every recipe of this recipe pack")
+    report_parser = commands.add_parser("report", help="print analytics of an exported corpus")
+    report_parser.add_argument("corpus")
+    report_parser.add_argument("--baseline", help="another exported corpus to compare with")
+    report_parser.add_argument("--top", type=int, default=20, help="rows of the ingredient and unit rankings")
+    args = parser.parse_args()
+    if args.command == "export":
+        return export(args.output, args.inputs, args.cache, args.pack)
+    return report(args.corpus, args.baseline, args.top)
+
+if __name__ == "__main__":
+    sys.exit(main())
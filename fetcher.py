@@ -0,0 +1,192 @@
+import os
+import random
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+import aiohttp
+from instrumentation import increment
+
+"""
+Fetcher module is the HTTP layer used to download recipe pages: one pooled keep-alive session per process.
+
+    - AsyncFetcher: aiohttp session for the bot, the parse service and bulk ingestion (see ingest.py)
+    - get_session(): requests.Session for blocking callers (parse.fetch_recipe, main.py)
+
+Both negotiate compression (gzip/deflate, plus brotli when the brotli or brotlicffi package is installed),
+use separate connect and read timeouts, and retry connection errors and 429/5xx responses with jittered
+exponential backoff (honouring Retry-After). Connections per host are capped (FETCH_PER_HOST_LIMIT) so a
+bulk warm-up does not get us throttled by allrecipes.com.
+
+Connection reuse: aiohttp returns a connection to the pool only once its response body has been read to the end,
+so a caller that stops reading early (the JSON-LD scan, see ingest.py) calls drain() before leaving get(): the rest of
+the body, up to DRAIN_LIMIT bytes, is read and thrown away so the next request to the host skips the TCP/TLS
+handshake; a longer remainder is cheaper to drop with its connection than to download
+(see benchmarks/bench_fetch_reuse.py).
+
+Conditional requests: pass the ETag/Last-Modified stored with a cached recipe (validators) and a page that
+has not changed costs a 304 instead of a full download and parse.
+"""
+
+CONNECT_TIMEOUT = 5 # seconds
+READ_TIMEOUT = 15 # seconds without receiving data
+TOTAL_TIMEOUT = 30 # seconds per attempt
+TIMEOUTS = (CONNECT_TIMEOUT, READ_TIMEOUT) # for requests
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5 # seconds; retry n waits a random time up to BACKOFF_BASE * 2**n ("full jitter")
+BACKOFF_MAX = 8 # seconds
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+MAX_CONNECTIONS = 20
+PER_HOST_LIMIT = int(os.getenv("FETCH_PER_HOST_LIMIT", "4"))
+DRAIN_LIMIT = int(os.getenv("FETCH_DRAIN_LIMIT", str(512 * 1024))) # bytes
+DRAIN_CHUNK = 64 * 1024
+
+def _brotli_available():
+    for module in ("brotli", "brotlicffi"):
+        try:
+            __import__(module)
+            return True
+        except ImportError:
+            continue
+    return False
+
+# aiohttp and urllib3 decode br responses only when a brotli package is installed, so only ask for it then
+ACCEPT_ENCODING = "gzip, deflate, br" if _brotli_available() else "gzip, deflate"
+
+class NotModified(Exception):
+    """
+    Raised for a 304 response to a conditional request: the cached copy is still current.
+    """
+    pass
+
+def backoff(attempt, retry_after=None):
+    """
+    Seconds to wait before retry number attempt (0-based): the server's Retry-After if it sent one, else full jitter.
+    """
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+def parse_retry_after(value):
+    # only the delay-seconds form; an HTTP-date falls back to the jittered backoff
+    try:
+        return max(float(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+def validators_from(headers):
+    """
+    The ETag/Last-Modified of a response, as stored with a cached recipe ({} if the server sent neither).
+    """
+    validators = {}
+    if headers.get("ETag"):
+        validators["etag"] = headers["ETag"]
+    if headers.get("Last-Modified"):
+        validators["last_modified"] = headers["Last-Modified"]
+    return validators
+
+def conditional_headers(validators):
+    headers = {}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+class AsyncFetcher:
+    def __init__(self, timeout=TOTAL_TIMEOUT, max_connections=MAX_CONNECTIONS, per_host=PER_HOST_LIMIT, retries=MAX_RETRIES,
+                 drain_limit=DRAIN_LIMIT):
+        self.timeout = timeout
+        self.drain_limit = drain_limit
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.retries = retries
+        self.session = None
+        self.stats = {"requests": 0, "retries": 0, "not_modified": 0, "drained": 0, "dropped": 0}
+
+    def _get_session(self):
+        # created lazily so the session binds to the running event loop
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.per_host),
+                timeout=aiohttp.ClientTimeout(total=self.timeout, connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT),
+                headers={"Accept-Encoding": ACCEPT_ENCODING},
+            )
+        return self.session
+
+    @asynccontextmanager
+    async def get(self, url, validators=None):
+        """
+        GET url, conditionally if validators are given, and yield the response: 200, 304, or the last error status.
+        Connection errors, timeouts and 429/5xx responses are retried; after the last retry they are raised / yielded.
+        """
+        headers = conditional_headers(validators)
+        attempt = 0
+        while True:
+            self.stats["requests"] += 1
+            try:
+                response = await self._get_session().get(url, headers=headers)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt >= self.retries:
+                    raise
+                delay = backoff(attempt)
+            else:
+                if response.status not in RETRY_STATUSES or attempt >= self.retries:
+                    if response.status == 304:
+                        self.stats["not_modified"] += 1
+                    try:
+                        yield response
+                    finally:
+                        response.release()
+                    return
+                delay = backoff(attempt, parse_retry_after(response.headers.get("Retry-After")))
+                response.release()
+            attempt += 1
+            self.stats["retries"] += 1
+            increment("fetch_retries_total")
+            await asyncio.sleep(delay)
+
+    async def drain(self, response):
+        """
+        Read and discard the rest of a response body, up to drain_limit bytes, so its connection goes back to the pool
+        when get() releases it. Returns True if the body was read to the end; past the limit the connection is closed.
+        """
+        read = 0
+        while read <= self.drain_limit:
+            chunk = await response.content.read(min(DRAIN_CHUNK, self.drain_limit - read + 1))
+            if not chunk:
+                self.stats["drained"] += 1
+                return True
+            read += len(chunk)
+        self.stats["dropped"] += 1
+        return False
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    The process-wide requests.Session for blocking fetches; use it with timeout=TIMEOUTS.
+    Requests beyond PER_HOST_LIMIT concurrent ones to the same host wait for a pooled connection.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            # requests is only needed by blocking callers, so the bot does not import it
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            retry = Retry(total=MAX_RETRIES, backoff_factor=BACKOFF_BASE, backoff_max=BACKOFF_MAX, backoff_jitter=BACKOFF_BASE,
+                          status_forcelist=RETRY_STATUSES, allowed_methods=frozenset(("GET", "HEAD")),
+                          respect_retry_after_header=True, raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=PER_HOST_LIMIT, pool_block=True, max_retries=retry)
+            session = requests.Session()
+            session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
@@ -0,0 +1,316 @@
+import time
+import codecs
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp
+from fetcher import AsyncFetcher, NotModified, validators_from
+from parse import parse_recipe, parse_recipe_head, recipe_head_to_json, recipe_to_json, warm_up
+from jsonld import JsonLdScanner, extract_json_ld_from_soup_text
+from recipe_cache import recipe_id_from_url
+from staged_recipe import StagedRecipe
+from instrumentation import span, observe, increment
+
+"""
+Ingest module turns a recipe URL into a parsed recipe without blocking the bot's event loop.
+
+Ingestion runs in two stages, each with its own timeout:
+    - fetch: async download through an AsyncFetcher (fetcher.py: pooled keep-alive session, compression,
+             retries with backoff, per-host limits), retries included in the fetch timeout; the body is streamed
+             through a JsonLdScanner and scanning stops once the recipe JSON-LD is found; the rest of the body is
+             drained (up to fetcher.DRAIN_LIMIT) so the keep-alive connection is reused for the next page
+    - parse: staged (see staged_recipe.py). Title and ingredients are parsed at once, so the bot can answer
+             right away; step analysis (spaCy) continues in a bounded thread pool, never on the event loop,
+             and only questions that touch the steps wait for it
+Recipes found in the RecipeCache skip both stages; a stale cached recipe is revalidated with a conditional
+request, and re-parsed only if the page changed (anything but a 304). Concurrent requests for the same recipe ID
+share a single in-flight fetch/parse (single-flight), so a link posted in a busy channel is only parsed once.
+Time to first response (fetch + head) and full parse time are reported separately.
+With a ParseGate (see admission.py), a fetched page waits for a parse slot before parsing, and new recipes are
+refused with AdmissionError while the gate's queue is full; the slot is held until the steps are parsed.
+"""
+
+log = logging.getLogger(__name__)
+
+FETCH_TIMEOUT = 15 # seconds
+PARSE_TIMEOUT = 60 # seconds
+PARSE_WORKERS = 2
+WARMING_UP_MESSAGE = "I'm still warming up. Please send that recipe again in a few seconds."
+CHUNK_SIZE = 64 * 1024
+
+class IngestionError(Exception):
+    """
+    Raised when a recipe could not be ingested; the message is safe to show to the user.
+    """
+    pass
+
+def parse_head(json_data, html=None):
+    """
+    Cheap parse stage: returns (json_data, head Recipe with title and ingredients), or (None, None) if the page holds no recipe.
+    If the streaming scan found nothing, json_data is None and the full page html is searched with BeautifulSoup.
+    """
+    if json_data is None and html:
+        with span("json_ld_soup"):
+            json_data = extract_json_ld_from_soup_text(html)
+    if not json_data:
+        return None, None
+    with span("parse_head"):
+        return json_data, parse_recipe_head(json_data)
+
+def parse_steps_stage(json_data, head):
+    """
+    Expensive parse stage: the full recipe JSON, re-using the head from parse_head.
+    """
+    with span("parse_steps"):
+        return recipe_to_json(parse_recipe(json_data, head=head))
+
+def parse_page(json_data, html=None):
+    """
+    Blocking parse of both stages: recipe JSON-LD -> recipe JSON, or None if the page holds no recipe.
+    """
+    json_data, head = parse_head(json_data, html)
+    if head is None:
+        return None
+    return parse_steps_stage(json_data, head)
+
+class RecipeIngestor:
+    def __init__(self, cache=None, parse_workers=PARSE_WORKERS, fetch_timeout=FETCH_TIMEOUT, parse_timeout=PARSE_TIMEOUT, gate=None):
+        self.cache = cache
+        self.gate = gate
+        self.fetch_timeout = fetch_timeout
+        self.parse_timeout = parse_timeout
+        self.parse_workers = parse_workers
+        self._executor = None # parse pool, created on first use (a fetch-only ingestor never starts one)
+        # cache writes (a SQLite insert and commit) run here, never on the event loop, one at a time
+        self.cache_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recipe-cache")
+        self.fetcher = AsyncFetcher(timeout=fetch_timeout)
+        self.in_flight = {} # recipe ID (or URL) -> asyncio.Task running the shared fetch/head parse
+        self.staged = {} # recipe ID (or URL) -> StagedRecipe whose steps are still being parsed
+        self.stats = {"started": 0, "coalesced": 0}
+        self.warming = None # Future of the background warm-up, once started
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.parse_workers, thread_name_prefix="recipe-parse")
+        return self._executor
+
+    @property
+    def ready(self):
+        return self.warming is None or self.warming.done()
+
+    def start_warm_up(self, mode=None):
+        """
+        Start loading the parsing models and libraries in the parse pool (see parse.warm_up); returns a Future.
+        Until it is done, recipes that are not in the cache are refused with a "warming up" IngestionError
+        instead of waiting behind the model load. Without a warm-up, the first recipe loads everything itself.
+        """
+        if self.warming is None:
+            self.warming = asyncio.get_running_loop().run_in_executor(self.executor, self._warm_up, mode)
+        return self.warming
+
+    def _warm_up(self, mode):
+        start = time.perf_counter()
+        try:
+            with span("warm_up"):
+                warm_up(mode)
+        except Exception:
+            log.exception("Warm-up failed; the first recipe will load what it needs")
+            return
+        log.info("Warmed up for parsing in %.2fs", time.perf_counter() - start)
+
+    async def fetch_json_ld(self, url, validators=None):
+        """
+        Download a recipe page, scanning it until its Recipe JSON-LD has been read; the rest is drained, not scanned
+        (see AsyncFetcher.drain), so the connection can be reused.
+        Returns (json_data, None, validators) on success, (None, html, validators) if a block could not be decoded,
+        or (None, None, validators) if the page holds no recipe;
+        validators are the page's ETag/Last-Modified, to store with the parsed recipe. Only the scanner's unscanned
+        tail is held while streaming: the full page for the BeautifulSoup fallback comes from a second download.
+        With validators (from a cached copy), raises NotModified if the page has not changed.
+        Raises IngestionError on bad status or timeout; fetch_timeout bounds the whole stage, the fetcher's
+        retries and backoff and the fallback download included.
+        The fetch span covers the whole download; the time spent scanning for the JSON-LD is also reported on its own.
+        """
+        try:
+            with span("fetch"):
+                return await asyncio.wait_for(self._download_json_ld(url, validators), self.fetch_timeout)
+        except asyncio.TimeoutError:
+            increment("errors_total", stage="fetch")
+            raise IngestionError("The recipe website took too long to respond. Please try again later.")
+        except aiohttp.ClientError:
+            increment("errors_total", stage="fetch")
+            raise IngestionError("Could not fetch the webpage. Please check the URL.")
+        except IngestionError:
+            increment("errors_total", stage="fetch")
+            raise
+
+    async def _download_json_ld(self, url, validators):
+        scan_seconds = 0
+        try:
+            async with self.fetcher.get(url, validators) as response:
+                if response.status == 304:
+                    raise NotModified(url)
+                if response.status != 200:
+                    raise IngestionError("Could not fetch the webpage. Please check the URL.")
+                fresh = validators_from(response.headers)
+                decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+                scanner = JsonLdScanner()
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    start = time.perf_counter()
+                    found = scanner.feed(decoder.decode(chunk)) is not None
+                    scan_seconds += time.perf_counter() - start
+                    if found:
+                        await self.fetcher.drain(response)
+                        return scanner.recipe, None, fresh
+                if scanner.feed(decoder.decode(b"", final=True)) is not None:
+                    return scanner.recipe, None, fresh
+            if not scanner.malformed:
+                return None, None, fresh # every block was read and none is a recipe: the page holds no recipe
+            # rare (a block the scanner cannot decode): fetch the whole page for BeautifulSoup
+            async with self.fetcher.get(url) as response:
+                if response.status != 200:
+                    raise IngestionError("Could not fetch the webpage. Please check the URL.")
+                return None, await response.text(errors='replace'), fresh
+        finally:
+            if scan_seconds:
+                observe("json_ld", scan_seconds)
+
+    async def parse_json_ld(self, json_data, html=None, started=None):
+        """
+        Parse the title and ingredients now and start the step analysis in the worker pool.
+        Returns a StagedRecipe, or None if the page holds no recipe.
+        The parse timeout applies to the whole parse: waiting for the steps gives up once it has passed
+        (the worker thread finishes in the background, but the caller stops waiting).
+        """
+        if json_data is None and html is None:
+            return None
+        if json_data is None:
+            # BeautifulSoup fallback for malformed pages: slow, so off the event loop (and not queued behind step parses)
+            loop = asyncio.get_running_loop()
+            try:
+                json_data, head = await asyncio.wait_for(loop.run_in_executor(None, parse_head, json_data, html), self.parse_timeout)
+            except asyncio.TimeoutError:
+                increment("errors_total", stage="parse")
+                raise IngestionError("That recipe is taking too long to process. Please try again later.")
+        else:
+            json_data, head = parse_head(json_data)
+        if head is None:
+            return None
+        future = self.executor.submit(parse_steps_stage, json_data, head)
+        return StagedRecipe(recipe_head_to_json(head), future, started, self.parse_timeout)
+
+    def _parsed(self, key, recipe_id, recipe, validators, loop):
+        # runs in the worker thread once the steps are parsed (or the parse failed); on the event loop instead
+        # if the parse had already finished when the callback was added
+        if self.gate is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self.gate.release)
+        if not recipe.future.cancelled() and recipe.future.exception() is None:
+            jsn = recipe.future.result()
+            log.info("Parsed recipe %s: first response after %.2fs, full parse after %.2fs", key, recipe.first_response_seconds, recipe.full_parse_seconds)
+            observe("first_response", recipe.first_response_seconds)
+            observe("full_parse", recipe.full_parse_seconds)
+            if jsn and self.cache is not None and recipe_id:
+                self.cache_writer.submit(self._store, key, recipe_id, recipe, jsn, validators, loop)
+                return
+        else:
+            increment("errors_total", stage="parse")
+        self._unstage_soon(key, recipe, loop)
+
+    def _store(self, key, recipe_id, recipe, jsn, validators, loop):
+        # cache writer thread: the staged recipe keeps answering for the key until the cache has the recipe
+        try:
+            self.cache.put(recipe_id, jsn, validators)
+        finally:
+            self._unstage_soon(key, recipe, loop)
+
+    def _unstage_soon(self, key, recipe, loop):
+        # from any thread: staged is only touched on the event loop
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(self._unstage, key, recipe)
+
+    def _unstage(self, key, recipe):
+        # a newer parse of the same recipe may have been staged under the key meanwhile: leave it there
+        if self.staged.get(key) is recipe:
+            del self.staged[key]
+
+    async def _fetch_and_parse(self, url, recipe_id, key):
+        started = time.perf_counter()
+        cached = await asyncio.to_thread(self.cache.validators, recipe_id) if self.cache is not None and recipe_id else None
+        try:
+            json_data, html, validators = await self.fetch_json_ld(url, cached)
+        except NotModified:
+            # the stale cached copy is still current: renew it instead of parsing the page again
+            recipe = await asyncio.to_thread(self.cache.revalidate, recipe_id)
+            if recipe is not None:
+                return recipe
+            json_data, html, validators = await self.fetch_json_ld(url)
+        if self.gate is not None:
+            await self.gate.acquire()
+        try:
+            recipe = await self.parse_json_ld(json_data, html, started)
+        except BaseException:
+            if self.gate is not None:
+                self.gate.release()
+            raise
+        if recipe is None:
+            if self.gate is not None:
+                self.gate.release()
+            return None
+        self.staged[key] = recipe
+        loop = asyncio.get_running_loop()
+        recipe.future.add_done_callback(lambda future: self._parsed(key, recipe_id, recipe, validators, loop))
+        return recipe
+
+    def _finish(self, key, task):
+        self.in_flight.pop(key, None)
+        # mark the exception as retrieved in case every waiter went away before it finished
+        if not task.cancelled():
+            task.exception()
+
+    async def ingest(self, url):
+        """
+        Fetch and parse a recipe URL, serving it from the cache when possible.
+        Returns the recipe JSON (a StagedRecipe if its steps are still being parsed), or None if the page does not contain a recipe.
+
+        Concurrent calls for the same recipe wait on one shared task: its result, or its exception
+        (including cancellation of the shared task), is delivered to every waiter. A waiter that is
+        itself cancelled stops waiting without cancelling the work for the others.
+        """
+        recipe_id = recipe_id_from_url(url)
+        if self.cache is not None and recipe_id:
+            # the memory tier answers inline; the SQLite tier (a query and a JSON decode) is read in a thread
+            cached = self.cache.get_from_memory(recipe_id)
+            if cached is None:
+                cached = await asyncio.to_thread(self.cache.get, recipe_id)
+            if cached is not None:
+                return cached
+        if not self.ready:
+            increment("admission_total", decision="warming_up", kind="parse")
+            raise IngestionError(WARMING_UP_MESSAGE)
+        key = recipe_id or url
+        staged = self.staged.get(key)
+        if staged is not None:
+            self.stats["coalesced"] += 1
+            return staged
+        task = self.in_flight.get(key)
+        if task is None:
+            if self.gate is not None:
+                self.gate.check() # refuse at once rather than fetch a page there is no room to parse
+            task = asyncio.create_task(self._fetch_and_parse(url, recipe_id, key))
+            task.add_done_callback(lambda t: self._finish(key, t))
+            self.in_flight[key] = task
+            self.stats["started"] += 1
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    async def close(self):
+        for task in list(self.in_flight.values()):
+            task.cancel()
+        for recipe in list(self.staged.values()):
+            recipe.future.cancel()
+        await self.fetcher.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        await asyncio.to_thread(self.cache_writer.shutdown) # let pending writes finish before the cache is closed
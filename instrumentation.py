@@ -0,0 +1,183 @@
+import os
+import sys
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from contextlib import contextmanager
+
+"""
+Instrumentation module: timing spans, counters and non-blocking logging for the bot worker.
+
+    - span("fetch"): context manager recording how long a block took, as a Prometheus histogram
+                     (recipebot_span_seconds{span="fetch"})
+    - increment("errors_total", stage="parse"): counters with labels
+    - register_collector(name, help, fn): values read when the metrics are scraped (active sessions, cache hits, ...)
+    - render(): every metric in the Prometheus text exposition format
+    - start_metrics_server(): serves render() at http://127.0.0.1:METRICS_PORT/metrics (aiohttp, on the bot's event loop)
+    - setup_logging(): leveled logging (LOG_LEVEL, default INFO) through a QueueHandler; records are written to stderr
+                       by a background thread, so logging never blocks the event loop on a slow stdout/stderr
+
+Everything is thread-safe: spans and counters are also recorded from the parse worker threads.
+"""
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9102")) # 0 disables the endpoint
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+PREFIX = "recipebot_"
+
+# histogram buckets for spans, in seconds: from a cached answer (~ms) to a slow fetch + parse
+SPAN_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HELP = {
+    "span_seconds": "Time spent in instrumented spans (fetch, json_ld, json_ld_soup, parse_head, parse_steps, first_response, full_parse, ingest, classify, handle_request, send, warm_up).",
+    "errors_total": "Errors by stage.",
+    "messages_total": "Discord messages handled, by kind.",
+    "admission_total": "Messages rate limited, and parses queued, refused as busy, or refused while warming up (see admission.py).",
+}
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+class Metrics:
+    def __init__(self, buckets=SPAN_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {} # name -> {label tuple -> value}
+        self.histograms = {} # name -> {label tuple -> [bucket counts..., sum, count]}
+        self.collectors = {} # name -> (help, kind, fn returning a number or {label tuple -> number})
+
+    def increment(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            values = series.get(key)
+            if values is None:
+                values = series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    values[i] += 1
+            values[-2] += seconds
+            values[-1] += 1
+
+    def register_collector(self, name, help, fn, kind="gauge"):
+        self.collectors[name] = (help, kind, fn)
+
+    def render(self):
+        """
+        Return all metrics in the Prometheus text exposition format (version 0.0.4).
+        """
+        lines = []
+        with self.lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            histograms = {name: {key: list(values) for key, values in series.items()} for name, series in self.histograms.items()}
+        for name, series in sorted(counters.items()):
+            lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{PREFIX}{name}{_labels(key)} {value}")
+        for name, series in sorted(histograms.items()):
+            lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for key, values in sorted(series.items()):
+                # bucket counts were recorded per bound; cumulative by construction (a value counts in every bucket it fits)
+                for bound, count in zip(self.buckets, values):
+                    lines.append(f"{PREFIX}{name}_bucket{_labels(key, ('le', bound))} {count}")
+                lines.append(f"{PREFIX}{name}_bucket{_labels(key, ('le', '+Inf'))} {values[-1]}")
+                lines.append(f"{PREFIX}{name}_sum{_labels(key)} {values[-2]:.6f}")
+                lines.append(f"{PREFIX}{name}_count{_labels(key)} {values[-1]}")
+        for name, (help, kind, fn) in sorted(self.collectors.items()):
+            try:
+                value = fn()
+            except Exception:
+                logging.getLogger(__name__).exception("collector %s failed", name)
+                continue
+            lines.append(f"# HELP {PREFIX}{name} {help}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+            series = value if isinstance(value, dict) else {(): value}
+            for key, number in sorted(series.items()):
+                lines.append(f"{PREFIX}{name}{_labels(key)} {number}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def increment(name, amount=1, **labels):
+    metrics.increment(name, amount, **labels)
+
+def observe(span_name, seconds):
+    metrics.observe("span_seconds", seconds, span=span_name)
+
+@contextmanager
+def span(name):
+    """
+    Time the enclosed block into recipebot_span_seconds{span=name} (also when it raises).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+def register_collector(name, help, fn, kind="gauge"):
+    """
+    Report fn() (a number, or {label tuple -> number}) as a gauge, or as a counter for values that only grow.
+    """
+    metrics.register_collector(name, help, fn, kind)
+
+def render():
+    return metrics.render()
+
+async def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """
+    Serve the metrics at http://host:port/metrics on the running event loop. Returns the aiohttp runner (None if disabled).
+    """
+    if not port:
+        return None
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8", headers={"X-Content-Type-Options": "nosniff"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.getLogger(__name__).info("Serving metrics on http://%s:%s/metrics", host, port)
+    return runner
+
+_listener = None
+
+def setup_logging(level=LOG_LEVEL, stream=None):
+    """
+    Route all logging through a queue drained by a background thread (idempotent).
+    """
+    global _listener
+    if _listener is not None:
+        return
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(level)
+    # keep library chatter (discord gateway, aiohttp access) at INFO even when debugging the bot
+    for name in ("discord", "aiohttp"):
+        logging.getLogger(name).setLevel(max(root.level, logging.INFO))
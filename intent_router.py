@@ -0,0 +1,160 @@
+import re
+
+"""
+Intent router module classifies a user message once and returns everything Conversation needs to route it.
+
+All keyword tables and navigation patterns are built once, at import time, and a message is lowercased once.
+Classification walks the tables in priority order and stops at the first hit; keywords are plain substrings,
+so CPython's C substring search is used rather than a regex (for lists this short it is faster
+than any combined regex scan), and the navigation regexes only run for navigation requests.
+
+The routing is the same as the original cascade, kept as the reference in benchmarks/bench_intent_router.py:
+    - request type: determine_request_type
+    - navigation type and step number: detect_navigation_type / extract_step_number
+    - demonstrative references: extract_demonstrative_reference
+    - topic: the keyword checks that Conversation.handle_request used to run for General and Step requests
+"""
+
+# same keywords and priority order as the original determine_request_type (matched on the lowercased message)
+REQUEST_TYPE_KEYWORDS = (
+    ("General", ("how to", "how do", "what is", "steps")),
+    ("Navigation", ("go", "proceed", "take me", "move", "navigate", "next", "previous", 'repeat', 'again')),
+    ("Step", ("step", "long", "time")) # time requests typically ask about step-specific methods
+)
+
+# topic keywords (matched case-sensitively, as Conversation.handle_request did)
+TOPIC_KEYWORDS = {
+    "ingredients": ('ingredients',),
+    "steps": ('steps', 'instructions', 'make this', 'make it', 'cook this', 'cook it'),
+    "tools": ('tools', 'equipment'),
+    "methods": ('methods',),
+    "time": ('time', 'long', 'duration'),
+}
+# order in which topics are checked for each request type
+GENERAL_TOPICS = tuple((topic, TOPIC_KEYWORDS[topic]) for topic in ("ingredients", "steps", "tools", "methods"))
+STEP_TOPICS = tuple((topic, TOPIC_KEYWORDS[topic]) for topic in ("methods", "ingredients", "time", "tools"))
+
+# navigation patterns of the original detect_navigation_type; the leading/trailing ".*" (and the optional trailing
+# "step"/"instruction" of the first Nth pattern) are dropped since they never change whether re.search finds a match
+NTH_STEP_PATTERNS = [
+    r"\b(?:go to|navigate to|move to|proceed to|take me to)\b.*\b((\d+)(?:st|nd|rd|th)?|first|last)\b",
+    r"\b(?:go to|navigate to|move to|proceed to|take me to)\b \b(?:step|instruction)\b \b(\d+)\b",
+    r"step \d+"
+]
+NAVIGATION_PATTERNS = [
+    ("Nth", re.compile("|".join(f"(?:{pattern})" for pattern in NTH_STEP_PATTERNS), re.IGNORECASE)),
+    ("Next", re.compile(r"\b(next|proceed|move|advance)\b", re.IGNORECASE)),
+    ("Previous", re.compile(r"\b(previous|go back|return|back to|last|prior)\b", re.IGNORECASE)),
+    ("Current", re.compile(r"\b(repeat|redo|again|once more|do over)\b", re.IGNORECASE)),
+]
+STEP_NUMBER_REGEX = re.compile(r"step \d+", re.IGNORECASE)
+DIGITS_REGEX = re.compile(r"\d+")
+
+PRECURSOR_WORDS = frozenset(["do", "make", "cook", "prepare", "get", "of", "replace"])
+DEMONSTRATIVES = frozenset(["this", "that", "these", "those", "it"])
+REFERENCE_WORDS = frozenset(["step", "ingredient", "tool", "method"])
+
+# step_number value for "the last step"; resolved against the recipe by the caller
+LAST_STEP = -1
+
+def first_match(keyword_table, text):
+    """
+    Return the first name in a ((name, keywords), ...) table with a keyword occurring in text, or None.
+    """
+    for name, keywords in keyword_table:
+        for keyword in keywords:
+            if keyword in text:
+                return name
+    return None
+
+def extract_demonstrative_reference(text):
+    """
+    Return (precursor, demonstrative, reference) for vague references like "how do I cook that?"
+    (as the original QuestionHandler.extract_demonstrative_reference did).
+    """
+    words = text.lower().split()
+    for i, word in enumerate(words):
+        if word not in DEMONSTRATIVES:
+            continue
+        # precursor before the demonstrative, reference word after it
+        if i > 0 and words[i-1] in PRECURSOR_WORDS:
+            if i+1 < len(words) and words[i+1] in REFERENCE_WORDS:
+                return (words[i-1], word, words[i+1])
+            return (words[i-1], word, None)
+        # precursor after the demonstrative, reference word after the precursor
+        elif i+1 < len(words) and words[i+1] in PRECURSOR_WORDS:
+            if i+2 < len(words) and words[i+2] in REFERENCE_WORDS:
+                return (words[i+1], word, words[i+2])
+            return (words[i+1], word, None)
+        # no precursor
+        else:
+            if i+1 < len(words) and words[i+1] in REFERENCE_WORDS:
+                return (None, word, words[i+1])
+            return (None, word, None)
+    return (None, None, None)
+
+def extract_step_number(lower_request):
+    """
+    Step number of an Nth navigation request: 1 for "first", LAST_STEP for "last", else the first number (or None).
+    """
+    if 'first' in lower_request:
+        return 1
+    if 'last' in lower_request:
+        return LAST_STEP
+    step_numbers = DIGITS_REGEX.findall(lower_request)
+    return int(step_numbers[0]) if step_numbers else None
+
+class Intent:
+    """
+    Result of classifying one message:
+        kind: "General", "Navigation" or "Step"
+        topic: "ingredients", "steps", "tools", "methods" or "time" (General/Step requests), or None
+        navigation: "Nth", "Next", "Previous", "Current" or "Unknown" (Navigation requests)
+        step_number: requested step for Nth navigation (LAST_STEP for the last step)
+        reference: (precursor, demonstrative, reference) for General requests without a topic
+    """
+    __slots__ = ("kind", "topic", "navigation", "step_number", "reference")
+
+    def __init__(self, kind, topic=None, navigation=None, step_number=None, reference=None):
+        self.kind = kind
+        self.topic = topic
+        self.navigation = navigation
+        self.step_number = step_number
+        self.reference = reference
+
+    def __repr__(self):
+        return f"Intent({self.kind}, topic={self.topic}, navigation={self.navigation}, step_number={self.step_number}, reference={self.reference})"
+
+def classify_request_type(request, lower_request=None):
+    lower_request = request.lower() if lower_request is None else lower_request
+    request_type = first_match(REQUEST_TYPE_KEYWORDS, lower_request)
+    if request_type == "Step" and STEP_NUMBER_REGEX.search(request): # any request involving step & number should be navigation
+        return "Navigation"
+    # if no request type match found, classify as general request
+    return request_type or "General"
+
+def classify_navigation(request):
+    for navigation_type, regex in NAVIGATION_PATTERNS:
+        if regex.search(request):
+            return navigation_type
+    return "Unknown"
+
+def navigation_intent(request):
+    """
+    Classify a message known to be a navigation request.
+    """
+    navigation = classify_navigation(request)
+    step_number = extract_step_number(request.lower()) if navigation == "Nth" else None
+    return Intent("Navigation", navigation=navigation, step_number=step_number)
+
+def classify(request):
+    """
+    Classify a user message into an Intent.
+    """
+    lower_request = request.lower()
+    kind = classify_request_type(request, lower_request)
+    if kind == "Navigation":
+        return navigation_intent(request)
+    topic = first_match(GENERAL_TOPICS if kind == "General" else STEP_TOPICS, request)
+    reference = extract_demonstrative_reference(request) if kind == "General" and topic is None else None
+    return Intent(kind, topic=topic, reference=reference)
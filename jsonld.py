@@ -0,0 +1,96 @@
+import re
+import json
+
+"""
+Jsonld module finds the recipe JSON-LD in a page without building a DOM.
+
+AllRecipes pages are large, but the recipe lives in a single <script type="application/ld+json"> block near the top.
+JsonLdScanner is fed the page text chunk by chunk (e.g. straight from the HTTP response), picks out ld+json script
+blocks with a regex, and stops as soon as one of them contains a Recipe entity. Only the unscanned tail of the page
+is buffered, so most of the page never has to be downloaded or held in memory.
+"""
+
+SCRIPT_OPEN = re.compile(r"<script\b[^>]*\btype\s*=\s*[\"']?application/ld\+json[\"']?[^>]*>", re.IGNORECASE)
+SCRIPT_CLOSE = re.compile(r"</script\s*>", re.IGNORECASE)
+
+def find_recipe_entity(json_data):
+    """
+    Return the Recipe entity from parsed JSON-LD (a single entity or a list of entities), or None.
+    """
+    if isinstance(json_data, list):
+        for entry in json_data:
+            # get recipe if in list
+            if isinstance(entry, dict) and "Recipe" in entry.get("@type", []):
+                return entry
+    # otherwise get recipe
+    elif isinstance(json_data, dict) and "Recipe" in json_data.get("@type", []):
+        return json_data
+    return None
+
+class JsonLdScanner:
+    def __init__(self):
+        self.buffer = ""
+        self.recipe = None
+        self.malformed = False # set if an ld+json block could not be decoded
+
+    def feed(self, chunk):
+        """
+        Scan the next chunk of page text.
+        Returns the Recipe entity once it has been found (and on every later call), otherwise None.
+        """
+        if self.recipe is not None:
+            return self.recipe
+        self.buffer += chunk
+        while True:
+            open_match = SCRIPT_OPEN.search(self.buffer)
+            if not open_match:
+                # keep only a possible partial "<script ..." at the end of the buffer
+                cut = self.buffer.rfind("<")
+                self.buffer = self.buffer[cut:] if cut != -1 else ""
+                return None
+            close_match = SCRIPT_CLOSE.search(self.buffer, open_match.end())
+            if not close_match:
+                # block not complete yet: wait for more text
+                self.buffer = self.buffer[open_match.start():]
+                return None
+            block = self.buffer[open_match.end():close_match.start()]
+            self.buffer = self.buffer[close_match.end():]
+            try:
+                recipe = find_recipe_entity(json.loads(block))
+            except ValueError:
+                self.malformed = True
+                continue
+            if recipe is not None:
+                self.recipe = recipe
+                self.buffer = ""
+                return recipe
+
+def extract_json_ld_from_chunks(chunks, reload=None):
+    """
+    Return the Recipe entity from an iterable of page text chunks, stopping early once it is found.
+    Only the scanner's unscanned tail is held in memory, never the whole page. When a block could not be
+    decoded (malformed JSON), falls back to the BeautifulSoup path (parse.extract_json_ld) on the page returned
+    by reload(), e.g. a second download; without reload the result is None.
+    """
+    scanner = JsonLdScanner()
+    for chunk in chunks:
+        if scanner.feed(chunk) is not None:
+            return scanner.recipe
+    if reload is None or not scanner.malformed:
+        return None
+    return extract_json_ld_from_soup_text(reload())
+
+def extract_json_ld_from_html(html, chunk_size=64 * 1024):
+    """
+    Return the Recipe entity from a complete page.
+    """
+    return extract_json_ld_from_chunks((html[i:i + chunk_size] for i in range(0, len(html), chunk_size)), reload=lambda: html)
+
+def extract_json_ld_from_soup_text(html):
+    from bs4 import BeautifulSoup
+    from parse import extract_json_ld
+    try:
+        return extract_json_ld(BeautifulSoup(html, 'html.parser'))
+    except (ValueError, TypeError):
+        # TypeError: a script tag without a single string child (script.string is None)
+        return None
@@ -0,0 +1,96 @@
+import os
+import re
+
+r"""
+Lexicon module compiles the vocabularies used by parse.py (tools, methods, descriptors, preparations, units)
+once, at import time, from the editable word lists in data/lexicons/<name>.txt.
+
+Each list is compiled into a single regex shaped like a trie (terms sharing a prefix share a branch),
+so a lookup only follows the branch that matches the text instead of trying every term in turn;
+growing a list to thousands of terms barely changes the cost per sentence.
+The trie keeps the semantics of the plain alternation r"\b(term1|term2|...)\b" it replaces:
+when several terms match at the same position, the one listed first in the file wins.
+"""
+
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "lexicons")
+
+def read_terms(path):
+    """
+    Read one term per line, skipping blank lines and # comments.
+    """
+    terms = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            term = line.strip()
+            if term and not term.startswith("#"):
+                terms.append(term)
+    return terms
+
+def trie_pattern(terms):
+    """
+    Build a regex (without capturing groups) equivalent to "|".join(map(re.escape, terms)),
+    including the order in which the regex engine tries alternatives.
+
+    At each trie node, the term ending there must be tried before the longer terms listed after it and after
+    the longer terms listed before it, so child branches are split around the ending term's position.
+    """
+    ranked = []
+    seen = set()
+    for rank, term in enumerate(terms):
+        if term not in seen:
+            seen.add(term)
+            ranked.append((term, rank))
+    return _node_pattern(ranked)
+
+def _node_pattern(ranked):
+    end_rank = next((rank for suffix, rank in ranked if suffix == ""), None)
+    rest = [(suffix, rank) for suffix, rank in ranked if suffix]
+    if end_rank is None:
+        parts = _branch_patterns(rest)
+    else:
+        parts = (_branch_patterns([(s, r) for s, r in rest if r < end_rank]) + [""]
+                 + _branch_patterns([(s, r) for s, r in rest if r > end_rank]))
+    if len(parts) == 1:
+        return parts[0]
+    return "(?:" + "|".join(parts) + ")"
+
+def _branch_patterns(ranked):
+    branches = {} # first character -> [(remaining suffix, rank)], in order of first appearance
+    for suffix, rank in ranked:
+        branches.setdefault(suffix[0], []).append((suffix[1:], rank))
+    return [re.escape(char) + _node_pattern(children) for char, children in branches.items()]
+
+class Lexicon:
+    """
+    A compiled vocabulary, matched on word boundaries.
+    """
+    def __init__(self, name, terms):
+        self.name = name
+        self.terms = tuple(terms)
+        self.pattern = trie_pattern(self.terms) # usable inside larger regexes
+        self.regex = re.compile(rf"\b({self.pattern})\b")
+
+    def findall(self, text):
+        r"""
+        Return every term found in text, like re.findall(r"\b(term1|term2|...)\b", text).
+        """
+        return self.regex.findall(text)
+
+    def search(self, text):
+        """
+        Return the first term found in text, or None.
+        """
+        match = self.regex.search(text)
+        return match.group(1) if match else None
+
+    def __len__(self):
+        return len(self.terms)
+
+def load_lexicon(name, directory=LEXICON_DIR):
+    return Lexicon(name, read_terms(os.path.join(directory, f"{name}.txt")))
+
+TOOLS = load_lexicon("tools")
+METHODS = load_lexicon("methods")
+DESCRIPTORS = load_lexicon("descriptors")
+PREPARATIONS = load_lexicon("preparations")
+UNITS = load_lexicon("units")
@@ -1,13 +1,15 @@
 import re
 import json
 from conversation import Conversation
-from parse import fetch_recipe, extract_json_ld, parse_recipe, recipe_to_json
+from recipe_cache import RecipeCache, recipe_id_from_url
+from instrumentation import setup_logging
 
 def is_valid_allrecipes_url(url):
     """Validate if the URL is from allrecipes.com"""
     return re.match(r'^https?://(www\.)?allrecipes\.com/recipe/\d+/[^/]+/?$', url)
 
 def main():
+    setup_logging()
     # prompt for user input
     print("Please specify a URL.")
     url = input().strip()
@@ -15,20 +17,26 @@ def main():
     if not is_valid_allrecipes_url(url):
         print("The URL must be from allrecipes.com.")
         return
-    # attempt to fetch and parse url
+    # attempt to fetch and parse url (unless we've parsed this recipe before)
+    cache = RecipeCache()
     try:
-        soup = fetch_recipe(url)
-        json_data = extract_json_ld(soup)
-        if not json_data:
-            print("Could not find a valid recipe in the provided URL.")
-            return
-        # parse recipe
-        recipe = parse_recipe(json_data)
-        # if json easier to work with, add line below and refer to jsn in convo
-        jsn = recipe_to_json(recipe)
+        recipe_id = recipe_id_from_url(url)
+        jsn = cache.get(recipe_id)
+        if jsn is None:
+            # parse (and the libraries it needs) is only imported once there is a recipe to parse
+            from parse import fetch_recipe_json_ld, parse_recipe, recipe_to_json
+            json_data = fetch_recipe_json_ld(url)
+            if not json_data:
+                print("Could not find a valid recipe in the provided URL.")
+                return
+            # parse recipe
+            recipe = parse_recipe(json_data)
+            # if json easier to work with, add line below and refer to jsn in convo
+            jsn = recipe_to_json(recipe)
+            cache.put(recipe_id, jsn)
         conversation = Conversation(jsn) # Conversation() assumes recipe object in JSON format ATM
 
-        print(f"Bot: Alright. So let's start working with \"{recipe.title}\". What do you want to do?")
+        print(f"Bot: Alright. So let's start working with \"{jsn['title']}\". What do you want to do?")
         print("\n[1] Go over ingredients list")
         print("[2] Go over recipe steps.")
         # simulate user choice
@@ -50,6 +58,8 @@ def main():
 
     except Exception as e:
         print(f"An error occurred: {e}")
+    finally:
+        cache.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,99 @@
+import os
+import time
+import logging
+import resource
+import threading
+
+"""
+nlp_model module owns the spaCy pipeline for the whole process.
+
+The model is loaded lazily on first use and then shared by parse.py and every Conversation,
+so starting a new conversation never pays for another model load.
+Only the pipeline components we actually use are loaded:
+    - tok2vec + parser are kept, since parse_steps relies on doc.sents (parser-based sentence boundaries)
+    - tagger, attribute_ruler, lemmatizer, ner and senter are excluded
+
+Sentence segmentation has two modes, selected per call or with the RECIPEBOT_SEGMENTATION environment variable:
+    - "accurate" (default): the parser of en_core_web_lg decides sentence boundaries
+    - "fast": a blank English tokenizer + rule-based sentencizer, no model weights at all
+"""
+
+MODEL_NAME = "en_core_web_lg"
+EXCLUDED_COMPONENTS = ["tagger", "attribute_ruler", "lemmatizer", "ner", "senter"]
+
+SEGMENTATION_MODES = ("accurate", "fast")
+DEFAULT_SEGMENTATION = os.getenv("RECIPEBOT_SEGMENTATION", "accurate")
+
+log = logging.getLogger(__name__)
+
+_nlp = None
+_sentencizer = None
+_load_lock = threading.Lock()
+_load_stats = {}
+
+def current_rss_mb():
+    """
+    Return the resident set size of this process in MB.
+    Reads /proc/self/statm where available, falling back to the peak RSS reported by getrusage.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def get_nlp():
+    """
+    Return the process-wide spaCy pipeline, loading it on first call.
+    Thread-safe: concurrent first callers wait for a single load.
+    """
+    global _nlp
+    if _nlp is None:
+        with _load_lock:
+            if _nlp is None:
+                import spacy
+                rss_before = current_rss_mb()
+                start = time.perf_counter()
+                nlp = spacy.load(MODEL_NAME, exclude=EXCLUDED_COMPONENTS)
+                _load_stats.update({
+                    "model": MODEL_NAME,
+                    "components": list(nlp.pipe_names),
+                    "load_seconds": time.perf_counter() - start,
+                    "rss_delta_mb": current_rss_mb() - rss_before,
+                })
+                log.info("Loaded %s %s in %.2fs (+%.1f MB RSS)", MODEL_NAME, nlp.pipe_names, _load_stats['load_seconds'], _load_stats['rss_delta_mb'])
+                _nlp = nlp
+    return _nlp
+
+def get_sentencizer():
+    """
+    Return the process-wide rule-based sentence splitter used by the "fast" segmentation mode.
+    """
+    global _sentencizer
+    if _sentencizer is None:
+        with _load_lock:
+            if _sentencizer is None:
+                import spacy
+                sentencizer = spacy.blank("en")
+                sentencizer.add_pipe("sentencizer")
+                _sentencizer = sentencizer
+    return _sentencizer
+
+def get_segmenter(mode=None):
+    """
+    Return the pipeline used to split instructions into sentences for the given segmentation mode.
+    """
+    mode = mode or DEFAULT_SEGMENTATION
+    if mode == "fast":
+        return get_sentencizer()
+    if mode == "accurate":
+        return get_nlp()
+    raise ValueError(f"Unknown segmentation mode: {mode} (expected one of {SEGMENTATION_MODES})")
+
+def model_stats():
+    """
+    Return load time and memory figures for the shared model (empty dict if not loaded yet).
+    """
+    return dict(_load_stats)
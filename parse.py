@@ -1,15 +1,17 @@
 import re
 import json
-import spacy
-import requests
-import Levenshtein
-from bs4 import BeautifulSoup
+from fetcher import get_session, TIMEOUTS
 from representation import Ingredient, Step, Recipe
+from nlp_model import get_segmenter
+from jsonld import find_recipe_entity, extract_json_ld_from_chunks
+from lexicon import TOOLS, METHODS, DESCRIPTORS, PREPARATIONS, UNITS
 
-nlp = spacy.load('en_core_web_lg')
+# numpy, rapidfuzz and BeautifulSoup are imported where they are used: they are the bulk of this module's
+# import time, and the bot should connect before paying it (see warm_up)
 
 def fetch_recipe(url):
-    response = requests.get(url)
+    from bs4 import BeautifulSoup
+    response = get_session().get(url, timeout=TIMEOUTS)
     if response.status_code == 200:
         return BeautifulSoup(response.text, 'html.parser')
     else:
@@ -19,17 +21,28 @@ def extract_json_ld(soup):
     script_tag = soup.find('script', {'type': 'application/ld+json'})
     if script_tag:
         json_data = json.loads(script_tag.string)
-        # check if JSON-LD is a list
-        if isinstance(json_data, list):
-            for entry in json_data:
-                # get recipe if in list
-                if "Recipe" in entry.get("@type", []):
-                    return entry
-        # otherwise get recipe
-        elif "Recipe" in json_data.get("@type", []):
-            return json_data
+        # get recipe from a single entity or a list of entities
+        return find_recipe_entity(json_data)
     return None
 
+def fetch_recipe_json_ld(url):
+    """
+    Fetch a recipe page and return its Recipe JSON-LD without building the full BeautifulSoup tree.
+    The response is streamed and the download stops as soon as the recipe block has been read (see jsonld.py);
+    if no block can be read, the page is downloaded again in full for the BeautifulSoup fallback.
+    """
+    with get_session().get(url, stream=True, timeout=TIMEOUTS) as response:
+        if response.status_code != 200:
+            raise ValueError("Could not fetch the webpage. Please check the URL.")
+        response.encoding = response.encoding or 'utf-8'
+        return extract_json_ld_from_chunks(response.iter_content(chunk_size=64 * 1024, decode_unicode=True),
+                                           reload=lambda: get_session().get(url, timeout=TIMEOUTS).text)
+
+# measurements in parentheses, e.g. "1 (28 ounce) can crushed tomatoes"
+PARENTHESIS_REGEX = re.compile(r"(\d+/\d+|\d+\.\d+|\d+)?\s*\((.*?)\)\s*(.*)")
+# name, quantity (fractional or decimal), and measurement unit
+QUANTITY_REGEX = re.compile(rf"(\d+/\d+|\d+\.\d+|\d+)?\s*(\b{UNITS.pattern}\b)?\s*(.*)")
+
 def parse_ingredients(json_data):
     ingredients = []
     raw_ingredients = []
@@ -46,8 +59,7 @@ def parse_ingredients(json_data):
             item = item.replace("to taste", "").strip()
             quantity = "to taste"
         # handle measurements in parentheses
-        parenthesis_pattern = r"(\d+/\d+|\d+\.\d+|\d+)?\s*\((.*?)\)\s*(.*)"
-        match_parenthesis = re.match(parenthesis_pattern, item)
+        match_parenthesis = PARENTHESIS_REGEX.match(item)
         if match_parenthesis:
             # extract name, quantity, measurement
             name = match_parenthesis.group(3).strip()
@@ -55,58 +67,56 @@ def parse_ingredients(json_data):
             measurement = match_parenthesis.group(2).strip()
         # regex to extract name, quantity (fractional or decimal), and measurement
         else:
-            pattern = r"(\d+/\d+|\d+\.\d+|\d+)?\s*(\b(?:cup|cups|teaspoon|teaspoons|tbsp|tablespoon|tablespoons|oz|ounce|ounces|pound|pounds|g|grams|kg|kilograms|ml|milliliters|l|liters|handful|pinch|pinches|dash|dashes|slice|slices|clove|cloves|package|packages|piece|pieces|milligrams|tsp|quart|quarts|pint|pints|fluid ounce|fluid ounces|gal|gallon|gallons|dl)\b)?\s*(.*)"
-            match = re.match(pattern, item)
+            match = QUANTITY_REGEX.match(item)
             name = match.group(3).strip() if match and match.group(3) else item.strip()
             prev = quantity
             quantity = match.group(1).strip() if match and match.group(1) else prev
             measurement = match.group(2).strip() if match and match.group(2) else None
         # regex for descriptors and preparation
-        descriptor_pattern = r"\b(fresh|extra-virgin|dehydrated|heirloom|aged|low-fat|reduced-fat|lean|package|packages|packaged|packed|box|boxed|jar|jarred|jars|ripe|can|cans|canned|frozen|organic|large|small|medium|smoked|thick-cut|thinly|boneless|skinless|bone-in)\b"
-        descriptor_match = re.search(descriptor_pattern, name.lower())
+        descriptor_match = DESCRIPTORS.search(name.lower())
         if descriptor_match:
-            descriptor = descriptor_match.group(0).strip()
+            descriptor = descriptor_match.strip()
             name = name.replace(descriptor, "").strip()
-        preparation_pattern = r"\b(finely chopped|chopped|shredded|divided|finely shredded|minced|sliced|diced|grated|ground|julienned|peeled|squeezed|dried|roughly chopped|roughly diced|pureed|smashed|zested|beaten|marinated|mashed|sliced thinly|halved|quartered|cut into chunks|brushed|trimmed|cored|cubed|butterflied|crushed)\b"
-        preparation_match = re.search(preparation_pattern, name.lower())
+        preparation_match = PREPARATIONS.search(name.lower())
         if preparation_match:
-            preparation = preparation_match.group(0).strip()
+            preparation = preparation_match.strip()
             name = name.replace(preparation, "").strip()
         # format ingredient
         ingredient = Ingredient(name, quantity, measurement, descriptor, preparation)
         ingredients.append(ingredient)
     return raw_ingredients, ingredients
 
-# parse time info for a given step
-def parse_time(sentence):   
-    # Patterns to match durations and conditional phrases
-    time_patterns = [
-        r"\d+\s*(?:more)?\s*(?:second[s]?|minute[s]?|hour[s]?|sec|min|hr[s]?)",  # Numeric durations with units
-        r"about\s+\d+\s*(?:second[s]?|minute[s]?|hour[s]?)",         # Approximate durations
-        r"for\s+\d+\s*(?:second[s]?|minute[s]?|hour[s]?)"            # 'for X time'
-    ] 
-
-    # Patterns to match conditions
-    condition_patterns = [
-        r"until\s+[\w\s]+",        # Conditions like 'until golden brown'
-        r"once\s+[\w\s]+",         # Conditions like 'once dissolved'
-        r"when\s+[\w\s]+"          # Conditions like 'when bubbly'
-    ] 
-
-    # Compile the patterns
-    time_regex = re.compile("|".join(time_patterns), re.IGNORECASE)
-    condition_regex = re.compile("|".join(condition_patterns), re.IGNORECASE)
+# Patterns to match durations and conditional phrases
+TIME_PATTERNS = [
+    r"\d+\s*(?:more)?\s*(?:second[s]?|minute[s]?|hour[s]?|sec|min|hr[s]?)",  # Numeric durations with units
+    r"about\s+\d+\s*(?:second[s]?|minute[s]?|hour[s]?)",         # Approximate durations
+    r"for\s+\d+\s*(?:second[s]?|minute[s]?|hour[s]?)"            # 'for X time'
+]
 
+# Patterns to match conditions
+CONDITION_PATTERNS = [
+    r"until\s+[\w\s]+",        # Conditions like 'until golden brown'
+    r"once\s+[\w\s]+",         # Conditions like 'once dissolved'
+    r"when\s+[\w\s]+"          # Conditions like 'when bubbly'
+]
+
+# Compiled once, not per sentence
+TIME_REGEX = re.compile("|".join(TIME_PATTERNS), re.IGNORECASE)
+CONDITION_REGEX = re.compile("|".join(CONDITION_PATTERNS), re.IGNORECASE)
+TIME_PREFIX_REGEX = re.compile(r"^(for|about)\s+", re.IGNORECASE)
+
+# parse time info for a given step
+def parse_time(sentence):
     # Find all matches
-    times = time_regex.findall(sentence)
-    conditions = condition_regex.findall(sentence)
+    times = TIME_REGEX.findall(sentence)
+    conditions = CONDITION_REGEX.findall(sentence)
 
     # Extract structured results
         # duration : time value (for 10 minutes)
         # condition : condition value (until brown)
     time_info = {} 
     for time in times:
-        cleaned_time = re.sub(r"^(for|about)\s+", "", time, flags=re.IGNORECASE)
+        cleaned_time = TIME_PREFIX_REGEX.sub("", time)
         time_info['duration'] = cleaned_time.strip()
     if not times: 
         time_info['duration'] = None
@@ -119,54 +129,103 @@ def parse_time(sentence):
 
     return time_info
 
-def parse_steps(json_data, ingredient_names):
-    steps = []
-    instructions = json_data.get("recipeInstructions", [])
-    step_counter = 1
-    for step in instructions:
-        text = step.get("text", "").strip()
-        # split sentences using regex and spacy
-        doc = nlp(text)
+def instruction_texts(json_data):
+    return [step.get("text", "").strip() for step in json_data.get("recipeInstructions", [])]
+
+def segment_instructions(texts, mode=None):
+    """
+    Split instruction texts into sentences (and sub-sentences at ';'), returning one list of sentences per text.
+    All texts go through a single batched nlp.pipe call; see nlp_model.get_segmenter for the available modes.
+    """
+    nlp = get_segmenter(mode)
+    segmented = []
+    for doc in nlp.pipe(texts, batch_size=256):
         sentences = []
         for sent in doc.sents:
             sub_sentences = re.split(r'[;]', sent.text)
             sub_sentences = [sub_sentence.strip() for sub_sentence in sub_sentences if sub_sentence.strip()]
             sentences.extend(sub_sentences)
-        for sub_text in sentences:
-            if not sub_text:
-                continue
-            # regex for tools and methods
-            tools_pattern = r"\b(oven|pot|skillet|baking pan|bowl|plate|aluminum foil|foil|tray|sheet|whisk|spatula|strainer|ladle|colander|saucepan|grater|microplane|peeler|tongs|mortar|pestle|slotted spoon|mandoline|rolling pin|measuring cup|measuring spoon|baster|mixing bowl|blender|pressure cooker|air fryer)\b"
-            tools = list(set(re.findall(tools_pattern, sub_text.lower())))
-            methods_pattern = r"\b(preheat|boil|cook|stir|mix|layer|bake|drain|broil|poach|roast|grill|steam|sear|saute|braise|whisk|knead|caramelize|marinate|simmer|parboil|blanch|whip|fold|beat|blend|pulse|scald|deglaze|fillet|infuse|deep-fry|deep fry|score|smoke)\b"
-            methods = list(set(re.findall(methods_pattern, sub_text.lower())))
-            # handle ingredients
-            ingredients = list(set(filter(lambda ingredient: ingredient.lower() in sub_text.lower(), ingredient_names)))
-            for ingredient in ingredient_names:
-                for word in sub_text.lower().split():
-                    # use Levenshtein to compare word similarity with the ingredient
-                    similarity = Levenshtein.ratio(word, ingredient.lower())
-                    if similarity >= 0.6 and ingredient not in ingredients:
-                        ingredients.append(ingredient)
-                        break
-            # handle time
-            time = parse_time(sub_text)                
-            
-            # create step object and add to list of steps
-            step_obj = Step(step_number=step_counter, text=sub_text, ingredients=ingredients, tools=tools, methods=methods, time=time)
-            steps.append(step_obj)
-            step_counter += 1
+        segmented.append(sentences)
+    return segmented
+
+# minimum Levenshtein ratio (normalized Indel similarity) for a word to count as a mention of an ingredient
+INGREDIENT_SIMILARITY_THRESHOLD = 0.6
+
+def fuzzy_ingredient_matches(sentence_words, ingredient_lowers):
+    """
+    For each sentence (given as a list of lowercase words), return a boolean array marking the ingredients
+    that some word of the sentence matches with a Levenshtein ratio >= INGREDIENT_SIMILARITY_THRESHOLD.
+    Every distinct word of the recipe is scored against every ingredient name in one RapidFuzz cdist call.
+    """
+    import numpy as np
+    from rapidfuzz import process
+    from rapidfuzz.distance import Indel
+    vocabulary = {}
+    for words in sentence_words:
+        for word in words:
+            vocabulary.setdefault(word, len(vocabulary))
+    if not vocabulary or not ingredient_lowers:
+        return [np.zeros(len(ingredient_lowers), dtype=bool) for _ in sentence_words]
+    # score_cutoff is inclusive (score >= cutoff) like Levenshtein.ratio(...) >= 0.6, but it only zeroes the scores below it;
+    # the threshold is applied once to the full matrix instead
+    scores = process.cdist(list(vocabulary), ingredient_lowers, scorer=Indel.normalized_similarity, dtype=np.float64)
+    matches = scores >= INGREDIENT_SIMILARITY_THRESHOLD
+    return [matches[[vocabulary[word] for word in words]].any(axis=0) for words in sentence_words]
+
+def parse_steps(json_data, ingredient_names, mode=None, segmented=None):
+    """
+    Parse recipe instructions into Step objects.
+    segmented may hold the output of segment_instructions for this recipe (e.g. a batch of recipes segmented together, see benchmarks/bench_segmentation.py).
+    """
+    steps = []
+    if segmented is None:
+        segmented = segment_instructions(instruction_texts(json_data), mode)
+    sentences = [sub_text for texts in segmented for sub_text in texts if sub_text]
+    lowered = [sub_text.lower() for sub_text in sentences]
+    ingredient_lowers = [ingredient.lower() for ingredient in ingredient_names]
+    fuzzy_matches = fuzzy_ingredient_matches([text.split() for text in lowered], ingredient_lowers)
+    step_counter = 1
+    for sub_text, lower_text, fuzzy_match in zip(sentences, lowered, fuzzy_matches):
+        # tools and methods (see lexicon.py)
+        tools = list(set(TOOLS.findall(lower_text)))
+        methods = list(set(METHODS.findall(lower_text)))
+        # handle ingredients: exact substring mentions first, then fuzzy word matches
+        ingredients = list(set(ingredient for ingredient, lower in zip(ingredient_names, ingredient_lowers) if lower in lower_text))
+        for ingredient, matched in zip(ingredient_names, fuzzy_match):
+            if matched and ingredient not in ingredients:
+                ingredients.append(ingredient)
+        # handle time
+        time = parse_time(sub_text)                
+        
+        # create step object and add to list of steps
+        step_obj = Step(step_number=step_counter, text=sub_text, ingredients=ingredients, tools=tools, methods=methods, time=time)
+        steps.append(step_obj)
+        step_counter += 1
     return steps
 
-def parse_recipe(json_data):
+def parse_recipe_head(json_data):
+    """
+    Parse only the title and ingredients of a recipe (cheap, no spaCy); the returned Recipe has no steps.
+    """
     title = json_data.get("name", "Unknown Title")
     raw_ingredients, ingredients = parse_ingredients(json_data)
-    ingredient_names = [ing.name for ing in ingredients]
-    steps = parse_steps(json_data, ingredient_names)
-    return Recipe(title=title, raw_ingredients= raw_ingredients, ingredients=ingredients, steps=steps)
+    return Recipe(title=title, raw_ingredients= raw_ingredients, ingredients=ingredients, steps=[])
 
-def recipe_to_json(recipe):
-    recipe_dict = {
+def parse_recipe(json_data, mode=None, segmented=None, head=None):
+    """
+    Parse a recipe. head may hold the output of parse_recipe_head for this recipe, so ingredients are not parsed twice.
+    """
+    if head is None:
+        head = parse_recipe_head(json_data)
+    ingredient_names = [ing.name for ing in head.ingredients]
+    steps = parse_steps(json_data, ingredient_names, mode, segmented)
+    return Recipe(title=head.title, raw_ingredients=head.raw_ingredients, ingredients=head.ingredients, steps=steps)
+
+def recipe_head_to_json(recipe):
+    """
+    The title and ingredients part of recipe_to_json, available before the steps are parsed.
+    """
+    return {
         "title": recipe.title,
         "raw_ingredients": [
             ing for ing in recipe.raw_ingredients
@@ -181,6 +240,11 @@ def recipe_to_json(recipe):
             }
             for ing in recipe.ingredients
         ],
+    }
+
+def recipe_to_json(recipe):
+    recipe_dict = recipe_head_to_json(recipe)
+    recipe_dict.update({
         "tools": list(set({tool for step in recipe.steps for tool in step.tools})),
         "methods": list(set({method for step in recipe.steps for method in step.methods})),
         "steps": [
@@ -197,7 +261,7 @@ def recipe_to_json(recipe):
             }
             for step in recipe.steps
         ]
-    }
+    })
     return recipe_dict
 
 
@@ -229,3 +293,18 @@ if recipe_data:
 else:
     print("No recipe data found in the JSON-LD.")
 '''
+
+# a tiny recipe run through every parse stage by warm_up
+WARM_UP_RECIPE = {
+    "name": "Buttered Toast",
+    "recipeIngredient": ["2 slices white bread", "1 tablespoon butter, softened"],
+    "recipeInstructions": [{"text": "Toast the bread in a toaster for 2 minutes. Spread with butter; serve warm."}],
+}
+
+def warm_up(mode=None):
+    """
+    Load everything parsing needs (segmentation pipeline, numpy, RapidFuzz, BeautifulSoup, lexicons) by parsing
+    a tiny recipe, so that the first real recipe does not pay for it.
+    """
+    import bs4
+    return recipe_to_json(parse_recipe(WARM_UP_RECIPE, mode))
@@ -0,0 +1,362 @@
+import os
+import sys
+import json
+import stat
+import errno
+import time
+import asyncio
+import logging
+import concurrent.futures
+from dotenv import load_dotenv
+from ingest import RecipeIngestor, IngestionError, PARSE_TIMEOUT
+from admission import ParseGate, AdmissionError
+from staged_recipe import StagedRecipe, RecipeParseError
+from recipe_cache import recipe_id_from_url
+from instrumentation import setup_logging, start_metrics_server, increment, register_collector
+
+"""
+Parse service: one local process that owns the spaCy model and the recipe cache, shared by every bot process.
+
+Run it with python parse_service.py; bot processes started with PARSE_SERVICE_SOCKET set (see app.py) send
+their ingestion requests to it instead of parsing themselves, so they only hold conversation state and
+parsing and chat handling can be scaled independently. The service also owns the one search index (see
+search_index.py) and answers the bots' !search queries, so no bot process builds a copy of it.
+
+Protocol: JSON Lines over a Unix socket (PARSE_SERVICE_SOCKET). Requests and responses carry an id, so one
+connection can have many requests in flight:
+    request:  {"id": 1, "url": "https://www.allrecipes.com/recipe/..."}
+    response: {"id": 1, "head": {...}}     title and ingredients, sent first if the steps are still being parsed
+              {"id": 1, "recipe": {...}}   the full recipe JSON (null if the page holds no recipe)
+              {"id": 1, "error": "...", "stage": "ingest" | "parse" | "request"}   a message that is safe to show to the user
+    request:  {"id": 2, "search": "chicken with a skillet in under 30 minutes", "limit": 10}
+    response: {"id": 2, "total": 42, "results": [[recipe_id, title, minutes or null], ...]}
+Ingestion itself is RecipeIngestor's (cache, single-flight, staged parse; see ingest.py).
+"""
+
+BAD_REQUEST_MESSAGE = "I'm sorry, I'm having trouble with that request. Please try again later."
+DEFAULT_SOCKET = os.getenv("PARSE_SERVICE_SOCKET", "/tmp/recipebot-parse.sock")
+MAX_LINE = 16 * 1024 * 1024 # bytes; a recipe JSON is far smaller, but asyncio's default 64 KB line limit is not enough
+CONNECT_TIMEOUT = 5 # seconds
+
+log = logging.getLogger(__name__)
+
+def encode(message):
+    return (json.dumps(message, separators=(',', ':'), ensure_ascii=False) + "\n").encode("utf-8")
+
+class ParseService:
+    def __init__(self, ingestor, path=DEFAULT_SOCKET, search_index=None):
+        self.ingestor = ingestor
+        self.path = path
+        self.search_index = search_index
+        self.server = None
+        self.inode = None # of the socket file this service bound, so close() never removes another service's
+        self.writers = set() # open connections, closed with the service
+        self.stats = {"connections": 0, "requests": 0, "searches": 0}
+
+    async def start(self):
+        """
+        Listen on the socket path. Raises OSError (EADDRINUSE) if a live service already answers there,
+        or if the path is not a socket; only a stale socket from a previous run is removed.
+        """
+        await self._remove_stale_socket()
+        self.server = await asyncio.start_unix_server(self.handle_connection, self.path, limit=MAX_LINE)
+        os.chmod(self.path, 0o600)
+        self.inode = os.stat(self.path).st_ino
+        log.info("Parse service listening on %s", self.path)
+
+    async def _remove_stale_socket(self):
+        try:
+            mode = os.stat(self.path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise OSError(errno.EADDRINUSE, f"{self.path} exists and is not a socket")
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_unix_connection(self.path), CONNECT_TIMEOUT)
+        except (OSError, asyncio.TimeoutError):
+            os.remove(self.path) # nobody listening: left over from a previous run
+            return
+        writer.close()
+        await writer.wait_closed()
+        raise OSError(errno.EADDRINUSE, f"A parse service is already listening on {self.path}")
+
+    async def handle_connection(self, reader, writer):
+        self.stats["connections"] += 1
+        self.writers.add(writer)
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+                if not isinstance(request, dict):
+                    log.warning("Ignoring malformed request: %r", line[:200])
+                    continue
+                task = asyncio.create_task(self.handle_request(request, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.writers.discard(writer)
+            writer.close()
+
+    async def send(self, writer, message):
+        # one write() per message, so concurrent responses never interleave
+        writer.write(encode(message))
+        await writer.drain()
+
+    async def handle_request(self, request, writer):
+        request_id = request.get("id")
+        if "search" in request:
+            await self.handle_search(request, writer)
+            return
+        self.stats["requests"] += 1
+        url = request.get("url")
+        if not isinstance(url, str):
+            log.warning("Rejecting request %r without a url", request_id)
+            await self.send(writer, {"id": request_id, "error": BAD_REQUEST_MESSAGE, "stage": "request"})
+            return
+        try:
+            recipe = await self.ingestor.ingest(url)
+        except (IngestionError, AdmissionError) as e:
+            await self.send(writer, {"id": request_id, "error": str(e), "stage": "ingest"})
+            return
+        except Exception as e:
+            increment("errors_total", stage="parse_service")
+            log.exception("Ingesting %s failed: %s", url, e)
+            await self.send(writer, {"id": request_id, "error": "I'm sorry, I'm having trouble with that recipe. Please try again later.", "stage": "ingest"})
+            return
+        if recipe and self.search_index is not None:
+            self.search_index.add_ingested(recipe_id_from_url(url), recipe)
+        if isinstance(recipe, StagedRecipe):
+            if not recipe.ready:
+                await self.send(writer, {"id": request_id, "head": recipe.head})
+                await asyncio.wait([asyncio.wrap_future(recipe.future)])
+            try:
+                recipe = recipe.result()
+            except RecipeParseError as e:
+                await self.send(writer, {"id": request_id, "error": str(e), "stage": "parse"})
+                return
+        await self.send(writer, {"id": request_id, "recipe": recipe})
+
+    async def handle_search(self, request, writer):
+        from search_index import parse_query
+        request_id = request.get("id")
+        self.stats["searches"] += 1
+        if self.search_index is None:
+            await self.send(writer, {"id": request_id, "error": "Search is not available right now.", "stage": "search"})
+            return
+        text, limit = request["search"], request.get("limit", 10)
+        if not isinstance(text, str) or not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+            log.warning("Rejecting malformed search request %r", request_id)
+            await self.send(writer, {"id": request_id, "error": BAD_REQUEST_MESSAGE, "stage": "request"})
+            return
+        total, results = self.search_index.search(parse_query(text), limit=limit)
+        await self.send(writer, {"id": request_id, "total": total, "results": results})
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            for writer in list(self.writers):
+                writer.close()
+            await self.server.wait_closed()
+        try:
+            if self.inode is not None and os.stat(self.path).st_ino == self.inode:
+                os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+class RemoteIngestor:
+    """
+    Client side of the parse service, with the interface app.py uses of RecipeIngestor (ingest, stats, close).
+    ingest returns a StagedRecipe while the service is still parsing the steps, like RecipeIngestor does;
+    search runs a !search query against the service's search index.
+    """
+    def __init__(self, path=DEFAULT_SOCKET, parse_timeout=PARSE_TIMEOUT):
+        self.path = path
+        self.parse_timeout = parse_timeout
+        self.reader = None
+        self.writer = None
+        self.reader_task = None
+        self.connect_lock = None
+        self.next_id = 0
+        self.pending = {} # request id -> asyncio.Future for the first response
+        self.staged = {} # request id -> concurrent.futures.Future for the full recipe
+        # requests sent; coalescing happens in the service, which reports it (ingest_requests_total there)
+        self.stats = {"started": 0}
+        self.ready = True # the service warms up before it accepts connections
+
+    async def _connect(self):
+        if self.connect_lock is None:
+            self.connect_lock = asyncio.Lock()
+        async with self.connect_lock:
+            if self.writer is not None and not self.writer.is_closing():
+                return
+            try:
+                self.reader, self.writer = await asyncio.wait_for(asyncio.open_unix_connection(self.path, limit=MAX_LINE), CONNECT_TIMEOUT)
+            except (OSError, asyncio.TimeoutError) as e:
+                log.warning("Parse service at %s unavailable: %s", self.path, e)
+                raise IngestionError("The recipe service is unavailable right now. Please try again in a moment.")
+            self.reader_task = asyncio.create_task(self._read_responses(self.reader))
+
+    async def _read_responses(self, reader):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    message = None
+                if not isinstance(message, dict):
+                    log.warning("Ignoring malformed response: %r", line[:200])
+                    continue
+                try:
+                    self._dispatch(message)
+                except Exception:
+                    # e.g. an unhashable id: drop the message, keep the connection
+                    log.exception("Ignoring unexpected response: %r", line[:200])
+        except (OSError, ValueError) as e:
+            log.warning("Lost the parse service connection: %s", e)
+        finally:
+            # fail everything still waiting on this connection
+            self.writer = None
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(IngestionError("The recipe service went away. Please try again."))
+            for future in self.staged.values():
+                if not future.done():
+                    future.set_exception(RecipeParseError("The recipe service went away. Please try again."))
+            self.pending.clear()
+            self.staged.clear()
+
+    def _dispatch(self, message):
+        request_id = message.get("id")
+        first = self.pending.pop(request_id, None)
+        if first is not None:
+            if first.done():
+                return # the caller was cancelled (see ingest): nobody waits for this recipe any more
+            if "head" in message:
+                # keep the full-recipe future registered before the caller is woken up
+                self.staged[request_id] = concurrent.futures.Future()
+            first.set_result(message)
+            return
+        staged = self.staged.pop(request_id, None)
+        if staged is None or staged.done():
+            return
+        if "error" in message:
+            staged.set_exception(RecipeParseError(message["error"]))
+        else:
+            staged.set_result(message.get("recipe"))
+
+    def start_warm_up(self, mode=None):
+        # nothing to load in the bot process; returns a finished Future like RecipeIngestor.start_warm_up
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
+
+    async def _request(self, payload):
+        # send a request and wait for its first response
+        await self._connect()
+        self.next_id += 1
+        request_id = self.next_id
+        first = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = first
+        try:
+            self.writer.write(encode(dict(payload, id=request_id)))
+            await self.writer.drain()
+        except (OSError, AttributeError):
+            self.pending.pop(request_id, None)
+            raise IngestionError("The recipe service is unavailable right now. Please try again in a moment.")
+        try:
+            return request_id, await first
+        except asyncio.CancelledError:
+            # e.g. shutdown or a handler timeout: the service's answer, when it comes, is dropped in _dispatch
+            self.pending.pop(request_id, None)
+            self.staged.pop(request_id, None)
+            raise
+
+    async def ingest(self, url):
+        self.stats["started"] += 1
+        started = time.perf_counter()
+        request_id, message = await self._request({"url": url})
+        if "error" in message:
+            raise IngestionError(message["error"])
+        if "head" in message:
+            return StagedRecipe(message["head"], self.staged[request_id], started, self.parse_timeout)
+        return message.get("recipe")
+
+    async def search(self, text, limit):
+        """
+        Return (total matches, [(recipe ID, title, minutes or None)]) for a !search query, like SearchIndex.search.
+        """
+        _, message = await self._request({"search": text, "limit": limit})
+        if "error" in message:
+            raise IngestionError(message["error"])
+        return message["total"], [tuple(result) for result in message["results"]]
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+
+async def build_search_index(search_index, recipe_cache):
+    loop = asyncio.get_running_loop()
+    try:
+        count = await loop.run_in_executor(None, search_index.add_all, recipe_cache.iter_recipes())
+        log.info("Search index built: %d recipes", count)
+    except Exception:
+        log.exception("Could not build the search index")
+
+async def serve(path=DEFAULT_SOCKET):
+    from recipe_cache import RecipeCache
+    from search_index import SearchIndex
+    recipe_cache = RecipeCache()
+    ingestor = RecipeIngestor(cache=recipe_cache, gate=ParseGate())
+    search_index = SearchIndex()
+    service = ParseService(ingestor, path, search_index)
+    register_collector("recipe_cache_lookups_total", "Recipe cache lookups by result.",
+                       lambda: {(("result", result),): count for result, count in recipe_cache.stats.items()}, kind="counter")
+    register_collector("parse_service_total", "Parse service connections, requests and searches.",
+                       lambda: {(("kind", kind),): count for kind, count in service.stats.items()}, kind="counter")
+    register_collector("ingest_requests_total", "Recipe ingestions started, or coalesced onto one in flight.",
+                       lambda: {(("outcome", outcome),): count for outcome, count in ingestor.stats.items()}, kind="counter")
+    register_collector("parse_slots", "Recipe parses running, or waiting for a slot.",
+                       lambda: {(("state", state),): count for state, count in ingestor.gate.stats().items()})
+    register_collector("search_index_recipes", "Recipes in the search index.", lambda: len(search_index))
+    # the search index is built from the cache in the background; searches meanwhile see the recipes indexed so far
+    indexing = asyncio.create_task(build_search_index(search_index, recipe_cache))
+    # load the model before accepting requests, so the first recipe is not slowed down by it
+    await ingestor.start_warm_up()
+    await service.start()
+    try:
+        await start_metrics_server(port=int(os.getenv("PARSE_METRICS_PORT", "9101")))
+    except OSError as e:
+        log.warning("Could not start the metrics endpoint: %s", e)
+    try:
+        await asyncio.Event().wait() # serve until interrupted
+    finally:
+        indexing.cancel()
+        await service.close()
+        await ingestor.close()
+        recipe_cache.close()
+
+if __name__ == "__main__":
+    load_dotenv()
+    setup_logging(os.getenv("LOG_LEVEL", "INFO"))
+    try:
+        asyncio.run(serve(os.getenv("PARSE_SERVICE_SOCKET", DEFAULT_SOCKET)))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        if e.errno != errno.EADDRINUSE:
+            raise
+        log.error("Not starting: %s", e.strerror)
+        sys.exit(1)
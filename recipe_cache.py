@@ -0,0 +1,208 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+"""
+Recipe cache module stores the JSON produced by recipe_to_json, keyed by the AllRecipes recipe ID
+(the number in https://www.allrecipes.com/recipe/<id>/<slug>/).
+
+Two tiers:
+    - memory: an LRU of recently used recipes, bounded by max_entries
+    - disk: a SQLite table of compact JSON, shared across restarts; entries older than ttl are
+            considered stale and must be revalidated by the caller: with the page's ETag/Last-Modified
+            stored alongside (validators), a 304 renews the entry (revalidate) instead of a re-parse
+    - pack (optional, RECIPE_PACK_PATH): a read-only memory-mapped corpus (see recipe_pack.py), shared by every
+            process on the box and consulted for recipes the SQLite table does not have
+
+Locking: the memory LRU (and the stats) have their own lock, held only for dict operations, so a memory lookup
+on the event loop never waits behind a SQLite query or commit, which run under a separate database lock;
+recipes are encoded and decoded outside both.
+"""
+
+DEFAULT_PATH = os.getenv("RECIPE_CACHE_PATH", "recipe_cache.sqlite3")
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL = 7 * 24 * 60 * 60 # seconds
+DEFAULT_PACK_PATH = os.getenv("RECIPE_PACK_PATH")
+
+def recipe_id_from_url(url):
+    """
+    Extract the stable AllRecipes recipe ID from a URL, or None if there isn't one.
+    Example usage:
+        print(recipe_id_from_url("https://www.allrecipes.com/recipe/156037/classic-lasagna/"))  # Output: "156037"
+    """
+    match = re.search(r'allrecipes\.com/recipe/(\d+)', url)
+    return match.group(1) if match else None
+
+class RecipeCache:
+    def __init__(self, path=DEFAULT_PATH, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, pack_path=DEFAULT_PACK_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.memory = OrderedDict() # recipe_id -> (recipe JSON, stored_at)
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stale": 0, "revalidated": 0, "pack_hits": 0}
+        self.memory_lock = threading.Lock() # memory, stats
+        self.db_lock = threading.Lock() # db
+        self.path = path
+        self.db = None
+        self.pack = None
+        if pack_path:
+            from recipe_pack import RecipePack
+            self.pack = RecipePack(pack_path)
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            # WAL: bot processes read while the parse service writes (see parse_service.py) without blocking each other
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS recipes (recipe_id TEXT PRIMARY KEY, json TEXT NOT NULL, stored_at REAL NOT NULL, "
+                            "etag TEXT, last_modified TEXT)")
+            # caches created before validators were stored
+            columns = {row[1] for row in self.db.execute("PRAGMA table_info(recipes)")}
+            for column in ("etag", "last_modified"):
+                if column not in columns:
+                    self.db.execute(f"ALTER TABLE recipes ADD COLUMN {column} TEXT")
+            self.db.commit()
+
+    def _remember(self, recipe_id, recipe, stored_at):
+        # with memory_lock held
+        self.memory[recipe_id] = (recipe, stored_at)
+        self.memory.move_to_end(recipe_id)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, recipe_id):
+        """
+        Return the cached recipe JSON for recipe_id, or None on a miss or a stale entry.
+        """
+        now = time.time()
+        with self.memory_lock:
+            if recipe_id in self.memory:
+                recipe, stored_at = self.memory[recipe_id]
+                if now - stored_at <= self.ttl:
+                    self.memory.move_to_end(recipe_id)
+                    self.stats["memory_hits"] += 1
+                    return recipe
+                del self.memory[recipe_id]
+                self.stats["stale"] += 1
+                return None
+        if self.db is not None:
+            with self.db_lock:
+                row = self.db.execute("SELECT json, stored_at FROM recipes WHERE recipe_id = ?", (recipe_id,)).fetchone()
+            if row:
+                if now - row[1] <= self.ttl:
+                    recipe = json.loads(row[0])
+                    with self.memory_lock:
+                        self.stats["disk_hits"] += 1
+                        if recipe_id in self.memory:
+                            # put() (or another reader) got there first while the row was decoded: it is as new or newer
+                            return self.memory[recipe_id][0]
+                        self._remember(recipe_id, recipe, row[1])
+                    return recipe
+                with self.memory_lock:
+                    self.stats["stale"] += 1
+                return None
+        if self.pack is not None:
+            recipe = self.pack.get(recipe_id)
+            if recipe is not None:
+                with self.memory_lock:
+                    self._remember(recipe_id, recipe, now)
+                    self.stats["pack_hits"] += 1
+                return recipe
+        with self.memory_lock:
+            self.stats["misses"] += 1
+        return None
+
+    def get_from_memory(self, recipe_id):
+        """
+        Return the recipe JSON if it is fresh in the memory tier, else None, without touching the disk: cheap enough
+        for the event loop. A None is not counted as a miss; get() decides that.
+        """
+        with self.memory_lock:
+            entry = self.memory.get(recipe_id)
+            if entry is None or time.time() - entry[1] > self.ttl:
+                return None
+            self.memory.move_to_end(recipe_id)
+            self.stats["memory_hits"] += 1
+            return entry[0]
+
+    def put(self, recipe_id, recipe, validators=None):
+        """
+        Store recipe JSON in both tiers, with the validators (ETag/Last-Modified) of the page it was parsed from.
+        """
+        validators = validators or {}
+        now = time.time()
+        with self.memory_lock:
+            self._remember(recipe_id, recipe, now)
+        if self.db is not None:
+            text = json.dumps(recipe, separators=(',', ':'), ensure_ascii=False)
+            with self.db_lock:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO recipes (recipe_id, json, stored_at, etag, last_modified) VALUES (?, ?, ?, ?, ?)",
+                    (recipe_id, text, now, validators.get("etag"), validators.get("last_modified")),
+                )
+                self.db.commit()
+
+    def validators(self, recipe_id):
+        """
+        Return the stored validators of a (typically stale) entry for a conditional request, or None.
+        """
+        if self.db is None:
+            return None
+        with self.db_lock:
+            row = self.db.execute("SELECT etag, last_modified FROM recipes WHERE recipe_id = ?", (recipe_id,)).fetchone()
+        if not row or not any(row):
+            return None
+        return {key: value for key, value in zip(("etag", "last_modified"), row) if value}
+
+    def revalidate(self, recipe_id):
+        """
+        The page of a stale entry has not changed (304): make the entry fresh again and return it (None if it is gone).
+        """
+        if self.db is None:
+            return None
+        now = time.time()
+        with self.db_lock:
+            row = self.db.execute("SELECT json FROM recipes WHERE recipe_id = ?", (recipe_id,)).fetchone()
+            if not row:
+                return None
+            self.db.execute("UPDATE recipes SET stored_at = ? WHERE recipe_id = ?", (now, recipe_id))
+            self.db.commit()
+        recipe = json.loads(row[0])
+        with self.memory_lock:
+            self._remember(recipe_id, recipe, now)
+            self.stats["revalidated"] += 1
+        return recipe
+
+    def iter_recipes(self):
+        """
+        Yield (recipe_id, recipe JSON) for every recipe on disk, stale or not, then the pack's recipes the table does not have.
+        Reads through its own connection, so a long scan (e.g. building the search index) does not hold the database lock.
+        """
+        seen = set()
+        if self.path:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            try:
+                for recipe_id, text in db.execute("SELECT recipe_id, json FROM recipes"):
+                    seen.add(recipe_id)
+                    yield recipe_id, json.loads(text)
+            finally:
+                db.close()
+        if self.pack is not None:
+            for recipe_id in self.pack:
+                if recipe_id not in seen:
+                    yield recipe_id, self.pack[recipe_id]
+
+    def hit_rate(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["pack_hits"]
+        total = hits + self.stats["misses"] + self.stats["stale"]
+        return hits / total if total else 0.0
+
+    def close(self):
+        with self.db_lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+        if self.pack is not None:
+            self.pack.close()
+            self.pack = None
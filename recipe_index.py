@@ -0,0 +1,80 @@
+import re
+import threading
+
+"""
+Recipe index module maps the words of a recipe's ingredients, tools and methods to the entries they belong to,
+so that QuestionHandler can resolve references ("how much ricotta cheese?", "how do I cook that?") with
+dictionary lookups instead of scanning every entry of the recipe for every question.
+
+An entry is indexed under its normalized token sequence (an n-gram, e.g. ("ricotta", "cheese")); a request
+is resolved by looking up each of its n-grams whose length is the length of some entry. An entry is therefore
+mentioned only when all of its words appear together in the request, as whole words: unlike the substring scan
+this replaced, "unsalted butter" does not mention "salt", and "butter" alone does not mention "unsalted butter".
+Ingredients are indexed when the index is built, tools and methods on first use.
+
+Normalization: lowercase, split into words (punctuation dropped), and a trailing plural "s" removed,
+so "Mozzarella cheese," and "mozzarella cheeses" both normalize to ("mozzarella", "cheese").
+"""
+
+TOKEN_REGEX = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+KINDS = ("ingredient", "tool", "method")
+
+def normalize_token(token):
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+def tokenize(text):
+    return tuple(normalize_token(token) for token in TOKEN_REGEX.findall(text.lower()))
+
+class RecipeIndex:
+    def __init__(self, recipe):
+        self.recipe = recipe
+        self.names = {} # kind -> [lowercase name, in recipe order]
+        self.ngrams = {} # kind -> {token tuple -> [position]}
+        self.lengths = {} # kind -> n-gram lengths that occur in some entry
+        self.by_name = {} # lowercase ingredient name -> ingredient entry
+        self.lock = threading.Lock()
+        # ingredients are indexed at once; tools and methods only when first needed,
+        # since they are not known until the steps of a staged recipe are parsed (see staged_recipe.py)
+        self._index_kind("ingredient", [ingredient['name'] for ingredient in recipe['ingredients']])
+        for ingredient in recipe['ingredients']:
+            self.by_name.setdefault(ingredient['name'].lower(), ingredient)
+
+    def _index_kind(self, kind, names):
+        ngrams, lengths = {}, set()
+        for position, name in enumerate(names):
+            name_tokens = tokenize(name)
+            if not name_tokens:
+                continue
+            ngrams.setdefault(name_tokens, []).append(position)
+            lengths.add(len(name_tokens))
+        self.ngrams[kind] = ngrams
+        self.lengths[kind] = lengths
+        self.names[kind] = [name.lower() for name in names] # published last: marks the kind as indexed
+
+    def _ensure(self, kind):
+        if kind in self.names:
+            return
+        with self.lock:
+            if kind not in self.names:
+                self._index_kind(kind, list(self.recipe[kind + 's']))
+
+    def lookup(self, kind, text):
+        """
+        Return the lowercase names of the entries of the given kind mentioned in text, in recipe order.
+        """
+        self._ensure(kind)
+        tokens = tokenize(text)
+        ngrams = self.ngrams[kind]
+        positions = set()
+        for length in self.lengths[kind]:
+            for start in range(len(tokens) - length + 1):
+                positions.update(ngrams.get(tokens[start:start + length], ()))
+        return [self.names[kind][position] for position in sorted(positions)]
+
+    def ingredient(self, name):
+        """
+        Return the ingredient entry with this (case-insensitive) name, or None.
+        """
+        return self.by_name.get(name.lower())
@@ -0,0 +1,366 @@
+import os
+import sys
+import json
+import mmap
+import struct
+import sqlite3
+import argparse
+from array import array
+from collections.abc import Mapping
+
+"""
+Recipe pack module: a read-only binary file of parsed recipes that processes memory-map instead of loading.
+
+Usage:
+    python recipe_pack.py build OUTPUT.pack INPUT.jsonl [INPUT.jsonl ...] [--cache recipe_cache.sqlite3]
+    python recipe_pack.py dump PACK [RECIPE_ID ...]      (JSON Lines {"recipe_id", "recipe"} on stdout)
+
+Inputs are bulk_ingest.py output files and/or a recipe cache. Opening a pack costs a header read: the file is
+mmap'ed and nothing else is parsed, so every process on the box shares the same page-cache copy of the corpus
+and a recipe is only decoded (to the JSON produced by parse.recipe_to_json) when it is looked up.
+The conversion is lossless: pack[recipe_id] == the recipe JSON it was built from.
+
+Layout (little-endian, every section 4-byte aligned):
+    header       magic b"RPAK", version u16, flags u16, string count u32, pool length u32, recipe count u32,
+                 blob length u32
+    offsets      u32[string count + 1]: string i is blob[offsets[i]:offsets[i + 1]] (UTF-8)
+    pool         u32[pool length]: every recipe as a sequence of string IDs and counts (see encode_recipe)
+    table        (recipe ID string, pool offset) u32 pairs, sorted by recipe ID, for binary search
+    blob         the UTF-8 bytes of every distinct string, each stored once
+"""
+
+MAGIC = b"RPAK"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIII")
+NONE = 0xFFFFFFFF # string ID of a null value
+MAX_U32 = 0xFFFFFFFE
+
+RECIPE_KEYS = ("title", "raw_ingredients", "ingredients", "tools", "methods", "steps")
+INGREDIENT_KEYS = ("name", "quantity", "measurement", "descriptor", "preparation")
+STEP_KEYS = ("step_number", "text", "ingredients", "tools", "methods", "time")
+TIME_KEYS = ("duration", "condition")
+
+class PackFormatError(ValueError):
+    """
+    Raised for a file that is not a recipe pack, or a recipe that cannot be stored losslessly in one.
+    """
+    pass
+
+def _check_keys(value, keys, what):
+    if not isinstance(value, dict) or set(value) != set(keys):
+        raise PackFormatError(f"{what} is not in recipe_to_json's format: {value!r:.200}")
+
+class PackWriter:
+    def __init__(self):
+        self.strings = {} # string -> ID
+        self.pool = array("I")
+        self.recipes = {} # recipe ID -> pool offset
+
+    def string_id(self, value):
+        if value is None:
+            return NONE
+        if not isinstance(value, str):
+            raise PackFormatError(f"expected a string or null, got {value!r:.200}")
+        string_id = self.strings.get(value)
+        if string_id is None:
+            string_id = self.strings[value] = len(self.strings)
+        return string_id
+
+    def _strings(self, values, what):
+        if not isinstance(values, list):
+            raise PackFormatError(f"{what} should be a list, got {values!r:.200}")
+        self.pool.append(len(values))
+        self.pool.extend(self.string_id(value) for value in values)
+
+    def encode_recipe(self, recipe):
+        """
+        Append a recipe to the pool and return its offset. Encoding:
+            title, raw_ingredients, ingredients (count, then 5 fields each), tools, methods,
+            steps (count, then per step: number, text, ingredients, tools, methods, duration, condition)
+        where a list of strings is its length followed by one string ID per item.
+        """
+        _check_keys(recipe, RECIPE_KEYS, "recipe")
+        offset = len(self.pool)
+        self.pool.append(self.string_id(recipe["title"]))
+        self._strings(recipe["raw_ingredients"], "raw_ingredients")
+        self.pool.append(len(recipe["ingredients"]))
+        for ingredient in recipe["ingredients"]:
+            _check_keys(ingredient, INGREDIENT_KEYS, "ingredient")
+            self.pool.extend(self.string_id(ingredient[key]) for key in INGREDIENT_KEYS)
+        self._strings(recipe["tools"], "tools")
+        self._strings(recipe["methods"], "methods")
+        self.pool.append(len(recipe["steps"]))
+        for step in recipe["steps"]:
+            _check_keys(step, STEP_KEYS, "step")
+            _check_keys(step["time"], TIME_KEYS, "step time")
+            number = step["step_number"]
+            if type(number) is not int or not 0 <= number <= MAX_U32:
+                raise PackFormatError(f"step_number should be a small non-negative integer, got {number!r}")
+            self.pool.append(number)
+            self.pool.append(self.string_id(step["text"]))
+            self._strings(step["ingredients"], "step ingredients")
+            self._strings(step["tools"], "step tools")
+            self._strings(step["methods"], "step methods")
+            self.pool.append(self.string_id(step["time"]["duration"]))
+            self.pool.append(self.string_id(step["time"]["condition"]))
+        return offset
+
+    def add(self, recipe_id, recipe):
+        """
+        Add (or replace) a recipe. A recipe that cannot be stored losslessly raises PackFormatError and is not added.
+        """
+        mark = len(self.pool)
+        try:
+            offset = self.encode_recipe(recipe)
+        except PackFormatError:
+            del self.pool[mark:]
+            raise
+        self.recipes[str(recipe_id)] = offset
+        self.string_id(str(recipe_id))
+
+    def write(self, path):
+        """
+        Write the pack to path atomically (a reader never sees a half-written file).
+        """
+        offsets = array("I", [0])
+        blob = bytearray()
+        for value in self.strings: # dicts keep insertion order, which is ID order
+            blob += value.encode("utf-8")
+            offsets.append(len(blob))
+        if len(blob) > MAX_U32 or len(self.pool) > MAX_U32:
+            raise PackFormatError("corpus too large for a single pack; split it into several")
+        table = array("I")
+        for recipe_id in sorted(self.recipes, key=lambda recipe_id: recipe_id.encode("utf-8")):
+            table.append(self.strings[recipe_id])
+            table.append(self.recipes[recipe_id])
+        if sys.byteorder != "little":
+            for section in (offsets, self.pool, table):
+                section.byteswap()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, len(self.strings), len(self.pool), len(self.recipes), len(blob)))
+            offsets.tofile(f)
+            self.pool.tofile(f)
+            table.tofile(f)
+            f.write(blob)
+        if sys.byteorder != "little":
+            for section in (offsets, self.pool, table):
+                section.byteswap()
+        os.replace(tmp_path, path)
+
+class RecipePack(Mapping):
+    """
+    A memory-mapped recipe pack: pack[recipe_id] -> recipe JSON (KeyError if absent), pack.get(recipe_id).
+    Safe to share between threads; close() (or a with block) unmaps the file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # empty file
+            self._file.close()
+            raise PackFormatError(f"{path} is not a recipe pack")
+        self._views = []
+        try:
+            magic, version, _, string_count, pool_length, recipe_count, blob_length = HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC or version != VERSION:
+                raise PackFormatError(f"{path} is not a version {VERSION} recipe pack")
+            position = HEADER.size
+            self._offsets, position = self._u32(position, string_count + 1)
+            self._pool, position = self._u32(position, pool_length)
+            self._table, position = self._u32(position, 2 * recipe_count)
+            if position + blob_length > len(self._mmap):
+                raise PackFormatError(f"{path} is truncated")
+            self._blob = self._view(position, blob_length)
+        except (struct.error, PackFormatError):
+            self.close()
+            raise
+        self._length = recipe_count
+
+    def _view(self, start, length):
+        view = memoryview(self._mmap)[start:start + length]
+        self._views.append(view)
+        return view
+
+    def _u32(self, start, count):
+        if start + 4 * count > len(self._mmap):
+            raise PackFormatError(f"{self.path} is truncated")
+        view = self._view(start, 4 * count)
+        if sys.byteorder == "little":
+            values = view.cast("I")
+            self._views.append(values)
+        else:
+            values = array("I")
+            values.frombytes(view)
+            values.byteswap()
+        return values, start + 4 * count
+
+    def string(self, string_id):
+        if string_id == NONE:
+            return None
+        return str(self._blob[self._offsets[string_id]:self._offsets[string_id + 1]], "utf-8")
+
+    def _find(self, recipe_id):
+        # binary search of the table, comparing UTF-8 bytes (the order the writer sorted by)
+        key = str(recipe_id).encode("utf-8")
+        low, high = 0, self._length
+        while low < high:
+            middle = (low + high) // 2
+            string_id = self._table[2 * middle]
+            found = self._blob[self._offsets[string_id]:self._offsets[string_id + 1]].tobytes()
+            if found < key:
+                low = middle + 1
+            elif found > key:
+                high = middle
+            else:
+                return self._table[2 * middle + 1]
+        return None
+
+    def _strings(self, position):
+        count = self._pool[position]
+        return [self.string(string_id) for string_id in self._pool[position + 1:position + 1 + count]], position + 1 + count
+
+    def decode_recipe(self, position):
+        pool = self._pool
+        string = self.string
+        title = string(pool[position])
+        raw_ingredients, position = self._strings(position + 1)
+        ingredients = []
+        count = pool[position]
+        position += 1
+        for _ in range(count):
+            ingredients.append(dict(zip(INGREDIENT_KEYS, [string(string_id) for string_id in pool[position:position + 5]])))
+            position += 5
+        tools, position = self._strings(position)
+        methods, position = self._strings(position)
+        steps = []
+        count = pool[position]
+        position += 1
+        for _ in range(count):
+            step_number, text = pool[position], string(pool[position + 1])
+            step_ingredients, position = self._strings(position + 2)
+            step_tools, position = self._strings(position)
+            step_methods, position = self._strings(position)
+            steps.append({
+                "step_number": step_number,
+                "text": text,
+                "ingredients": step_ingredients,
+                "tools": step_tools,
+                "methods": step_methods,
+                "time": {"duration": string(pool[position]), "condition": string(pool[position + 1])},
+            })
+            position += 2
+        return {"title": title, "raw_ingredients": raw_ingredients, "ingredients": ingredients,
+                "tools": tools, "methods": methods, "steps": steps}
+
+    def __getitem__(self, recipe_id):
+        position = self._find(recipe_id)
+        if position is None:
+            raise KeyError(recipe_id)
+        return self.decode_recipe(position)
+
+    def __contains__(self, recipe_id):
+        return self._find(recipe_id) is not None
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield self.string(self._table[2 * index])
+
+    def __len__(self):
+        return self._length
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if getattr(self, "_mmap", None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def read_jsonl_recipes(path):
+    """
+    (recipe ID, recipe JSON) for every parsed recipe in a bulk_ingest.py output file.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue # a truncated last line
+            if record.get("recipe_id") and record.get("recipe"):
+                yield record["recipe_id"], record["recipe"]
+
+def read_cache_recipes(path):
+    """
+    (recipe ID, recipe JSON) for every recipe in a RecipeCache SQLite file.
+    """
+    db = sqlite3.connect(path)
+    try:
+        for recipe_id, text in db.execute("SELECT recipe_id, json FROM recipes"):
+            yield recipe_id, json.loads(text)
+    finally:
+        db.close()
+
+def build(output, inputs, cache=None):
+    writer = PackWriter()
+    stored, skipped = {}, 0 # stored: recipe ID -> position in the inputs of the copy in the pack (a later copy replaces it)
+    def stream():
+        sources = [read_jsonl_recipes(path) for path in inputs] + ([read_cache_recipes(cache)] if cache else [])
+        for source in sources:
+            yield from source
+    for position, (recipe_id, recipe) in enumerate(stream()):
+        try:
+            writer.add(recipe_id, recipe)
+        except PackFormatError as e:
+            skipped += 1
+            print(f"skipping {recipe_id}: {e}", file=sys.stderr)
+            continue
+        stored[str(recipe_id)] = position
+    writer.write(output)
+    # check the round trip of every recipe before anyone relies on the pack: the inputs are read again
+    # rather than kept, so building a pack of a full crawl does not hold the whole corpus in memory
+    mismatched = 0
+    with RecipePack(output) as pack:
+        for position, (recipe_id, recipe) in enumerate(stream()):
+            if stored.get(str(recipe_id)) == position and pack.get(recipe_id) != recipe:
+                mismatched += 1
+    size_mb = os.path.getsize(output) / (1024 * 1024)
+    print(f"{output}: {len(stored)} recipes, {len(writer.strings)} distinct strings, {size_mb:.1f} MB; "
+          f"{skipped} skipped, {mismatched} not round-tripping")
+    return 1 if mismatched else 0
+
+def dump(path, recipe_ids):
+    with RecipePack(path) as pack:
+        for recipe_id in recipe_ids or pack:
+            recipe = pack.get(recipe_id)
+            if recipe is None:
+                print(f"{recipe_id}: not in {path}", file=sys.stderr)
+                continue
+            print(json.dumps({"recipe_id": recipe_id, "recipe": recipe}, ensure_ascii=False))
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or read memory-mappable recipe packs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="build a pack from bulk_ingest.py output and/or a recipe cache")
+    build_parser.add_argument("output")
+    build_parser.add_argument("inputs", nargs="*", help="bulk_ingest.py JSON Lines output files")
+    build_parser.add_argument("--cache", help="also pack every recipe of this recipe cache (SQLite file)")
+    dump_parser = commands.add_parser("dump", help="print recipes of a pack as JSON Lines")
+    dump_parser.add_argument("pack")
+    dump_parser.add_argument("recipe_ids", nargs="*", help="only these recipes (default: all)")
+    args = parser.parse_args()
+    if args.command == "build":
+        return build(args.output, args.inputs, args.cache)
+    return dump(args.pack, args.recipe_ids)
+
+if __name__ == "__main__":
+    sys.exit(main())
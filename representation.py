@@ -1,32 +1,51 @@
+import sys
+
+# These classes are built for every recipe parsed (bulk ingestion builds hundreds of thousands of them), so they
+# use __slots__ instead of a per-instance __dict__, and intern the short strings that repeat across recipes
+# (ingredient names, units, descriptors, tools, methods) so that every recipe shares one copy of each.
+# The long free text (raw ingredient lines, step text) is rarely shared and is stored as is.
+
+def intern_text(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+def intern_all(values):
+    return [intern_text(value) for value in values] if values else []
+
 class Ingredient:
     """
-    Ingredients 
+    Ingredients
         Ingredient name
         Quantity
         Measurement (cup, teaspoon, pinch, etc.)
         (optional) Descriptor (e.g. fresh, extra-virgin)
         (optional) Preparation (e.g. finely chopped)
     """
+    __slots__ = ("name", "quantity", "measurement", "descriptor", "preparation")
+
     def __init__(self, name, quantity=None, measurement=None, descriptor=None, preparation=None):
-        self.name = name
-        self.quantity = quantity
-        self.measurement = measurement
-        self.descriptor = descriptor
-        self.preparation = preparation
+        self.name = intern_text(name)
+        self.quantity = intern_text(quantity)
+        self.measurement = intern_text(measurement)
+        self.descriptor = intern_text(descriptor)
+        self.preparation = intern_text(preparation)
 
 class Step:
     """
     Steps – parse the directions into a series of steps that each consist of ingredients, tools, methods, and times
     """
+    __slots__ = ("step_number", "text", "ingredients", "tools", "methods", "time")
+
     def __init__(self, step_number, text, ingredients=None, tools=None, methods=None, time=None):
         self.step_number = step_number
         self.text = text
-        self.ingredients = ingredients or []
-        self.tools = tools or []
-        self.methods = methods or []
+        self.ingredients = intern_all(ingredients)
+        self.tools = intern_all(tools)
+        self.methods = intern_all(methods)
         self.time = time
 
 class Recipe:
+    __slots__ = ("title", "raw_ingredients", "ingredients", "steps")
+
     def __init__(self, title, raw_ingredients, ingredients, steps):
         self.title = title
         self.raw_ingredients = raw_ingredients
@@ -0,0 +1,71 @@
+import functools
+
+"""
+Responses module renders bot answers once and keeps them ready to send.
+
+Answers that depend only on the (read-only, shared) recipe and a step index are cached on the recipe's
+QuestionHandler by the cached_response decorator: the first conversation to ask renders the answer,
+every later request about the same recipe reuses it.
+
+Rendered answers are Response strings: ordinary strings that also carry their split into
+Discord-sized messages (Discord rejects messages longer than 2000 characters), computed once.
+"""
+
+DISCORD_MESSAGE_LIMIT = 2000
+
+def split_message(text, limit=DISCORD_MESSAGE_LIMIT):
+    """
+    Split text into chunks of at most limit characters, breaking between lines where possible,
+    then between words, and only as a last resort in the middle of a word.
+    """
+    if len(text) <= limit:
+        return (text,)
+    chunks = []
+    current = ""
+    for line in text.splitlines(keepends=True):
+        if len(current) + len(line) <= limit:
+            current += line
+            continue
+        if current:
+            chunks.append(current)
+            current = ""
+        while len(line) > limit:
+            cut = line.rfind(" ", 0, limit) + 1 or limit # break after the last space that fits
+            chunks.append(line[:cut])
+            line = line[cut:]
+        current = line
+    if current:
+        chunks.append(current)
+    # drop chunks that are only whitespace (discord refuses empty messages)
+    return tuple(chunk for chunk in chunks if chunk.strip()) or (text[:limit],)
+
+class Response(str):
+    """
+    A rendered answer; .chunks holds the answer split at the discord message limit.
+    """
+    def __new__(cls, text):
+        response = super().__new__(cls, text)
+        response.chunks = split_message(text)
+        return response
+
+def message_chunks(text):
+    """
+    Return the messages needed to send text: the pre-split chunks of a Response, else split now.
+    """
+    if isinstance(text, Response):
+        return text.chunks
+    return split_message(text)
+
+def cached_response(method):
+    """
+    Cache a QuestionHandler answer per (method, arguments) in the handler's responses dict, as a Response.
+    Only for answers that depend on nothing but the recipe and the arguments.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        key = (method.__name__, *args)
+        response = self.responses.get(key)
+        if response is None:
+            response = self.responses.setdefault(key, Response(method(self, *args)))
+        return response
+    return wrapper
@@ -0,0 +1,369 @@
+import re
+import bisect
+import weakref
+import threading
+from recipe_index import tokenize
+from staged_recipe import StagedRecipe
+
+"""
+Search index module answers questions across every parsed recipe the bot knows, e.g.
+"what can I make with chicken and a skillet in under 30 minutes?", without re-parsing any page.
+
+It is built from the recipe JSON produced by recipe_to_json:
+    - inverted posting lists, one per kind (ingredient, tool, method, and any of them) and normalized token
+      (see recipe_index.tokenize): token -> sorted array of document numbers of the recipes using it
+    - a numeric index of each recipe's total time, the sum of its step durations ("10 minutes", "1 hour") in minutes,
+      kept sorted for range queries; recipes without any step duration have no time and never match a time filter
+
+A query is a list of terms, all of which must match (AND), and an optional time range. A term matches a recipe
+when one of its tokens occurs in that recipe's ingredients, tools or methods (or in the kind it is prefixed with:
+"tool:skillet", "ingredient:chicken", "method:bake"); the words of a multi-word term must each match.
+Postings are intersected smallest first with numpy, probing the longer lists by a vectorized binary search, and only
+the matches that can make the top results are sorted, so a multi-term query takes about a millisecond across 100k
+recipes (see benchmarks/bench_search.py).
+
+Posting lists and the per-recipe times are growable numpy buffers that queries read through views, without copying.
+Updates are incremental: add() appends a new document number (so posting lists stay sorted by construction);
+re-adding a recipe tombstones its old document, and compact() rebuilds the lists once tombstones pile up.
+"""
+
+KINDS = ("ingredient", "tool", "method")
+DURATION_REGEX = re.compile(r"(\d+)\s*(?:more\s*)?(second|sec|minute|min|hour|hr)")
+MINUTES_PER_UNIT = {"second": 1 / 60, "sec": 1 / 60, "minute": 1, "min": 1, "hour": 60, "hr": 60}
+UNKNOWN_TIME = -1.0
+ANY_KIND = "any" # postings of a token in any kind, for terms without a kind prefix
+
+TIME_LIMIT_REGEX = re.compile(
+    r"\b(under|less than|within|at most|no more than|below|over|more than|at least|longer than)\s+"
+    r"(?:an?\s+)?(\d+)?\s*(minutes?|mins?|hours?|hrs?)\b"
+)
+UPPER_BOUND_WORDS = ("under", "less than", "within", "at most", "no more than", "below")
+TERM_PREFIX_REGEX = re.compile(r"\b(ingredient|tool|method)s?:\s*([a-z0-9][a-z0-9' -]*?)(?=\s*(?:,|\band\b|\bwith\b|$|\b(?:ingredient|tool|method)s?:))")
+# words of a question that are not search terms
+STOPWORDS = frozenset("""
+    a an the and or with without using use in on of for to from by at under over than less more within least most about
+    i me my we our you your can could would should will do does did is are be have has got what which that this these those
+    some any something anything recipe recipes dish dishes meal meals make cook cooking prepare want need like find search
+    show give get please quick quickly easy minute minutes min mins hour hours hr hrs time only just also no not
+""".split())
+
+def step_minutes(duration):
+    """
+    Minutes in a step duration string ("10 minutes", "1 hour", "about 30 seconds"), or None if it has none.
+    """
+    if not duration:
+        return None
+    total = None
+    for amount, unit in DURATION_REGEX.findall(duration.lower()):
+        total = (total or 0) + int(amount) * MINUTES_PER_UNIT[unit]
+    return total
+
+def recipe_minutes(recipe):
+    """
+    Total minutes of a recipe's step durations, or UNKNOWN_TIME if no step states one.
+    """
+    total = None
+    for step in recipe.get("steps", ()):
+        minutes = step_minutes((step.get("time") or {}).get("duration"))
+        if minutes is not None:
+            total = (total or 0) + minutes
+    return UNKNOWN_TIME if total is None else total
+
+def slugify(title):
+    return re.sub(r"[^a-z0-9]+", "-", (title or "").lower()).strip("-") or "recipe"
+
+class Query:
+    __slots__ = ("terms", "min_minutes", "max_minutes")
+
+    def __init__(self, terms=None, min_minutes=None, max_minutes=None):
+        self.terms = terms or [] # [(kind or None, token tuple)]
+        self.min_minutes = min_minutes
+        self.max_minutes = max_minutes
+
+    def describe(self):
+        parts = [" ".join(tokens) if kind is None else f"{kind} {' '.join(tokens)}" for kind, tokens in self.terms]
+        if self.max_minutes is not None:
+            parts.append(f"under {self.max_minutes:g} minutes")
+        if self.min_minutes is not None:
+            parts.append(f"over {self.min_minutes:g} minutes")
+        return ", ".join(parts)
+
+def parse_query(text):
+    """
+    Parse a search question into a Query. Examples:
+        "chicken and a skillet in under 30 minutes" -> terms chicken, skillet; max 30 minutes
+        "tool: dutch oven, method: simmer" -> terms (tool, dutch oven), (method, simmer)
+        "over an hour" -> min 60 minutes
+    """
+    text = text.lower()
+    query = Query()
+    for match in TIME_LIMIT_REGEX.finditer(text):
+        minutes = int(match.group(2) or 1) * (60 if match.group(3).startswith(("hour", "hr")) else 1)
+        if match.group(1) in UPPER_BOUND_WORDS:
+            query.max_minutes = minutes
+        else:
+            query.min_minutes = minutes
+    text = TIME_LIMIT_REGEX.sub(" ", text)
+    for match in TERM_PREFIX_REGEX.finditer(text):
+        tokens = tuple(token for token in tokenize(match.group(2)) if token not in STOPWORDS)
+        if tokens:
+            query.terms.append((match.group(1), tokens))
+    text = TERM_PREFIX_REGEX.sub(" ", text)
+    for token in tokenize(text):
+        if token not in STOPWORDS and not token.isdigit():
+            query.terms.append((None, (token,)))
+    return query
+
+def intersect(postings):
+    """
+    Document numbers present in every one of the sorted numpy arrays, smallest first: each array is probed
+    with the running result by a vectorized binary search, so the cost follows the shortest list.
+    """
+    import numpy as np # deferred: keeps numpy out of the bot's startup (see benchmarks/import_budget.py)
+    if not postings:
+        return np.empty(0, dtype=np.uint32)
+    postings = sorted(postings, key=len)
+    result = postings[0]
+    for other in postings[1:]:
+        if not len(result):
+            break
+        positions = np.searchsorted(other, result)
+        found = positions < len(other)
+        result = result[found]
+        result = result[other[positions[found]] == result]
+    return result
+
+class GrowableArray:
+    """
+    A numpy array appended to in place, with doubling capacity; view() is the filled part, without a copy.
+    The buffer is created on the first append, so building an empty index does not import numpy.
+    """
+    __slots__ = ("dtype", "data", "size")
+
+    def __init__(self, dtype, values=None):
+        self.dtype = dtype
+        self.data = None
+        self.size = 0
+        if values is not None and len(values):
+            import numpy as np
+            self.data = np.array(values, dtype=dtype)
+            self.size = len(self.data)
+
+    def append(self, value):
+        import numpy as np
+        if self.data is None:
+            self.data = np.empty(8, dtype=self.dtype)
+        elif self.size == len(self.data):
+            grown = np.empty(2 * len(self.data), dtype=self.dtype)
+            grown[:self.size] = self.data
+            self.data = grown
+        self.data[self.size] = value
+        self.size += 1
+
+    def view(self):
+        import numpy as np
+        if self.data is None:
+            return np.empty(0, dtype=self.dtype)
+        return self.data[:self.size]
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        return self.view()[index]
+
+class SearchIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {} # recipe ID -> StagedRecipe whose parse will index it (see add_ingested)
+        self.sources = {} # recipe ID -> weak reference to the StagedRecipe its current document was indexed from
+        self._reset()
+
+    def _reset(self):
+        self.recipe_ids = [] # document number -> recipe ID
+        self.titles = [] # document number -> title
+        self.minutes = GrowableArray("float64") # document number -> total minutes (UNKNOWN_TIME if none)
+        self.documents = {} # recipe ID -> current document number
+        self.postings = {kind: {} for kind in KINDS + (ANY_KIND,)} # kind -> {token -> GrowableArray of document numbers}
+        self.by_minutes = [] # sorted (minutes, document number) of recipes with a known time
+        self.deleted = set() # document numbers replaced by a newer version of their recipe
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __contains__(self, recipe_id):
+        return str(recipe_id) in self.documents
+
+    def add(self, recipe_id, recipe, source=None):
+        """
+        Index (or re-index) a recipe JSON under its recipe ID. Thread-safe.
+        source: the StagedRecipe the recipe JSON was parsed by, if any; a recipe already indexed from it is not re-indexed.
+        """
+        recipe_id = str(recipe_id)
+        names = {
+            "ingredient": [ingredient["name"] for ingredient in recipe.get("ingredients", ())],
+            "tool": list(recipe.get("tools", ())),
+            "method": list(recipe.get("methods", ())),
+        }
+        tokens = {kind: {token for name in values for token in tokenize(name)} for kind, values in names.items()}
+        tokens[ANY_KIND] = set().union(*tokens.values())
+        minutes = recipe_minutes(recipe)
+        with self.lock:
+            if source is not None and self._source(recipe_id) is source:
+                return
+            if source is None:
+                self.sources.pop(recipe_id, None)
+            else:
+                self.sources[recipe_id] = weakref.ref(source)
+            previous = self.documents.get(recipe_id)
+            if previous is not None:
+                self.deleted.add(previous)
+            doc = len(self.recipe_ids)
+            self.recipe_ids.append(recipe_id)
+            self.titles.append(recipe.get("title"))
+            self.minutes.append(minutes)
+            self.documents[recipe_id] = doc
+            for kind, kind_tokens in tokens.items():
+                postings = self.postings[kind]
+                for token in kind_tokens:
+                    posting = postings.get(token)
+                    if posting is None:
+                        posting = postings[token] = GrowableArray("uint32")
+                    posting.append(doc) # doc is the largest number so far: the list stays sorted
+            if minutes != UNKNOWN_TIME:
+                bisect.insort(self.by_minutes, (minutes, doc))
+            if len(self.deleted) > 1000 and len(self.deleted) > len(self.documents) // 4:
+                self._compact()
+
+    def add_all(self, recipes):
+        """
+        Index (recipe ID, recipe JSON) pairs, e.g. RecipeCache.iter_recipes(). Returns how many were indexed.
+        """
+        count = 0
+        for recipe_id, recipe in recipes:
+            self.add(recipe_id, recipe)
+            count += 1
+        return count
+
+    def add_ingested(self, recipe_id, recipe):
+        """
+        Index a newly ingested recipe: a StagedRecipe once its steps are parsed, a cached one if it is missing.
+        Every conversation on a recipe calls this, so a StagedRecipe is only watched once, and not again once indexed.
+        """
+        if not recipe_id:
+            return
+        recipe_id = str(recipe_id)
+        if isinstance(recipe, StagedRecipe):
+            with self.lock:
+                if self.pending.get(recipe_id) is recipe or self._source(recipe_id) is recipe:
+                    return
+                self.pending[recipe_id] = recipe
+            def parsed(future):
+                with self.lock:
+                    if self.pending.get(recipe_id) is recipe:
+                        del self.pending[recipe_id]
+                if not future.cancelled() and future.exception() is None and future.result():
+                    self.add(recipe_id, future.result(), source=recipe)
+            recipe.future.add_done_callback(parsed)
+        elif recipe_id not in self:
+            self.add(recipe_id, recipe)
+
+    def _source(self, recipe_id):
+        # the StagedRecipe the recipe's current document was indexed from, if it is still alive
+        source = self.sources.get(recipe_id)
+        return source() if source is not None else None
+
+    def compact(self):
+        with self.lock:
+            self._compact()
+
+    def _compact(self):
+        # rebuild without the tombstoned documents (numbers are reassigned in the same order, so lists stay sorted)
+        import numpy as np
+        count = len(self.recipe_ids)
+        alive = np.ones(count, dtype=bool)
+        alive[list(self.deleted)] = False
+        live = np.flatnonzero(alive)
+        renumber = np.cumsum(alive, dtype=np.int64) - 1 # old number -> new number, for live documents
+        recipe_ids, titles, minutes = self.recipe_ids, self.titles, self.minutes.view()
+        postings = {}
+        for kind, kind_postings in self.postings.items():
+            postings[kind] = {}
+            for token, posting in kind_postings.items():
+                docs = posting.view()
+                docs = renumber[docs[alive[docs]]]
+                if len(docs):
+                    postings[kind][token] = GrowableArray("uint32", docs)
+        by_minutes = [(value, int(renumber[doc])) for value, doc in self.by_minutes if alive[doc]]
+        self.sources = {recipe_id: source for recipe_id, source in self.sources.items() if source() is not None}
+        self._reset()
+        self.recipe_ids = [recipe_ids[doc] for doc in live]
+        self.titles = [titles[doc] for doc in live]
+        self.minutes = GrowableArray("float64", minutes[live])
+        self.documents = {recipe_id: doc for doc, recipe_id in enumerate(self.recipe_ids)}
+        self.postings = postings
+        self.by_minutes = by_minutes
+
+    def _term_posting(self, kind, tokens):
+        # documents matching every token of the term, in the term's kind or in any kind
+        import numpy as np
+        postings = self.postings[kind or ANY_KIND]
+        if not all(token in postings for token in tokens):
+            return np.empty(0, dtype=np.uint32)
+        return intersect([postings[token].view() for token in tokens])
+
+    def search(self, query, limit=10):
+        """
+        Run a Query (or a question string, see parse_query). Returns (total matches, [(recipe ID, title, minutes)]),
+        quickest recipes first (recipes without a known time last, ties in the order they were indexed).
+        """
+        import numpy as np
+        if isinstance(query, str):
+            query = parse_query(query)
+        timed = query.min_minutes is not None or query.max_minutes is not None
+        if not query.terms and not timed:
+            return 0, []
+        with self.lock:
+            if not query.terms:
+                # a time range alone is a slice of the time index, already in result order
+                low = 0 if query.min_minutes is None else bisect.bisect_left(self.by_minutes, (query.min_minutes, -1))
+                high = (len(self.by_minutes) if query.max_minutes is None
+                        else bisect.bisect_right(self.by_minutes, (query.max_minutes, float("inf"))))
+                top = [doc for _, doc in self.by_minutes[low:high] if doc not in self.deleted]
+                total = len(top)
+                top = top[:limit]
+            else:
+                minutes = self.minutes.view()
+                docs = intersect([self._term_posting(kind, tokens) for kind, tokens in query.terms])
+                if timed:
+                    least = query.min_minutes if query.min_minutes is not None else 0
+                    most = query.max_minutes if query.max_minutes is not None else np.inf
+                    docs = docs[(minutes[docs] >= least) & (minutes[docs] <= most)]
+                if self.deleted:
+                    docs = docs[~np.isin(docs, np.fromiter(self.deleted, dtype=np.uint32, count=len(self.deleted)))]
+                total = len(docs)
+                keys = minutes[docs]
+                keys[keys == UNKNOWN_TIME] = np.inf
+                if total > limit:
+                    # only the matches as quick as the limit-th quickest need ordering
+                    cutoff = np.partition(keys, limit - 1)[limit - 1]
+                    docs, keys = docs[keys <= cutoff], keys[keys <= cutoff]
+                top = docs[np.lexsort((docs, keys))][:limit].tolist()
+            minutes = self.minutes.view()
+            results = [(self.recipe_ids[doc], self.titles[doc], None if minutes[doc] == UNKNOWN_TIME else float(minutes[doc]))
+                       for doc in top]
+        return total, results
+
+def format_results(query, total, results):
+    """
+    The bot's reply to a search: one line per recipe, with a link that starts a conversation when posted to the bot.
+    """
+    if not query.terms and query.min_minutes is None and query.max_minutes is None:
+        return "Tell me what to search for, e.g. \"!search chicken and a skillet in under 30 minutes\"."
+    if not results:
+        return f"I don't know any recipes with {query.describe()} yet."
+    lines = [f"Recipes with {query.describe()} ({len(results)} of {total}):"]
+    for number, (recipe_id, title, minutes) in enumerate(results, 1):
+        time_text = f" ({minutes:.0f} min)" if minutes is not None else ""
+        lines.append(f"{number}. {title}{time_text}: https://www.allrecipes.com/recipe/{recipe_id}/{slugify(title)}/")
+    return "\n".join(lines)
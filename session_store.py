@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from conversation import Conversation
+from shared_recipe import shared_recipe_count
+
+"""
+Session store module keeps the bot's live conversations, one per user, within fixed bounds.
+
+    - max_sessions: least recently used sessions are evicted once the store is full
+    - idle_ttl: sessions idle for longer than this are evicted (see evict_idle)
+
+An evicted conversation is not lost: its small state (recipe ID, current step, last few questions) is written
+to state_dir/<user_id>.json, and the next message from that user resumes it, re-using the parsed recipe from
+the recipe cache instead of fetching and parsing the page again. The store remembers which users have saved
+state, so a message from a user without a conversation costs no disk access; resuming (reading the state and
+loading the recipe) runs in a thread, off the event loop. Eviction takes a snapshot of the state on the loop and
+leaves the file to a writer thread; if the write fails (e.g. a full disk), the session is evicted without saving it.
+"""
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_SESSIONS = 1000
+DEFAULT_IDLE_TTL = 2 * 60 * 60 # seconds
+DEFAULT_STATE_DIR = os.getenv("SESSION_STATE_DIR", "sessions")
+DEFAULT_HISTORY_LIMIT = 20
+
+class SessionStore:
+    def __init__(self, recipe_loader=None, max_sessions=DEFAULT_MAX_SESSIONS, idle_ttl=DEFAULT_IDLE_TTL,
+                 state_dir=DEFAULT_STATE_DIR, history_limit=DEFAULT_HISTORY_LIMIT):
+        """
+        recipe_loader: function recipe_id -> recipe JSON (or None), used to resume evicted sessions
+        """
+        self.recipe_loader = recipe_loader
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.state_dir = state_dir
+        self.history_limit = history_limit
+        self.sessions = OrderedDict() # user_id -> (Conversation, last active time)
+        self.counters = {"created": 0, "evicted": 0, "resumed": 0, "ended": 0, "discarded": 0}
+        self.saved = set() # user IDs with state in state_dir
+        self.resuming = {} # user_id -> Future of the resume in progress, shared by the user's messages meanwhile
+        # state files are written (and removed) here, never on the event loop, one at a time and in order
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-writer")
+        self.writes = {} # user_id -> Future of the user's last state write
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+            self.saved = {name[:-len(".json")] for name in os.listdir(state_dir) if name.endswith(".json")}
+
+    def _state_path(self, user_id):
+        return os.path.join(self.state_dir, f"{user_id}.json")
+
+    def __len__(self):
+        return len(self.sessions)
+
+    async def get(self, user_id):
+        """
+        Return the user's conversation, resuming it from disk if it was evicted, or None.
+        """
+        user_id = str(user_id)
+        now = time.time()
+        entry = self.sessions.get(user_id)
+        if entry is not None:
+            conversation, last_active = entry
+            if now - last_active > self.idle_ttl:
+                # idle, but still in memory (evict_idle has not run yet): resume it from the live object, as it would
+                # come back from disk, instead of saving it and reading it straight back
+                if self.history_limit:
+                    del conversation.question_history[:-self.history_limit]
+                self.counters["resumed"] += 1
+            self.sessions[user_id] = (conversation, now)
+            self.sessions.move_to_end(user_id)
+            return conversation
+        resuming = self.resuming.get(user_id)
+        if resuming is None:
+            if user_id not in self.saved or self.recipe_loader is None:
+                return None
+            self.saved.discard(user_id) # the state file is used up (or discarded) by the resume
+            write = self.writes.pop(user_id, None) # the state may still be on its way to disk
+            resuming = self.resuming[user_id] = asyncio.ensure_future(asyncio.to_thread(self._load, user_id, write))
+            resuming.add_done_callback(lambda _: self.resuming.pop(user_id, None))
+        loaded = await asyncio.shield(resuming)
+        entry = self.sessions.get(user_id)
+        if entry is not None:
+            # resumed by an earlier message of the same user (or replaced by a new conversation) meanwhile
+            return entry[0]
+        if loaded is None:
+            return None
+        state, recipe = loaded
+        conversation = Conversation.from_state(state, recipe)
+        self.counters["resumed"] += 1
+        self._insert(user_id, conversation, time.time())
+        return conversation
+
+    def put(self, user_id, conversation):
+        user_id = str(user_id)
+        self.counters["created"] += 1
+        self._insert(user_id, conversation, time.time())
+
+    def remove(self, user_id):
+        """
+        End a conversation for good, including any saved state.
+        """
+        user_id = str(user_id)
+        self.sessions.pop(user_id, None)
+        self.counters["ended"] += 1
+        if user_id in self.saved:
+            self.saved.discard(user_id)
+            self.writes.pop(user_id, None)
+            # queued behind any pending write of the same file
+            self.writer.submit(self._discard, self._state_path(user_id), False)
+
+    def _insert(self, user_id, conversation, now):
+        self.sessions[user_id] = (conversation, now)
+        self.sessions.move_to_end(user_id)
+        while len(self.sessions) > self.max_sessions:
+            self._evict(next(iter(self.sessions)))
+
+    def _evict(self, user_id):
+        conversation, _ = self.sessions.pop(user_id)
+        self.counters["evicted"] += 1
+        if self.state_dir and conversation.recipe_id:
+            state = conversation.to_state(self.history_limit)
+            self.writes[user_id] = self.writer.submit(self._save, user_id, state)
+            self.saved.add(user_id)
+
+    def _save(self, user_id, state):
+        # writer thread; on failure the session is simply not resumable (resuming finds no file)
+        path = self._state_path(user_id)
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+        except OSError as e:
+            log.warning("Could not save the conversation of %s: %s", user_id, e)
+            self._discard(path, count=False) # no partial file
+            return False
+        return True
+
+    def _load(self, user_id, write=None):
+        # runs in a thread: (saved state, recipe) of an evicted conversation, or None; the state file is removed.
+        # write is the Future of the state's write if it was still pending when the resume started
+        if write is not None:
+            write.result()
+        path = self._state_path(user_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            recipe_id = state["recipe_id"]
+        except (OSError, ValueError, KeyError, TypeError):
+            # unreadable or corrupt: it would fail the same way on every later message
+            self._discard(path)
+            return None
+        recipe = self.recipe_loader(recipe_id)
+        if recipe is None:
+            # the recipe is gone (e.g. it dropped out of the cache): the conversation cannot be resumed
+            self._discard(path)
+            return None
+        os.remove(path)
+        return state, recipe
+
+    def _discard(self, path, count=True):
+        if count:
+            self.counters["discarded"] += 1
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict_idle(self):
+        """
+        Evict every session that has been idle for longer than idle_ttl. Returns the number evicted.
+        """
+        now = time.time()
+        idle = [user_id for user_id, (_, last_active) in self.sessions.items() if now - last_active > self.idle_ttl]
+        for user_id in idle:
+            self._evict(user_id)
+        self.writes = {user_id: write for user_id, write in self.writes.items() if not write.done()}
+        return len(idle)
+
+    def flush(self):
+        """
+        Block until every state write queued so far is on disk (for shutdown and tests; not on the event loop).
+        """
+        self.writer.submit(lambda: None).result()
+
+    def stats(self, memory=False):
+        """
+        Live session count, number of shared recipes, and lifetime counters.
+        memory=True adds the approximate memory of all live sessions, which walks every conversation:
+        for periodic reports, not per message.
+        """
+        stats = {
+            "live_sessions": len(self.sessions),
+            "shared_recipes": shared_recipe_count(),
+            **self.counters,
+        }
+        if memory:
+            stats["approx_kb"] = round(sum(conversation.size_kb() for conversation, _ in self.sessions.values()), 1)
+        return stats
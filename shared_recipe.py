@@ -0,0 +1,146 @@
+import sys
+import json
+import weakref
+import threading
+from types import MappingProxyType
+from collections.abc import Mapping
+from question_handler import QuestionHandler
+from staged_recipe import StagedRecipe
+
+"""
+Shared recipe module interns parsed recipes so that every conversation about the same recipe uses one copy.
+
+A SharedRecipe is a read-only view of the JSON produced by recipe_to_json (dicts become read-only mappings,
+lists become tuples, strings are interned), together with the one QuestionHandler for that recipe, whose lookup
+tables are computed once. Conversations only add their own small state (current step, question history).
+
+A SharedRecipe can be created from a StagedRecipe whose steps are still being parsed: the title and ingredients
+are frozen at once, and the rest of the recipe is frozen the first time a conversation needs it.
+
+Recipes are interned by AllRecipes recipe ID in a weak registry: a recipe stays in memory while at least one
+conversation uses it, and is dropped with the last one. An interned recipe is not reused when its background
+parse failed, or when a conversation starts from a different version of the recipe (e.g. re-parsed after a cache
+refresh): the new recipe takes its place in the registry, and conversations already holding the old one keep it.
+"""
+
+_registry = weakref.WeakValueDictionary() # recipe_id -> SharedRecipe
+
+def freeze(value):
+    """
+    Return a read-only copy of JSON-like data: dicts -> MappingProxyType, lists -> tuples, interned strings.
+    """
+    if isinstance(value, Mapping):
+        return MappingProxyType({freeze(key): freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+class SharedRecipe(Mapping):
+    __slots__ = ("recipe_id", "_data", "_source", "_staged", "_lock", "fingerprint", "question_handler", "__weakref__")
+
+    def __init__(self, recipe, recipe_id=None):
+        self.recipe_id = sys.intern(recipe_id) if recipe_id else None
+        self._staged = None
+        self._lock = threading.Lock()
+        self.fingerprint = None # of the full recipe, once known (see fingerprint())
+        # the full recipe JSON it was frozen from: the recipe cache hands out that same dict on later hits,
+        # so _reusable recognizes it without fingerprinting it again
+        self._source = None
+        if isinstance(recipe, StagedRecipe):
+            if recipe.ready and not recipe.failed:
+                recipe = recipe.result()
+            else:
+                self._staged = recipe
+                recipe = recipe.head
+        if self._staged is None:
+            self.fingerprint = fingerprint(recipe)
+            self._source = recipe
+        self._data = freeze(recipe)
+        self.question_handler = QuestionHandler(self)
+
+    @property
+    def ready(self):
+        """
+        False while the steps of a staged recipe are still being parsed.
+        """
+        return self._staged is None or self._staged.ready
+
+    @property
+    def failed(self):
+        """
+        True if the staged parse of the steps failed or timed out: the steps will never be available.
+        """
+        staged = self._staged
+        return staged is not None and staged.failed
+
+    def _complete(self):
+        # wait for the staged parse (raises RecipeParseError) and freeze the full recipe, once
+        with self._lock:
+            if self._staged is not None:
+                recipe = self._staged.result()
+                self.fingerprint = fingerprint(recipe)
+                self._source = recipe
+                self._data = freeze(recipe)
+                self._staged = None
+
+    def __getitem__(self, key):
+        try:
+            return self._data[key]
+        except KeyError:
+            pass
+        self._complete()
+        return self._data[key]
+
+    def __iter__(self):
+        self._complete()
+        return iter(self._data)
+
+    def __len__(self):
+        self._complete()
+        return len(self._data)
+
+def fingerprint(recipe):
+    """
+    Hash of a full recipe JSON, to tell whether two parses of the same recipe ID are the same recipe.
+    """
+    return hash(json.dumps(recipe, sort_keys=True, separators=(',', ':'), ensure_ascii=False))
+
+def _reusable(shared, recipe):
+    # can a conversation starting from recipe use the interned shared recipe instead?
+    if shared.failed:
+        return False
+    if isinstance(recipe, StagedRecipe):
+        if recipe.failed:
+            return False
+        if not recipe.ready:
+            # a parse of the same ID still in flight: only its head is known, so the interned one (complete or not)
+            # is the same recipe if it has the same head; otherwise it is an older version
+            return all(shared._data.get(key) == freeze(value) for key, value in recipe.head.items())
+    full = recipe.result() if isinstance(recipe, StagedRecipe) else recipe
+    if full is shared._source:
+        return True
+    staged = shared._staged
+    if staged is not None:
+        # the interned one is still being parsed: it is the same recipe if its head is
+        return {key: full.get(key) for key in staged.head} == dict(staged.head)
+    return shared.fingerprint == fingerprint(full)
+
+def intern_recipe(recipe, recipe_id=None):
+    """
+    Return the SharedRecipe for recipe_id, creating it from the recipe JSON if no conversation holds a usable one
+    (see _reusable). Recipes without an ID are wrapped but not interned.
+    """
+    if isinstance(recipe, SharedRecipe):
+        return recipe
+    if recipe_id is None:
+        return SharedRecipe(recipe)
+    shared = _registry.get(recipe_id)
+    if shared is None or not _reusable(shared, recipe):
+        shared = SharedRecipe(recipe, recipe_id)
+        _registry[shared.recipe_id] = shared
+    return shared
+
+def shared_recipe_count():
+    return len(_registry)
@@ -0,0 +1,88 @@
+import time
+import logging
+from collections.abc import Mapping
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+"""
+Staged recipe module lets the bot start a conversation before a recipe has been fully parsed.
+
+Parsing a recipe has a cheap stage (title and ingredients: a few regexes per ingredient line) and an expensive
+one (step analysis: spaCy segmentation and fuzzy ingredient matching for every sentence). A StagedRecipe holds
+the result of the cheap stage, the "head", and a Future for the full recipe JSON being parsed in the background.
+
+It reads like the recipe JSON produced by recipe_to_json: title, raw_ingredients and ingredients are answered
+at once, and only the other keys (steps, tools, methods) wait for the background parse to finish.
+"""
+
+log = logging.getLogger(__name__)
+
+HEAD_KEYS = ("title", "raw_ingredients", "ingredients")
+RECIPE_KEYS = ("title", "raw_ingredients", "ingredients", "tools", "methods", "steps")
+
+class RecipeParseError(Exception):
+    """
+    Raised when the background parse of a staged recipe failed or timed out; the message is safe to show to the user.
+    """
+    pass
+
+class StagedRecipe(Mapping):
+    def __init__(self, head, future, started=None, timeout=None):
+        """
+        head: dict with the HEAD_KEYS of the recipe JSON
+        future: concurrent.futures.Future resolving to the full recipe JSON
+        started: time.perf_counter() value when ingestion started, for timing
+        timeout: seconds (from started) after which waiting for the full recipe gives up
+        """
+        self.head = head
+        self.future = future
+        self.started = time.perf_counter() if started is None else started
+        self.timeout = timeout
+        self.first_response_seconds = time.perf_counter() - self.started # time until the head was available
+        self.full_parse_seconds = None # time until the full recipe was available, once it is
+        future.add_done_callback(self._record_full_parse)
+
+    def _record_full_parse(self, future):
+        self.full_parse_seconds = time.perf_counter() - self.started
+
+    @property
+    def ready(self):
+        return self.future.done()
+
+    @property
+    def failed(self):
+        """
+        True once result() can only raise: the background parse failed, found nothing or ran out of time.
+        """
+        if self.future.done():
+            return self.future.cancelled() or self.future.exception() is not None or self.future.result() is None
+        return self.timeout is not None and time.perf_counter() - self.started > self.timeout
+
+    def result(self):
+        """
+        Return the full recipe JSON, waiting for the background parse if needed.
+        Raises RecipeParseError if it failed or does not finish in time.
+        """
+        remaining = None
+        if self.timeout is not None:
+            remaining = max(self.started + self.timeout - time.perf_counter(), 0)
+        try:
+            recipe = self.future.result(remaining)
+        except FutureTimeoutError:
+            raise RecipeParseError("That recipe is taking too long to process. Please try again later.")
+        except Exception as e:
+            log.warning("Background parse failed: %s", e)
+            raise RecipeParseError("I'm sorry, I couldn't make sense of that recipe's steps.")
+        if recipe is None:
+            raise RecipeParseError("I'm sorry, I couldn't make sense of that recipe's steps.")
+        return recipe
+
+    def __getitem__(self, key):
+        if key in self.head:
+            return self.head[key]
+        return self.result()[key]
+
+    def __iter__(self):
+        return iter(RECIPE_KEYS)
+
+    def __len__(self):
+        return len(RECIPE_KEYS)
@@ -0,0 +1,27 @@
+#!/bin/bash
+# The one launcher (see Procfile): the parse service, then BOT_PROCESSES bot processes sharing it.
+# Exits as soon as any of them does, taking the others down, so the process manager restarts the whole group.
+cd "$(dirname "$0")"
+export PARSE_SERVICE_SOCKET=${PARSE_SERVICE_SOCKET:-/tmp/recipebot-parse.sock}
+trap 'kill $(jobs -p) 2>/dev/null' EXIT
+
+# Start the parse service (owns the spaCy model and the recipe cache) and wait for its socket;
+# it refuses to start if another parse service is already listening there
+python parse_service.py &
+SERVICE=$!
+for _ in $(seq 1 120); do
+    [ -S "$PARSE_SERVICE_SOCKET" ] && break
+    kill -0 $SERVICE 2>/dev/null || exit 1
+    sleep 1
+done
+
+# Start the bot: BOT_PROCESSES > 1 splits the gateway shards between that many processes
+BOT_PROCESSES=${BOT_PROCESSES:-1}
+if [ "$BOT_PROCESSES" -gt 1 ]; then
+    for i in $(seq 0 $((BOT_PROCESSES - 1))); do
+        SHARD_COUNT=$BOT_PROCESSES SHARD_IDS=$i METRICS_PORT=$((9102 + i)) python app.py &
+    done
+else
+    python app.py &
+fi
+wait -n
@@ -0,0 +1,68 @@
+import asyncio
+
+from admission import TokenBucket, RateLimiter, ParseGate, AdmissionError
+
+def test_token_bucket_allows_a_burst_then_refills():
+    bucket = TokenBucket(capacity=2, rate=1, now=0)
+    assert bucket.take(0) and bucket.take(0)
+    assert not bucket.take(0) and bucket.refused
+    assert not bucket.take(0.5)
+    assert bucket.take(1.5) and not bucket.refused
+    assert not bucket.full(1.5)
+    assert bucket.full(10)
+
+def test_rate_limiter_answers_only_the_first_refusal():
+    now = [0]
+    limiter = RateLimiter({"user_message": (1, 1)}, clock=lambda: now[0])
+    limiter.check("user_message", "alice", "slow down")
+    limiter.check("user_message", "bob", "slow down") # buckets are per key
+    silences = []
+    for _ in range(2):
+        try:
+            limiter.check("user_message", "alice", "slow down")
+            assert False, "the bucket is empty"
+        except AdmissionError as e:
+            assert str(e) == "slow down"
+            silences.append(e.silent)
+    assert silences == [False, True]
+    now[0] = 5
+    limiter.check("user_message", "alice", "slow down")
+    now[0] = 10
+    assert limiter.prune() == 2 and len(limiter) == 0
+
+def test_parse_gate_queues_in_order_then_refuses():
+    async def run():
+        gate = ParseGate(limit=1, queue_size=1)
+        await gate.acquire()
+        order = []
+        async def parse(name):
+            await gate.acquire()
+            order.append(name)
+        waiting = asyncio.create_task(parse("queued"))
+        await asyncio.sleep(0)
+        assert gate.stats() == {"active": 1, "waiting": 1}
+        try:
+            gate.check()
+            assert False, "the queue is full"
+        except AdmissionError:
+            pass
+        gate.release() # the slot goes to the waiter, not back to the pool
+        await waiting
+        assert order == ["queued"] and gate.stats() == {"active": 1, "waiting": 0}
+        gate.release()
+        assert gate.stats() == {"active": 0, "waiting": 0}
+    asyncio.run(run())
+
+def test_parse_gate_cancelled_waiter_gives_up_its_place():
+    async def run():
+        gate = ParseGate(limit=1, queue_size=2)
+        await gate.acquire()
+        first = asyncio.create_task(gate.acquire())
+        second = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        gate.release()
+        await second
+        assert first.cancelled() and gate.stats() == {"active": 1, "waiting": 0}
+    asyncio.run(run())
@@ -0,0 +1,16 @@
+from recipe_index import RecipeIndex
+
+RECIPE = {"ingredients": [{"name": name} for name in ("salt", "unsalted butter", "egg", "Ricotta cheese")],
+          "tools": ["baking sheet", "whisk"], "methods": ["bake", "whisk"]}
+
+def test_names_match_on_whole_words_not_substrings():
+    index = RecipeIndex(RECIPE)
+    assert index.lookup("ingredient", "how much unsalted butter?") == ["unsalted butter"]
+    assert index.lookup("ingredient", "how much butter?") == []
+    assert index.lookup("ingredient", "and the salt?") == ["salt"]
+
+def test_plurals_case_and_punctuation_are_normalized():
+    index = RecipeIndex(RECIPE)
+    assert index.lookup("ingredient", "How many EGGS, and how much ricotta cheese?") == ["egg", "ricotta cheese"]
+    assert index.lookup("tool", "do I need baking sheets?") == ["baking sheet"]
+    assert index.lookup("method", "how do I whisk it") == ["whisk"]
@@ -0,0 +1,46 @@
+import os
+import json
+import tempfile
+
+from recipe_pack import PackWriter, RecipePack, PackFormatError, build
+
+RECIPE = {"title": "Toast", "raw_ingredients": ["1 slice bread", "butter"],
+          "ingredients": [{"name": "bread", "quantity": "1", "measurement": "slice", "descriptor": None, "preparation": None},
+                          {"name": "butter", "quantity": None, "measurement": None, "descriptor": "salted", "preparation": "softened"}],
+          "tools": ["toaster"], "methods": ["toast", "spread"],
+          "steps": [{"step_number": 1, "text": "Toast the bread.", "ingredients": ["bread"], "tools": ["toaster"],
+                     "methods": ["toast"], "time": {"duration": "2 minutes", "condition": "until golden"}},
+                    {"step_number": 2, "text": "Spread with butter. Enjoy ☕", "ingredients": ["butter"], "tools": [],
+                     "methods": ["spread"], "time": {"duration": None, "condition": None}}]}
+
+def test_pack_round_trip():
+    path = os.path.join(tempfile.mkdtemp(), "recipes.pack")
+    writer = PackWriter()
+    writer.add("3001", RECIPE)
+    writer.add(3002, dict(RECIPE, title="Jam Toast", steps=[]))
+    writer.write(path)
+    with RecipePack(path) as pack:
+        assert len(pack) == 2 and sorted(pack) == ["3001", "3002"]
+        assert pack["3001"] == RECIPE
+        assert pack["3002"]["title"] == "Jam Toast" and pack["3002"]["steps"] == []
+        assert pack.get("9999") is None and "9999" not in pack
+
+def test_recipe_not_in_the_format_is_refused_and_not_added():
+    writer = PackWriter()
+    try:
+        writer.add("3003", dict(RECIPE, tools="toaster"))
+        assert False, "tools must be a list"
+    except PackFormatError:
+        pass
+    assert writer.recipes == {} and len(writer.pool) == 0
+
+def test_build_keeps_the_last_copy_and_skips_bad_ones():
+    workdir = tempfile.mkdtemp()
+    inputs = os.path.join(workdir, "recipes.jsonl")
+    with open(inputs, "w", encoding="utf-8") as f:
+        for recipe in (dict(RECIPE, title="Old Toast"), RECIPE, dict(RECIPE, steps="none")):
+            f.write(json.dumps({"source": "x", "recipe_id": "3004", "recipe": recipe}) + "\n")
+    output = os.path.join(workdir, "recipes.pack")
+    assert build(output, [inputs]) == 0
+    with RecipePack(output) as pack:
+        assert pack["3004"] == RECIPE
@@ -0,0 +1,26 @@
+from responses import split_message
+
+def test_short_message_is_one_chunk():
+    assert split_message("hello", limit=10) == ("hello",)
+
+def test_split_between_lines_first():
+    text = "step one\nstep two\nstep three\n"
+    chunks = split_message(text, limit=18)
+    assert chunks == ("step one\nstep two\n", "step three\n")
+    assert "".join(chunks) == text
+
+def test_long_line_is_split_between_words():
+    text = "stir the sauce until it thickens"
+    chunks = split_message(text, limit=12)
+    assert all(len(chunk) <= 12 for chunk in chunks)
+    assert "".join(chunks) == text
+    assert all(chunk.endswith(" ") for chunk in chunks[:-1])
+
+def test_word_longer_than_the_limit_is_cut():
+    chunks = split_message("a" * 25, limit=10)
+    assert chunks == ("a" * 10, "a" * 10, "a" * 5)
+
+def test_whitespace_only_chunks_are_dropped():
+    chunks = split_message("x" * 10 + "\n" + " " * 10 + "\n" + "y" * 5, limit=11)
+    assert all(chunk.strip() for chunk in chunks)
+    assert "".join(chunks).split() == ["x" * 10, "y" * 5]
@@ -0,0 +1,44 @@
+import numpy as np
+
+from search_index import intersect, SearchIndex
+
+def postings(*values):
+    return np.array(values, dtype=np.uint32)
+
+def test_intersect_sorted_postings():
+    result = intersect([postings(1, 3, 5, 7, 9), postings(3, 4, 5, 9, 10, 11), postings(0, 5, 9, 12)])
+    assert result.tolist() == [5, 9]
+
+def test_intersect_edge_cases():
+    assert intersect([]).tolist() == []
+    assert intersect([postings(1, 2, 3)]).tolist() == [1, 2, 3]
+    assert intersect([postings(1, 2), postings()]).tolist() == []
+    # probes past the end of the longer list
+    assert intersect([postings(50, 60), postings(1, 2, 3, 60)]).tolist() == [60]
+
+def recipe(title, ingredients, duration):
+    return {"title": title, "ingredients": [{"name": name} for name in ingredients], "tools": ["skillet"],
+            "methods": ["fry"], "steps": [{"time": {"duration": duration}}]}
+
+def test_search_after_re_adding_and_compacting():
+    index = SearchIndex()
+    index.add("1", recipe("Chicken Fry", ["chicken", "salt"], "20 minutes"))
+    index.add("2", recipe("Beef Fry", ["beef", "salt"], "10 minutes"))
+    index.add("1", recipe("Chicken Stew", ["chicken", "carrot"], "2 hours")) # replaces the first version
+    assert index.search("chicken")[1] == [("1", "Chicken Stew", 120.0)]
+    assert index.search("salt in under 30 minutes")[1] == [("2", "Beef Fry", 10.0)]
+    index.compact()
+    assert len(index) == 2 and not index.deleted
+    assert index.search("tool: skillet")[0] == 2
+
+def test_a_staged_recipe_is_indexed_once_however_many_conversations_open_it():
+    from concurrent.futures import Future
+    from staged_recipe import StagedRecipe
+    index = SearchIndex()
+    future = Future()
+    staged = StagedRecipe({"title": "Chicken Fry", "raw_ingredients": [], "ingredients": []}, future)
+    for _ in range(3):
+        index.add_ingested("1", staged)
+    future.set_result(recipe("Chicken Fry", ["chicken"], "20 minutes"))
+    index.add_ingested("1", staged) # already indexed from this parse
+    assert len(index.recipe_ids) == 1 and not index.deleted and not index.pending
@@ -0,0 +1,100 @@
+import os
+import json
+import asyncio
+import tempfile
+
+from conversation import Conversation
+from session_store import SessionStore
+
+RECIPE = {"title": "Toast", "raw_ingredients": ["1 slice bread"],
+          "ingredients": [{"name": "bread", "quantity": "1", "measurement": "slice", "descriptor": None, "preparation": None}],
+          "tools": ["toaster"], "methods": ["toast"],
+          "steps": [{"step_number": number, "text": f"Step {number}.", "ingredients": [], "tools": [], "methods": [],
+                     "time": {"duration": None, "condition": None}} for number in (1, 2, 3)]}
+
+def make_store(state_dir, loaded, **kwargs):
+    def loader(recipe_id):
+        loaded.append(recipe_id)
+        return RECIPE if recipe_id == "2001" else None
+    return SessionStore(recipe_loader=loader, state_dir=state_dir, **kwargs)
+
+def test_evicted_session_is_resumed_from_disk():
+    state_dir = tempfile.mkdtemp()
+    loaded = []
+    store = make_store(state_dir, loaded, max_sessions=1)
+    conversation = Conversation(RECIPE, "2001")
+    conversation.current_step = 2
+    store.put("alice", conversation)
+    store.put("bob", Conversation(RECIPE, "2001")) # evicts alice, the least recently used
+    store.flush()
+    assert len(store) == 1 and os.listdir(state_dir) == ["alice.json"]
+    resumed = asyncio.run(store.get("alice"))
+    assert resumed.current_step == 2 and loaded == ["2001"]
+    assert store.counters["resumed"] == 1 and os.listdir(state_dir) == ["bob.json"]
+
+def test_saved_sessions_are_found_after_a_restart_and_strangers_cost_no_lookup():
+    state_dir = tempfile.mkdtemp()
+    with open(os.path.join(state_dir, "alice.json"), "w", encoding="utf-8") as f:
+        json.dump({"recipe_id": "2001", "current_step": 1, "question_history": []}, f)
+    loaded = []
+    store = make_store(state_dir, loaded)
+    assert asyncio.run(store.get("mallory")) is None and loaded == []
+    assert asyncio.run(store.get("alice")).current_step == 1
+
+def test_concurrent_messages_share_one_resume():
+    state_dir = tempfile.mkdtemp()
+    loaded = []
+    store = make_store(state_dir, loaded, max_sessions=1)
+    store.put("alice", Conversation(RECIPE, "2001"))
+    store.put("bob", Conversation(RECIPE, "2001"))
+    async def both():
+        return await asyncio.gather(store.get("alice"), store.get("alice"))
+    first, second = asyncio.run(both())
+    assert first is second and first is not None and loaded == ["2001"]
+
+def test_dead_or_corrupt_state_is_discarded():
+    state_dir = tempfile.mkdtemp()
+    with open(os.path.join(state_dir, "alice.json"), "w", encoding="utf-8") as f:
+        f.write("{not json")
+    with open(os.path.join(state_dir, "bob.json"), "w", encoding="utf-8") as f:
+        json.dump({"recipe_id": "gone", "current_step": 0, "question_history": []}, f)
+    store = make_store(state_dir, [])
+    assert asyncio.run(store.get("alice")) is None
+    assert asyncio.run(store.get("bob")) is None
+    assert os.listdir(state_dir) == [] and store.counters["discarded"] == 2
+
+def test_idle_sessions_are_evicted_and_stop_removes_saved_state():
+    state_dir = tempfile.mkdtemp()
+    store = make_store(state_dir, [], idle_ttl=0)
+    store.put("alice", Conversation(RECIPE, "2001"))
+    store.sessions["alice"] = (store.sessions["alice"][0], 0) # last active long ago
+    assert store.evict_idle() == 1 and len(store) == 0
+    store.flush()
+    assert os.listdir(state_dir) == ["alice.json"]
+    store.remove("alice")
+    store.flush()
+    assert os.listdir(state_dir) == [] and asyncio.run(store.get("alice")) is None
+
+def test_resume_waits_for_a_pending_write_and_a_failed_write_only_loses_the_session():
+    state_dir = tempfile.mkdtemp()
+    os.mkdir(os.path.join(state_dir, "bob.json")) # bob's state file cannot be written
+    store = make_store(state_dir, [], max_sessions=1)
+    store.put("alice", Conversation(RECIPE, "2001"))
+    store.put("bob", Conversation(RECIPE, "2001")) # evicts alice
+    assert asyncio.run(store.get("alice")) is not None # evicts bob, whose write fails
+    assert store.counters["evicted"] == 2 and len(store) == 1
+    assert asyncio.run(store.get("bob")) is None
+    assert "approx_kb" not in store.stats() and store.stats(memory=True)["approx_kb"] > 0
+
+def test_idle_session_still_in_memory_is_resumed_without_a_disk_round_trip():
+    state_dir = tempfile.mkdtemp()
+    loaded = []
+    store = make_store(state_dir, loaded, idle_ttl=60, history_limit=2)
+    conversation = Conversation(RECIPE, "2001")
+    conversation.question_history = ["a", "b", "c"]
+    store.put("alice", conversation)
+    store.sessions["alice"] = (conversation, 0) # idle, but evict_idle has not run yet
+    assert asyncio.run(store.get("alice")) is conversation
+    store.flush()
+    assert loaded == [] and os.listdir(state_dir) == [] and store.counters["evicted"] == 0
+    assert conversation.question_history == ["b", "c"] and store.counters["resumed"] == 1
@@ -0,0 +1,89 @@
+from concurrent.futures import Future
+
+from shared_recipe import intern_recipe
+from staged_recipe import StagedRecipe, RecipeParseError
+
+HEAD = {"title": "Toast", "raw_ingredients": ["1 slice bread"],
+        "ingredients": [{"name": "bread", "quantity": "1", "measurement": "slice", "descriptor": None, "preparation": None}]}
+RECIPE = dict(HEAD, tools=["toaster"], methods=["toast"], steps=[
+    {"step_number": 1, "text": "Toast the bread.", "ingredients": ["bread"], "tools": ["toaster"], "methods": ["toast"],
+     "time": {"duration": None, "condition": None}}])
+
+def failed_staged():
+    future = Future()
+    future.set_exception(RuntimeError("parse crashed"))
+    return StagedRecipe(dict(HEAD), future)
+
+def test_failed_staged_parse_is_not_reused():
+    first = intern_recipe(failed_staged(), "1001")
+    try:
+        first["steps"]
+        assert False, "the failed parse should raise"
+    except RecipeParseError:
+        pass
+    # a second conversation on the same ID, after a successful re-ingestion
+    second = intern_recipe(dict(RECIPE), "1001")
+    assert second is not first
+    assert second["steps"][0]["text"] == "Toast the bread."
+    # and later conversations share the working one
+    assert intern_recipe(dict(RECIPE), "1001") is second
+
+def test_failed_staged_parse_then_staged_retry():
+    first = intern_recipe(failed_staged(), "1002")
+    future = Future()
+    second = intern_recipe(StagedRecipe(dict(HEAD), future), "1002")
+    assert second is not first
+    future.set_result(dict(RECIPE))
+    assert second["tools"] == ("toaster",)
+
+def test_changed_recipe_replaces_interned_one():
+    first = intern_recipe(dict(RECIPE), "1003")
+    assert intern_recipe(dict(RECIPE), "1003") is first
+    changed = dict(RECIPE, title="Better Toast")
+    second = intern_recipe(changed, "1003")
+    assert second is not first
+    assert first["title"] == "Toast" and second["title"] == "Better Toast"
+
+def test_pending_staged_recipe_is_shared():
+    future = Future()
+    first = intern_recipe(StagedRecipe(dict(HEAD), future), "1004")
+    assert intern_recipe(dict(RECIPE), "1004") is first
+    future.set_result(dict(RECIPE))
+    assert first["steps"][0]["step_number"] == 1
+
+def test_pending_staged_recipe_with_a_new_head_replaces_complete_one():
+    # the page changed and is being re-parsed: new conversations must not get the outdated recipe
+    first = intern_recipe(dict(RECIPE), "1005")
+    future = Future()
+    second = intern_recipe(StagedRecipe(dict(HEAD, title="Better Toast"), future), "1005")
+    assert second is not first
+    assert second["title"] == "Better Toast" and first["title"] == "Toast"
+    future.set_result(dict(RECIPE, title="Better Toast"))
+    assert second["steps"][0]["text"] == "Toast the bread."
+
+def test_pending_staged_recipe_with_the_same_head_reuses_complete_one():
+    first = intern_recipe(dict(RECIPE), "1006")
+    assert intern_recipe(StagedRecipe(dict(HEAD), Future()), "1006") is first
+
+def test_failed_staged_recipe_does_not_raise_when_interned():
+    first = intern_recipe(dict(RECIPE), "1007")
+    second = intern_recipe(failed_staged(), "1007")
+    assert second is not first
+    assert second["title"] == "Toast"
+    try:
+        second["steps"]
+        assert False, "the failed parse should raise"
+    except RecipeParseError:
+        pass
+    # the next successful ingestion replaces the failed one again
+    assert intern_recipe(dict(RECIPE), "1007") is not second
+
+def test_the_same_cached_dict_is_reused_without_fingerprinting_it_again(monkeypatch):
+    import shared_recipe
+    calls = []
+    original = shared_recipe.fingerprint
+    monkeypatch.setattr(shared_recipe, "fingerprint", lambda recipe: calls.append(1) or original(recipe))
+    cached = dict(RECIPE)
+    first = intern_recipe(cached, "1008")
+    assert intern_recipe(cached, "1008") is first and len(calls) == 1
+    assert intern_recipe(dict(RECIPE), "1008") is first and len(calls) == 2 # an equal copy still needs the fingerprint